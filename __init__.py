@@ -14,10 +14,18 @@ __all__ = [
     'root_logger', 'get_logger',
 
     # exports from .nedh
-    'EdhClient', 'Packet', 'textPacket', 'sendPacket', 'receivePacketStream',
-    'Peer', 'EdhServer', 'CONIN', 'CONOUT', 'CONMSG', 'sendConOut',
-    'sendConMsg', 'ERR_CHAN', 'DATA_CHAN', 'netPeer', 'dataSink', 'sendCmd',
-    'sendData',
+    'binPacket', 'packData', 'unpackData', 'registerSymbol', 'BlobStream',
+    'EdhClient', 'CreditSink', 'CreditWindow', 'ExecPolicy', 'ThreadExec',
+    'ProcessExec', 'Heartbeat', 'PeerMetrics', 'aggregateMetrics',
+    'counterMetrics', 'prometheusText', 'writePrometheusFile', 'Packet',
+    'textPacket', 'batchPacket', 'unbatchPacket', 'sendPacket', 'sendPackets',
+    'pumpPackets', 'receivePacketStream', 'receivePacketBatches',
+    'PacketProtocol', 'EdhMultiServer', 'WorkerClient', 'arrayPacket',
+    'unpackArray', 'Peer', 'SubPeer', 'PeerModule', 'peerModule',
+    'PacketQueue', 'EdhClientPool', 'ReplayBuffer', 'EdhServer',
+    'ShmRingWriter', 'ShmRingReader', 'CONIN', 'CONOUT', 'CONMSG',
+    'sendConOut', 'sendConMsg', 'ERR_CHAN', 'DATA_CHAN', 'netPeer', 'dataSink',
+    'sendCmd', 'sendData',
 
     # exports from .sedh
     'HeadHunter', 'workDefinition', 'doOneJob', 'shouldRetryJob',
@@ -0,0 +1,96 @@
+"""
+Benchmark connection accept rate of a server
+
+First measures running the peer module per connection, with
+`runpy.run_module()` versus a `PeerModule` loaded once, then measures
+connections accepted per second by an `EdhServer`, each with a call made
+before disconnecting.
+
+Run with the parent directory of `hastalk` in PYTHONPATH:
+
+    python -m hastalk.bench.accept
+
+"""
+import asyncio
+import runpy
+import time
+from typing import *
+
+from hastalk import *
+
+
+PEER_MODU = "hastalk.bench.lander"
+MODU_RUNS = 2000
+CONNECTIONS = 2000
+# connections being made at the same time
+CONCURRENCY = [1, 16]
+
+
+def peer_namespace(eol: asyncio.Future) -> dict:
+    incoming = PacketQueue()
+    peer = Peer(
+        ident="<bench>",
+        eol=eol,
+        posting=incoming.put,
+        hosting=incoming.get,
+        incoming=incoming,
+    )
+    return {"peer": peer}
+
+
+async def measure_modu_runs(run: Callable[[dict], object]) -> float:
+    eol = asyncio.get_running_loop().create_future()
+    namespaces = [peer_namespace(eol) for _ in range(MODU_RUNS)]
+    t0 = time.perf_counter()
+    for modu in namespaces:
+        run(modu)
+    secs = time.perf_counter() - t0
+    eol.set_result(None)  # end the landing loops started
+    await asyncio.sleep(0.1)
+    return secs / MODU_RUNS
+
+
+async def measure_accept(concurrency: int) -> float:
+    server = await EdhServer(PEER_MODU, "127.0.0.1", 0)
+    port = server.server_sockets.result()[0].getsockname()[1]
+
+    async def connector(n: int):
+        loop = asyncio.get_running_loop()
+        for _ in range(n):
+            client_peer = loop.create_future()
+            client = await EdhClient(
+                PEER_MODU,
+                "127.0.0.1",
+                port,
+                init=lambda modu: client_peer.set_result(modu["peer"]),
+            )
+            assert await (await client_peer).call("1 + 1") == 2
+            client.stop()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(
+        *(connector(CONNECTIONS // concurrency) for _ in range(concurrency))
+    )
+    conns_per_sec = CONNECTIONS / (time.perf_counter() - t0)
+
+    server.stop()
+    await server.join()
+    return conns_per_sec
+
+
+async def main():
+    runpy_secs = await measure_modu_runs(lambda modu: runpy.run_module(PEER_MODU, modu))
+    peer_modu = peerModule(PEER_MODU)
+    cached_secs = await measure_modu_runs(peer_modu.run)
+    print(f"{'module run':>16} {'us':>10}")
+    print(f"{'runpy':>16} {runpy_secs * 1e6:>10.1f}")
+    print(f"{'PeerModule':>16} {cached_secs * 1e6:>10.1f}")
+
+    print(f"{'connecting':>16} {'conns/s':>10}")
+    for concurrency in CONCURRENCY:
+        conns_per_sec = await measure_accept(concurrency)
+        print(f"{concurrency:>16} {conns_per_sec:>10.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
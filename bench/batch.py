@@ -0,0 +1,60 @@
+"""
+Benchmark posting records in batch against one by one
+
+Measures records per second posted to a channel over loopback TCP, with one
+`Peer.p2c()` call per record, versus a single `Peer.p2c_batch()` call.
+
+Run with the parent directory of `hastalk` in PYTHONPATH:
+
+    python -m hastalk.bench.batch
+
+"""
+import asyncio
+import time
+from typing import *
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+RECORD_COUNT = 100000
+
+
+async def measure(batched: bool) -> float:
+    server, client, local, remote = await connected_peers()
+    records = ["(3, 'abc', 2.5)"] * RECORD_COUNT
+    data_sink = remote.ensure_channel(DATA_CHAN)
+
+    async def consume():
+        received = 0
+        async for rec in data_sink.stream():
+            if rec is not None:
+                received += 1
+                if received >= RECORD_COUNT:
+                    return
+
+    t0 = time.perf_counter()
+    consumer = asyncio.create_task(consume())
+    if batched:
+        await local.p2c_batch(DATA_CHAN, records)
+    else:
+        for rec in records:
+            await local.p2c(DATA_CHAN, rec)
+    await consumer
+    recs_per_sec = RECORD_COUNT / (time.perf_counter() - t0)
+
+    client.stop()
+    server.stop()
+    await server.join()
+    return recs_per_sec
+
+
+async def main():
+    print(f"{'posting':>10} {'records/s':>10}")
+    for name, batched in (("one by one", False), ("batch", True)):
+        recs_per_sec = await measure(batched)
+        print(f"{name:>10} {recs_per_sec:>10.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
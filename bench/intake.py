@@ -0,0 +1,82 @@
+"""
+Benchmark packet intake throughput over loopback TCP
+
+Compares `receivePacketStream()` reading a `asyncio.StreamReader`, with the
+zero-copy intake of `PacketProtocol`.
+
+Run with the parent directory of `hastalk` in PYTHONPATH:
+
+    python -m hastalk.bench.intake
+
+"""
+import asyncio
+import time
+
+from hastalk import *
+
+
+# ( payload size, packet count )
+CASES = [
+    (64, 50000),
+    (64 * 1024, 4000),
+    (16 * 1024 * 1024, 16),
+    (256 * 1024 * 1024, 2),
+]
+
+
+async def serve_packets(writer: asyncio.StreamWriter, payload_size: int, count: int):
+    payload = b"x" * payload_size
+    hdr = f"[{payload_size!r}#blob:]".encode("utf-8")
+    for _ in range(count):
+        writer.write(hdr)
+        writer.write(payload)
+        await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+
+
+async def measure(payload_size: int, count: int, zero_copy: bool) -> float:
+    loop = asyncio.get_running_loop()
+
+    async def on_conn(_reader, writer):
+        await serve_packets(writer, payload_size, count)
+
+    server = await asyncio.start_server(on_conn, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    if zero_copy:
+        _transport, intake = await loop.create_connection(
+            PacketProtocol, "127.0.0.1", port
+        )
+    else:
+        intake, _outlet = await asyncio.open_connection("127.0.0.1", port)
+
+    received = 0
+
+    async def pkt_sink(pkt: Packet):
+        nonlocal received
+        received += len(pkt.payload)
+
+    eos = loop.create_future()
+    t0 = time.perf_counter()
+    await receivePacketStream("bench", intake, pkt_sink, eos)
+    await eos
+    elapsed = time.perf_counter() - t0
+
+    server.close()
+    await server.wait_closed()
+
+    assert received == payload_size * count, "packets lost"
+    return received / elapsed / 1e6
+
+
+async def main():
+    print(f"{'payload':>12} {'packets':>8} {'stream MB/s':>12} {'zero-copy MB/s':>15}")
+    for payload_size, count in CASES:
+        before = await measure(payload_size, count, zero_copy=False)
+        after = await measure(payload_size, count, zero_copy=True)
+        print(f"{payload_size:>12} {count:>8} {before:>12.1f} {after:>15.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
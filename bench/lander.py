@@ -0,0 +1,22 @@
+"""
+Minimal peer module for benchmarks, landing commands from the peer
+
+"""
+import asyncio
+
+from hastalk import *
+
+
+# a Peer object should have been implanted automatically
+peer.ensure_channel(DATA_CHAN)
+
+
+async def _run_():
+    while True:
+        cmd_vals = await peer.read_commands()
+        if cmd_vals and cmd_vals[-1] is EndOfStream:
+            break
+
+
+# schedule the command landing loop to run in a dedicated task (thread)
+asyncio.create_task(_run_())
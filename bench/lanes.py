@@ -0,0 +1,86 @@
+"""
+Benchmark latency of control traffic under bulk load
+
+Measures round-trip latency of small calls over loopback TCP, while large
+blobs are being sent to the same peer, either in the control lane along with
+the calls, or in the bulk lane.
+
+Run with the parent directory of `hastalk` in PYTHONPATH:
+
+    python -m hastalk.bench.lanes
+
+"""
+import asyncio
+import os
+import time
+from typing import *
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+BLOB_SIZE, BLOB_COUNT = 64 * 1024 * 1024, 8
+CALL_INTERVAL = 0.001
+
+
+async def measure(bulk: Optional[bool]) -> List[float]:
+    """
+    Latencies of calls in ms, under no load if `bulk` is None
+    """
+    server, client, local, remote = await connected_peers()
+
+    blob = os.urandom(BLOB_SIZE)
+    blob_sink = remote.ensure_channel("blob")
+
+    async def consume():
+        received = 0
+        async for data in blob_sink.stream():
+            if data is not None:
+                received += len(data)
+                if received >= BLOB_SIZE * BLOB_COUNT:
+                    return
+
+    async def produce():
+        for _ in range(BLOB_COUNT):
+            await local.post_packet(Packet("blob:'blob'", blob), bulk=bulk)
+
+    latencies = []
+
+    async def ping(loaded: asyncio.Future):
+        while not loaded.done():
+            t0 = time.perf_counter()
+            await local.call("None")
+            latencies.append((time.perf_counter() - t0) * 1e3)
+            await asyncio.sleep(CALL_INTERVAL)
+
+    if bulk is None:
+        loaded = asyncio.create_task(asyncio.sleep(1.0))
+    else:
+        consumer = asyncio.create_task(consume())
+        asyncio.create_task(produce())
+        loaded = consumer
+    await ping(loaded)
+
+    client.stop()
+    server.stop()
+    await server.join()
+    return latencies
+
+
+def percentile(values: List[float], pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def main():
+    print(f"{'blobs in':>10} {'calls':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, bulk in (("no blobs", None), ("control", False), ("bulk", True)):
+        latencies = await measure(bulk)
+        print(
+            f"{name:>10} {len(latencies):>6} {percentile(latencies, 50):>8.2f}"
+            f" {percentile(latencies, 99):>8.2f} {max(latencies):>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""
+Benchmark a multi-process server against a single-process one
+
+Client processes keep many calls in flight against the server, the calls are
+CPU bound at the server, so a single process server is capped at one core,
+while a multi-process one scales with cores, as long as there are cores left
+for the clients too.
+
+Run with the parent directory of `hastalk` in PYTHONPATH:
+
+    python -m hastalk.bench.multiserver
+
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from typing import *
+
+from hastalk import *
+
+
+CLIENT_PROCS = 4
+CALLS_PER_CLIENT = 2000
+# calls kept in flight per client
+CONCURRENCY = 64
+CALL_SRC = "sum(i * i for i in range(2000))"
+
+
+async def client_calls(port: int) -> int:
+    loop = asyncio.get_running_loop()
+    client_peer = loop.create_future()
+    client = await EdhClient(
+        "hastalk.bench.lander",
+        "127.0.0.1",
+        port,
+        init=lambda modu: client_peer.set_result(modu["peer"]),
+    )
+    peer = await client_peer
+
+    async def caller(n: int):
+        for _ in range(n):
+            await peer.call(CALL_SRC)
+
+    await asyncio.gather(
+        *(caller(CALLS_PER_CLIENT // CONCURRENCY) for _ in range(CONCURRENCY))
+    )
+    client.stop()
+    return CALLS_PER_CLIENT // CONCURRENCY * CONCURRENCY
+
+
+def client_main(port: int) -> int:
+    return asyncio.run(client_calls(port))
+
+
+async def measure(port: int) -> float:
+    loop = asyncio.get_running_loop()
+    with multiprocessing.get_context("spawn").Pool(CLIENT_PROCS) as pool:
+        # warm up the client processes
+        await loop.run_in_executor(None, pool.map, abs, range(CLIENT_PROCS))
+        t0 = time.perf_counter()
+        counts = await loop.run_in_executor(
+            None, pool.map, client_main, [port] * CLIENT_PROCS
+        )
+        return sum(counts) / (time.perf_counter() - t0)
+
+
+async def main():
+    print(f"{os.cpu_count()} cores")
+    print(f"{'server':>16} {'calls/s':>10}")
+
+    server = await EdhServer("hastalk.bench.lander", "127.0.0.1", 0)
+    port = server.server_sockets.result()[0].getsockname()[1]
+    calls_per_sec = await measure(port)
+    server.stop()
+    await server.join()
+    print(f"{'single process':>16} {calls_per_sec:>10.0f}")
+
+    for workers in sorted({2, 4, os.cpu_count() or 1}):
+        server = await EdhMultiServer(
+            "hastalk.bench.lander", "127.0.0.1", 0, workers=workers
+        )
+        port = server.server_addrs.result()[0][1]
+        calls_per_sec = await measure(port)
+        server.stop()
+        await server.join()
+        print(f"{f'{workers} workers':>16} {calls_per_sec:>10.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""
+Benchmark NumPy ndarray transport over loopback TCP
+
+Compares arrays sent with `Peer.p2c_array()`, with arrays sent as `blob:`
+packets from `tobytes()`, and rewrapped by hand on the receiving side.
+
+Run with the parent directory of `hastalk` in PYTHONPATH:
+
+    python -m hastalk.bench.ndarray
+
+"""
+import asyncio
+import time
+
+import numpy as np
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+# ( float64 elements per array, array count )
+CASES = [
+    (128 * 1024, 512),
+    (8 * 1024 * 1024, 16),
+    (64 * 1024 * 1024, 4),
+]
+
+
+async def measure(n_elems: int, count: int, as_nda: bool) -> float:
+    server, client, sender, receiver = await connected_peers()
+    arr = np.random.random(n_elems)
+    data_sink = receiver.ensure_channel(DATA_CHAN)
+
+    async def consume():
+        received = 0
+        async for data in data_sink.stream():
+            if data is None:
+                continue
+            if not as_nda:
+                data = np.frombuffer(bytes(data), dtype=np.float64)
+            received += data.nbytes
+            if received >= arr.nbytes * count:
+                return received
+
+    async def produce():
+        for _ in range(count):
+            if as_nda:
+                await sender.p2c_array(DATA_CHAN, arr)
+            else:
+                await sender.posting(Packet(f"blob:{DATA_CHAN!r}", arr.tobytes()))
+
+    t0 = time.perf_counter()
+    consumer = asyncio.create_task(consume())
+    await produce()
+    received = await consumer
+    elapsed = time.perf_counter() - t0
+
+    client.stop()
+    server.stop()
+    await server.join()
+    return received / elapsed / 1e9
+
+
+async def main():
+    print(f"{'array bytes':>12} {'arrays':>7} {'tobytes GB/s':>13} {'nda GB/s':>9}")
+    for n_elems, count in CASES:
+        before = await measure(n_elems, count, as_nda=False)
+        after = await measure(n_elems, count, as_nda=True)
+        print(f"{n_elems * 8:>12} {count:>7} {before:>13.2f} {after:>9.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+"""
+Benchmark offloading CPU heavy commands from the event loop
+
+One client keeps calling a CPU heavy function at the server, while another
+client makes light calls to the same server, and measures their latency.
+Inline evaluation stalls the light calls behind the heavy ones, offloaded
+evaluation keeps the server's event loop responsive, and a process pool runs
+the heavy calls in parallel across cores.
+
+Run with the parent directory of `hastalk` in PYTHONPATH:
+
+    python -m hastalk.bench.offload
+
+"""
+import asyncio
+import time
+from typing import *
+
+from hastalk import *
+
+
+HEAVY_CALLS = 8
+# heavy calls kept in flight
+HEAVY_CONCURRENCY = 4
+# pool workers, with one spare for the light calls
+POOL_WORKERS = HEAVY_CONCURRENCY + 1
+HEAVY_SRC = "busy(3000000)"
+LIGHT_INTERVAL = 0.01
+
+
+def busy(n: int) -> int:
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+
+async def connect(port: int):
+    client_peer = None
+
+    def client_init(modu):
+        nonlocal client_peer
+        client_peer = modu["peer"]
+
+    client = await EdhClient(
+        "hastalk.bench.lander", "127.0.0.1", port, init=client_init
+    )
+    return client, client_peer
+
+
+async def measure(exec_policy: Optional[ExecPolicy]) -> Tuple[float, float, float]:
+    def server_init(modu):
+        modu["busy"] = busy
+
+    server = await EdhServer(
+        "hastalk.bench.lander",
+        "127.0.0.1",
+        0,
+        init=server_init,
+        exec_policy=exec_policy,
+    )
+    port = server.server_sockets.result()[0].getsockname()[1]
+    heavy_client, heavy = await connect(port)
+    light_client, light = await connect(port)
+    if exec_policy is not None:
+        # warm up the pool, workers may take a while to start
+        await asyncio.gather(*(heavy.call("1") for _ in range(POOL_WORKERS)))
+
+    async def heavy_caller(n: int):
+        for _ in range(n):
+            await heavy.call(HEAVY_SRC)
+
+    heavy_done = False
+    latencies = []
+
+    async def light_caller():
+        while not heavy_done:
+            t0 = time.perf_counter()
+            await light.call("1")
+            latencies.append(time.perf_counter() - t0)
+            await asyncio.sleep(LIGHT_INTERVAL)
+
+    light_task = asyncio.create_task(light_caller())
+    t0 = time.perf_counter()
+    await asyncio.gather(
+        *(
+            heavy_caller(HEAVY_CALLS // HEAVY_CONCURRENCY)
+            for _ in range(HEAVY_CONCURRENCY)
+        )
+    )
+    heavy_secs = time.perf_counter() - t0
+    heavy_done = True
+    await light_task
+
+    heavy_client.stop()
+    light_client.stop()
+    server.stop()
+    await server.join()
+    if exec_policy is not None:
+        exec_policy.close()
+    latencies.sort()
+    return heavy_secs, latencies[len(latencies) // 2], latencies[-1]
+
+
+async def main():
+    print(
+        f"{'policy':>10} {'heavy s':>10} {'light p50 ms':>14} {'light max ms':>14}"
+    )
+    for name, make_policy in (
+        ("inline", lambda: None),
+        ("thread", lambda: ThreadExec(max_workers=POOL_WORKERS)),
+        (
+            "process",
+            lambda: ProcessExec("hastalk.bench.offload", max_workers=POOL_WORKERS),
+        ),
+    ):
+        heavy_secs, p50, pmax = await measure(make_policy())
+        print(
+            f"{name:>10} {heavy_secs:>10.2f} {p50 * 1e3:>14.1f} {pmax * 1e3:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,42 @@
+"""
+A pair of peers connected via the bench lander module, for benchmarks
+
+"""
+__all__ = ["connected_peers"]
+
+import asyncio
+from typing import *
+
+from hastalk import *
+
+
+async def connected_peers(
+    addr: str = "127.0.0.1",
+) -> Tuple[EdhServer, EdhClient, Peer, Peer]:
+    """
+    Serve `hastalk.bench.lander` at `addr` on an arbitrary port, or at a unix
+    domain socket in the form of `unix:/path/to/socket`, and connect a client
+    to it
+
+    The server, the client, the client side peer and the server side peer are
+    returned.
+    """
+    loop = asyncio.get_running_loop()
+    server_peer = loop.create_future()
+
+    def server_init(modu):
+        server_peer.set_result(modu["peer"])
+
+    client_peer = None
+
+    def client_init(modu):
+        nonlocal client_peer
+        client_peer = modu["peer"]
+
+    server = await EdhServer("hastalk.bench.lander", addr, 0, init=server_init)
+    if addr.startswith("unix:"):
+        port = 0
+    else:
+        port = server.server_sockets.result()[0].getsockname()[1]
+    client = await EdhClient("hastalk.bench.lander", addr, port, init=client_init)
+    return server, client, client_peer, await server_peer
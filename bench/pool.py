@@ -0,0 +1,76 @@
+"""
+Benchmark a pool of connections against a single connection
+
+Some clients keep posting large payloads, while others make small calls,
+through the same pool. With a single connection, every call queues behind
+the payloads in the same stream, a pool dispatches calls to connections
+with less outstanding work.
+
+Run with the parent directory of `hastalk` in PYTHONPATH:
+
+    python -m hastalk.bench.pool
+
+"""
+import asyncio
+import time
+from typing import *
+
+from hastalk import *
+
+
+POOL_SIZES = [1, 2, 4]
+PAYLOAD_SIZE = 4 * 1024 * 1024
+# payload posters kept busy
+POSTERS = 2
+# callers kept in flight
+CALLERS = 64
+CALLS_PER_CALLER = 50
+
+
+async def measure(pool_size: int) -> Tuple[float, float, float]:
+    server = await EdhServer("hastalk.bench.lander", "127.0.0.1", 0)
+    port = server.server_sockets.result()[0].getsockname()[1]
+    pool = await EdhClientPool(
+        "hastalk.bench.lander", [("127.0.0.1", port)], size=pool_size
+    )
+    payload = b"x" * PAYLOAD_SIZE
+    calls_done = False
+
+    async def poster():
+        while not calls_done:
+            await pool.p2c_bin(DATA_CHAN, payload, key="payload")
+
+    latencies = []
+
+    async def caller():
+        for i in range(CALLS_PER_CALLER):
+            t0 = time.perf_counter()
+            assert await pool.call(f"{i} + 1") == i + 1
+            latencies.append(time.perf_counter() - t0)
+
+    poster_tasks = [asyncio.create_task(poster()) for _ in range(POSTERS)]
+    t0 = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(CALLERS)))
+    calls_per_sec = CALLERS * CALLS_PER_CALLER / (time.perf_counter() - t0)
+    calls_done = True
+    await asyncio.gather(*poster_tasks)
+
+    pool.stop()
+    server.stop()
+    await server.join()
+    latencies.sort()
+    return calls_per_sec, latencies[len(latencies) // 2], latencies[-1]
+
+
+async def main():
+    print(f"{'pool size':>10} {'calls/s':>10} {'p50 ms':>10} {'max ms':>10}")
+    for pool_size in POOL_SIZES:
+        calls_per_sec, p50, pmax = await measure(pool_size)
+        print(
+            f"{pool_size:>10} {calls_per_sec:>10.0f}"
+            f" {p50 * 1e3:>10.1f} {pmax * 1e3:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
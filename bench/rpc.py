@@ -0,0 +1,52 @@
+"""
+Benchmark pipelined calls against one-at-a-time calls
+
+Measures calls per second made with `Peer.call()` over loopback TCP, awaiting
+each call before making the next, versus keeping many calls in flight.
+
+Run with the parent directory of `hastalk` in PYTHONPATH:
+
+    python -m hastalk.bench.rpc
+
+"""
+import asyncio
+import time
+from typing import *
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+CALL_COUNT = 20000
+# numbers of calls kept in flight
+CONCURRENCY = [1, 16, 256, 4096]
+
+
+async def measure(concurrency: int) -> float:
+    server, client, local, _remote = await connected_peers()
+
+    async def caller(n: int):
+        for i in range(n):
+            assert await local.call(f"{i} + 1") == i + 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(
+        *(caller(CALL_COUNT // concurrency) for _ in range(concurrency))
+    )
+    calls_per_sec = CALL_COUNT / (time.perf_counter() - t0)
+
+    client.stop()
+    server.stop()
+    await server.join()
+    return calls_per_sec
+
+
+async def main():
+    print(f"{'in flight':>10} {'calls/s':>10}")
+    for concurrency in CONCURRENCY:
+        calls_per_sec = await measure(concurrency)
+        print(f"{concurrency:>10} {calls_per_sec:>10.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+"""
+Benchmark shared memory ring transport against loopback TCP
+
+Measures blob throughput of peers over a TCP connection, with and without a
+shared memory ring opened for large payloads.
+
+Run with the parent directory of `hastalk` in PYTHONPATH:
+
+    python -m hastalk.bench.shm
+
+"""
+import asyncio
+import os
+import time
+from typing import *
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+# ( blob size, blob count )
+CASES = [
+    (256 * 1024, 4096),
+    (4 * 1024 * 1024, 256),
+    (32 * 1024 * 1024, 32),
+]
+
+
+async def measure(blob_size: int, count: int, use_shm: bool) -> float:
+    server, client, local, remote = await connected_peers()
+    if use_shm:
+        remote.accept_shm = True
+        await local.open_shm_ring()
+
+    blob = os.urandom(blob_size)
+    blob_sink = remote.ensure_channel("blob")
+
+    async def consume():
+        received = 0
+        async for data in blob_sink.stream():
+            if data is not None:
+                received += len(data)
+                if received >= blob_size * count:
+                    return received
+
+    t0 = time.perf_counter()
+    consumer = asyncio.create_task(consume())
+    for _ in range(count):
+        await local.post_packet(Packet("blob:'blob'", blob))
+    received = await consumer
+    mbps = received / (time.perf_counter() - t0) / 1e6
+
+    client.stop()
+    server.stop()
+    await server.join()
+    return mbps
+
+
+async def main():
+    print(f"{'blob bytes':>10} {'blobs':>6} {'tcp MB/s':>9} {'shm MB/s':>9}")
+    for blob_size, count in CASES:
+        tcp_mbps = await measure(blob_size, count, use_shm=False)
+        shm_mbps = await measure(blob_size, count, use_shm=True)
+        print(f"{blob_size:>10} {count:>6} {tcp_mbps:>9.1f} {shm_mbps:>9.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""
+Benchmark unix domain socket against loopback TCP
+
+Measures round-trip latency of small commands, then blob throughput, over
+connections of either transport.
+
+Run with the parent directory of `hastalk` in PYTHONPATH:
+
+    python -m hastalk.bench.uds
+
+"""
+import asyncio
+import os
+import tempfile
+import time
+from typing import *
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+ROUND_TRIPS = 20000
+BLOB_SIZE, BLOB_COUNT = 4 * 1024 * 1024, 256
+
+
+async def measure(addr: str) -> Tuple[float, float]:
+    server, client, local, remote = await connected_peers(addr)
+    data_sink = local.ensure_channel(DATA_CHAN)
+
+    # round trips of commands, each asking the remote to post back
+    t0 = time.perf_counter()
+    for _ in range(ROUND_TRIPS):
+        reply = asyncio.create_task(data_sink.one_more())
+        await local.post_packet(textPacket("", "peer.p2c(DATA_CHAN, '1')"))
+        await reply
+    rtt_us = (time.perf_counter() - t0) / ROUND_TRIPS * 1e6
+
+    # blob throughput
+    blob = os.urandom(BLOB_SIZE)
+    blob_sink = remote.ensure_channel("blob")
+
+    async def consume():
+        received = 0
+        async for data in blob_sink.stream():
+            if data is not None:
+                received += len(data)
+                if received >= BLOB_SIZE * BLOB_COUNT:
+                    return received
+
+    t0 = time.perf_counter()
+    consumer = asyncio.create_task(consume())
+    for _ in range(BLOB_COUNT):
+        await local.posting(Packet("blob:'blob'", blob))
+    received = await consumer
+    mbps = received / (time.perf_counter() - t0) / 1e6
+
+    client.stop()
+    server.stop()
+    await server.join()
+    return rtt_us, mbps
+
+
+async def main():
+    sock_path = os.path.join(tempfile.mkdtemp(), "bench.sock")
+    print(f"{'transport':>10} {'RTT us':>8} {'blob MB/s':>10}")
+    for name, addr in (("tcp", "127.0.0.1"), ("uds", f"unix:{sock_path}")):
+        rtt_us, mbps = await measure(addr)
+        print(f"{name:>10} {rtt_us:>8.1f} {mbps:>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
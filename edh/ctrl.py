@@ -41,11 +41,14 @@ class EdhPeerError(RuntimeError):
 
 async def read_stream(eos: asyncio.Future, rdr: Coroutine) -> Union[_EndOfStream, Any]:
     try:
+        rdr_task = asyncio.create_task(rdr)
         done, _pending = await asyncio.wait(
-            {eos, asyncio.create_task(rdr)}, return_when=asyncio.FIRST_COMPLETED
+            {eos, rdr_task}, return_when=asyncio.FIRST_COMPLETED
         )
         if len(done) <= 1 and eos in done:
-            # done without unprocessed item
+            # done without unprocessed item, don't leave the reader running,
+            # or the item it reads later will be lost
+            rdr_task.cancel()
             await eos  # reraise exception if that caused eos
             return EndOfStream
         for fut in done:
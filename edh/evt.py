@@ -105,6 +105,8 @@ class EventSink:
         "seqn",
         "mrv",
         "chan",
+        "_subscribers",
+        "_backlog",
     )
 
     def __init__(self):
@@ -114,6 +116,23 @@ class EventSink:
         self.mrv = None
         # the publish channel
         self.chan = PubChan()
+        # number of consumers iterating `stream()`
+        self._subscribers = 0
+        # events published but not consumed yet, summed over those consumers
+        self._backlog = 0
+
+    def subscribers(self) -> int:
+        """
+        Number of consumers currently streaming from this sink
+        """
+        return self._subscribers
+
+    def subscriber_lag(self) -> int:
+        """
+        Number of events published but not consumed yet, summed over the
+        consumers streaming from this sink
+        """
+        return self._backlog
 
     def publish(self, ev):
         if self.seqn >= 9223372036854775807:
@@ -122,6 +141,7 @@ class EventSink:
         else:
             self.seqn += 1
         self.mrv = ev
+        self._backlog += self._subscribers
         self.chan.write(ev)
 
     async def one_more(self):
@@ -139,14 +159,27 @@ class EventSink:
         """
         if self.seqn > 0 and self.mrv is EndOfStream:
             return  # already at eos
-        yield self.mrv
-        nxt = self.chan.nxt
-        while True:
-            (ev, nxt) = await asyncio.shield(nxt)
-            if ev is EndOfStream:
-                break
-            yield ev
-            ev = None
+        # lagging from now on, even while still busy with the current value
+        joined, consumed = self.seqn, 0
+        self._subscribers += 1
+        try:
+            yield self.mrv
+            nxt = self.chan.nxt
+            # events published meanwhile are not buffered for this consumer
+            self._backlog -= self.seqn - joined
+            joined = self.seqn
+            while True:
+                (ev, nxt) = await asyncio.shield(nxt)
+                if ev is EndOfStream:
+                    break
+                yield ev
+                ev = None
+                # the consumer comes back for next event, this one consumed
+                consumed += 1
+                self._backlog -= 1
+        finally:
+            self._subscribers -= 1
+            self._backlog -= self.seqn - joined - consumed
 
     async def run_producer(self, producer: Coroutine):
         """
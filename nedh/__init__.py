@@ -5,26 +5,81 @@ For Python to talk with Networked Edh
 
 __all__ = [
 
+    # exports from .bindata
+    'binPacket', 'packData', 'unpackData', 'registerSymbol',
+
+    # exports from .blob
+    'BlobStream',
+
     # exports from .client
     'EdhClient',
 
+    # exports from .credit
+    'CreditSink', 'CreditWindow',
+
+    # exports from .execpol
+    'ExecPolicy', 'ThreadExec', 'ProcessExec',
+
+    # exports from .heartbeat
+    'Heartbeat',
+
+    # exports from .metrics
+    'PeerMetrics', 'aggregateMetrics', 'counterMetrics', 'prometheusText',
+    'writePrometheusFile',
+
     # exports from .mproto
-    'Packet', 'textPacket', 'sendPacket', 'receivePacketStream',
+    'Packet', 'textPacket', 'batchPacket', 'unbatchPacket', 'sendPacket',
+    'sendPackets', 'pumpPackets', 'receivePacketStream',
+    'receivePacketBatches', 'PacketProtocol',
+
+    # exports from .multiserver
+    'EdhMultiServer', 'WorkerClient',
+
+    # exports from .nda
+    'arrayPacket', 'unpackArray',
 
     # exports from .peer
-    'Peer',
+    'Peer', 'SubPeer',
+
+    # exports from .peermodu
+    'PeerModule', 'peerModule',
+
+    # exports from .pktq
+    'PacketQueue',
+
+    # exports from .pool
+    'EdhClientPool',
+
+    # exports from .replay
+    'ReplayBuffer',
 
     # exports from .server
     'EdhServer',
 
+    # exports from .shmring
+    'ShmRingWriter', 'ShmRingReader',
+
     # exports from .symbols
     'CONIN', 'CONOUT', 'CONMSG', 'sendConOut', 'sendConMsg', 'ERR_CHAN',
     'DATA_CHAN', 'netPeer', 'dataSink', 'sendCmd', 'sendData',
 
 ]
 
+from .bindata import *
+from .blob import *
 from .client import *
+from .credit import *
+from .execpol import *
+from .heartbeat import *
+from .metrics import *
 from .mproto import *
+from .multiserver import *
+from .nda import *
 from .peer import *
+from .peermodu import *
+from .pktq import *
+from .pool import *
+from .replay import *
 from .server import *
+from .shmring import *
 from .symbols import *
@@ -0,0 +1,284 @@
+"""
+Compact self-describing binary encoding of structured data
+
+Packets with a `bin:` directive carry data in this encoding, which is decoded
+directly by the receiving peer, without being evaluated as Python source.
+
+Each value is encoded as a single tag byte followed by its content, numbers
+little-endian. Lists and tuples of all floats, or all int64 ints, are encoded
+as packed arrays.
+
+"""
+__all__ = ["binPacket", "packData", "unpackData", "registerSymbol"]
+
+from typing import *
+from array import array
+import struct
+
+from ..edh import *
+from ..edh.adt import JustMeta
+from ..log import *
+
+from .mproto import *
+from .symbols import *
+
+logger = get_logger(__name__)
+
+
+_u32 = struct.Struct("<I")
+_u64 = struct.Struct("<Q")
+_i64 = struct.Struct("<q")
+_f64 = struct.Struct("<d")
+_c128 = struct.Struct("<dd")
+
+# packed arrays are used for sequences at least this long
+MIN_ARRAY_LEN = 4
+
+# array typecodes of 8 bytes items, native byte order is converted on need
+_F64_ARRAY, _I64_ARRAY = "d", "q"
+assert array(_F64_ARRAY).itemsize == 8 and array(_I64_ARRAY).itemsize == 8
+_NATIVE_LE = array("H", [1]).tobytes() == b"\x01\x00"
+
+
+# decoded symbols by their repr, so a symbol decodes to the same instance
+# every time, and to the local one where registered
+_symbols: Dict[str, Symbol] = {}
+# symbols decoded but not registered are interned up to this many
+MAX_INTERNED_SYMBOLS = 4096
+
+
+def registerSymbol(sym: Symbol) -> Symbol:
+    """
+    Register a symbol, for it to be the instance decoded from its repr
+
+    The symbol decoded so far from the same repr, if any, is returned instead.
+    """
+    return _symbols.setdefault(sym.repr, sym)
+
+
+def _interned_symbol(repr_: str) -> Symbol:
+    sym = _symbols.get(repr_, None)
+    if sym is None:
+        sym = Symbol(repr_)
+        if len(_symbols) < MAX_INTERNED_SYMBOLS:
+            _symbols[repr_] = sym
+    return sym
+
+
+for _sym in (sendConOut, sendConMsg, netPeer, dataSink, sendCmd, sendData):
+    registerSymbol(_sym)
+del _sym
+
+
+def binPacket(dir_: str, data: object) -> Packet:
+    return Packet(f"bin:{dir_!s}", packData(data))
+
+
+def packData(data: object) -> bytes:
+    """
+    Encode a value into bytes
+
+    Supported are: None, bool, int, float, complex, str, bytes, list, tuple,
+    dict, Symbol, Nothing, Just, ArgsPack and EndOfStream, arbitrarily nested.
+    """
+    out = []
+    _pack(data, out)
+    return b"".join(out)
+
+
+def _pack_array(tag: bytes, typecode: str, items: Sequence, out: List):
+    arr = array(typecode, items)
+    if not _NATIVE_LE:
+        arr.byteswap()
+    out.append(tag)
+    out.append(_u32.pack(len(arr)))
+    out.append(arr.tobytes())
+
+
+def _pack(data: object, out: List):
+    t = type(data)
+    if data is None:
+        out.append(b"N")
+    elif t is bool:
+        out.append(b"T" if data else b"F")
+    elif t is int:
+        if -0x8000000000000000 <= data <= 0x7FFFFFFFFFFFFFFF:
+            out.append(b"i")
+            out.append(_i64.pack(data))
+        else:
+            nbytes = (data.bit_length() + 8) // 8
+            out.append(b"I")
+            out.append(_u32.pack(nbytes))
+            out.append(data.to_bytes(nbytes, "little", signed=True))
+    elif t is float:
+        out.append(b"f")
+        out.append(_f64.pack(data))
+    elif t is str:
+        encoded = data.encode("utf-8")
+        out.append(b"s")
+        out.append(_u64.pack(len(encoded)))
+        out.append(encoded)
+    elif t is bytes or t is bytearray:
+        out.append(b"b")
+        out.append(_u64.pack(len(data)))
+        out.append(data)
+    elif t is memoryview:
+        # len() of a view counts items of its format and first dimension only
+        view = data.cast("B")
+        out.append(b"b")
+        out.append(_u64.pack(view.nbytes))
+        out.append(view)
+    elif t is list or t is tuple:
+        if len(data) >= MIN_ARRAY_LEN:
+            t0 = type(data[0])
+            if t0 is float and all(type(item) is float for item in data):
+                _pack_array(b"D" if t is list else b"E", _F64_ARRAY, data, out)
+                return
+            if t0 is int and all(type(item) is int for item in data):
+                try:
+                    _pack_array(b"Q" if t is list else b"R", _I64_ARRAY, data, out)
+                    return
+                except OverflowError:
+                    pass  # some int out of int64 range, pack one by one
+        out.append(b"l" if t is list else b"t")
+        out.append(_u32.pack(len(data)))
+        for item in data:
+            _pack(item, out)
+    elif t is dict:
+        out.append(b"d")
+        out.append(_u32.pack(len(data)))
+        for k, v in data.items():
+            _pack(k, out)
+            _pack(v, out)
+    elif t is complex:
+        out.append(b"c")
+        out.append(_c128.pack(data.real, data.imag))
+    elif t is Symbol:
+        encoded = data.repr.encode("utf-8")
+        out.append(b"y")
+        out.append(_u64.pack(len(encoded)))
+        out.append(encoded)
+    elif data is Nothing:
+        out.append(b"n")
+    elif isinstance(t, JustMeta):
+        out.append(b"j")
+        _pack(data.data, out)
+    elif t is ArgsPack:
+        out.append(b"a")
+        out.append(_u32.pack(len(data.args)))
+        for arg in data.args:
+            _pack(arg, out)
+        out.append(_u32.pack(len(data.kwargs)))
+        for k, v in data.kwargs.items():
+            _pack(k, out)
+            _pack(v, out)
+    elif data is EndOfStream:
+        out.append(b"e")
+    else:
+        raise TypeError(f"Can not pack data of type {t!r}")
+
+
+def unpackData(buf: Union[bytes, memoryview]) -> object:
+    """
+    Decode a value from bytes encoded by `packData()`
+    """
+    view = memoryview(buf)
+    data, pos = _unpack(view, 0)
+    if pos != len(view):
+        raise ValueError(f"Malformed packed data of {len(view)} bytes")
+    return data
+
+
+def _unpack_array(typecode: str, view: memoryview, pos: int):
+    n = _u32.unpack_from(view, pos)[0]
+    pos += 4
+    end = pos + 8 * n
+    arr = array(typecode)
+    arr.frombytes(view[pos:end])
+    if not _NATIVE_LE:
+        arr.byteswap()
+    return arr.tolist(), end
+
+
+def _unpack(view: memoryview, pos: int) -> Tuple[object, int]:
+    tag = view[pos]
+    pos += 1
+    if tag == 0x69:  # i
+        return _i64.unpack_from(view, pos)[0], pos + 8
+    if tag == 0x66:  # f
+        return _f64.unpack_from(view, pos)[0], pos + 8
+    if tag == 0x73:  # s
+        n = _u64.unpack_from(view, pos)[0]
+        pos += 8
+        return str(view[pos : pos + n], "utf-8"), pos + n
+    if tag == 0x44:  # D
+        return _unpack_array(_F64_ARRAY, view, pos)
+    if tag == 0x45:  # E
+        items, pos = _unpack_array(_F64_ARRAY, view, pos)
+        return tuple(items), pos
+    if tag == 0x51:  # Q
+        return _unpack_array(_I64_ARRAY, view, pos)
+    if tag == 0x52:  # R
+        items, pos = _unpack_array(_I64_ARRAY, view, pos)
+        return tuple(items), pos
+    if tag == 0x6C or tag == 0x74:  # l t
+        n = _u32.unpack_from(view, pos)[0]
+        pos += 4
+        items = []
+        for _ in range(n):
+            item, pos = _unpack(view, pos)
+            items.append(item)
+        return (items if tag == 0x6C else tuple(items)), pos
+    if tag == 0x64:  # d
+        n = _u32.unpack_from(view, pos)[0]
+        pos += 4
+        d = {}
+        for _ in range(n):
+            k, pos = _unpack(view, pos)
+            v, pos = _unpack(view, pos)
+            d[k] = v
+        return d, pos
+    if tag == 0x4E:  # N
+        return None, pos
+    if tag == 0x54:  # T
+        return True, pos
+    if tag == 0x46:  # F
+        return False, pos
+    if tag == 0x62:  # b
+        n = _u64.unpack_from(view, pos)[0]
+        pos += 8
+        return bytes(view[pos : pos + n]), pos + n
+    if tag == 0x49:  # I
+        n = _u32.unpack_from(view, pos)[0]
+        pos += 4
+        return int.from_bytes(view[pos : pos + n], "little", signed=True), pos + n
+    if tag == 0x63:  # c
+        real, imag = _c128.unpack_from(view, pos)
+        return complex(real, imag), pos + 16
+    if tag == 0x79:  # y
+        n = _u64.unpack_from(view, pos)[0]
+        pos += 8
+        return _interned_symbol(str(view[pos : pos + n], "utf-8")), pos + n
+    if tag == 0x6E:  # n
+        return Nothing, pos
+    if tag == 0x6A:  # j
+        data, pos = _unpack(view, pos)
+        return Just(data), pos
+    if tag == 0x61:  # a
+        n = _u32.unpack_from(view, pos)[0]
+        pos += 4
+        args = []
+        for _ in range(n):
+            arg, pos = _unpack(view, pos)
+            args.append(arg)
+        n = _u32.unpack_from(view, pos)[0]
+        pos += 4
+        kwargs = {}
+        for _ in range(n):
+            k, pos = _unpack(view, pos)
+            v, pos = _unpack(view, pos)
+            kwargs[k] = v
+        return ArgsPack(*args, **kwargs), pos
+    if tag == 0x65:  # e
+        return EndOfStream, pos
+    raise ValueError(f"Unknown data tag {tag!r} at byte {pos - 1}")
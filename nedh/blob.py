@@ -0,0 +1,172 @@
+"""
+Chunked streaming of large blobs
+
+A blob is sent as a series of packets, each carrying a chunk of it, with the
+directive in the form of:
+
+    stream:<total size>:<channel directive>
+
+The receiving peer publishes a `BlobStream` to the channel sink on the first
+chunk, then feeds subsequent chunks into it, until the total size is reached.
+So neither side ever holds the whole blob in memory.
+
+"""
+__all__ = ["BlobStream"]
+
+from typing import *
+import asyncio
+import mmap
+import os
+
+from ..edh import *
+from ..log import *
+
+from .mproto import *
+from .mproto import PacketPayload
+
+logger = get_logger(__name__)
+
+
+# default size of each chunk a blob is streamed in
+BLOB_CHUNK_SIZE = 1024 * 1024
+
+# at most this many received chunks are buffered by a blob stream, before
+# its feeding awaits the consumer
+BLOB_STREAM_DEPTH = 8
+
+
+BlobSource = Union[
+    str, os.PathLike, BinaryIO, bytes, bytearray, memoryview, mmap.mmap,
+]
+
+
+def isBlobFile(src: BlobSource) -> bool:
+    """
+    Whether a blob source is a file, by path or as a binary file object, so
+    its chunks are read with blocking IO
+    """
+    return isinstance(src, (str, os.PathLike)) or hasattr(src, "read")
+
+
+def blobChunks(
+    src: BlobSource, chunk_size: int = BLOB_CHUNK_SIZE
+) -> Tuple[int, Iterator[PacketPayload]]:
+    """
+    Get the total size of a blob source, with an iterator of its chunks
+
+    A file (by path or as a seekable binary file object) is read chunk by
+    chunk, a buffer (e.g. an mmap) is sliced without copying.
+
+    Opening a file and iterating its chunks do blocking reads, see
+    `isBlobFile()`.
+    """
+    if isinstance(src, (str, os.PathLike)):
+        f = open(src, "rb")
+        return os.fstat(f.fileno()).st_size, _file_chunks(f, chunk_size, True)
+    if hasattr(src, "read"):
+        pos = src.tell()
+        total = src.seek(0, os.SEEK_END) - pos
+        src.seek(pos)
+        return total, _file_chunks(src, chunk_size, False, total)
+    view = memoryview(src).cast("B")
+    return (
+        len(view),
+        (view[pos : pos + chunk_size] for pos in range(0, len(view), chunk_size)),
+    )
+
+
+def _file_chunks(
+    f: BinaryIO, chunk_size: int, close: bool, total: Optional[int] = None
+) -> Iterator[bytes]:
+    try:
+        if total is None:
+            total = os.fstat(f.fileno()).st_size
+        while total > 0:
+            chunk = f.read(min(chunk_size, total))
+            if not chunk:
+                raise RuntimeError("blob file truncated while being streamed")
+            total -= len(chunk)
+            yield chunk
+    finally:
+        if close:
+            f.close()
+
+
+class BlobStream:
+    """
+    A blob being received chunk by chunk
+
+    Chunks can be consumed with `async for`, or saved into a file with
+    `save()`. A stream buffers a few chunks only, receiving further chunks
+    awaits the consumer, so a blob stream must be consumed once published.
+
+    Chunks are fed by the task landing commands from the peer, so a stream
+    must be consumed by another task, while the landing loop keeps reading
+    commands, or both wait for each other forever. This matters for a blob
+    streamed with no channel directive, returned from `Peer.read_command()`
+    to the landing loop itself, hand it off with `asyncio.create_task()`.
+    """
+
+    __slots__ = ("total", "received", "_chunks")
+
+    def __init__(self, total: int, depth: int = BLOB_STREAM_DEPTH):
+        # total size of the blob
+        self.total = total
+        # bytes received so far
+        self.received = 0
+        self._chunks = asyncio.Queue(maxsize=depth)
+
+    def __repr__(self):
+        return f"BlobStream<{self.received}/{self.total}>"
+
+    def completed(self) -> bool:
+        return self.received >= self.total
+
+    async def feed(self, chunk: PacketPayload):
+        if self.received + len(chunk) > self.total:
+            raise RuntimeError(
+                f"blob overflow: {len(chunk)} more bytes to {self!r}"
+            )
+        self.received += len(chunk)
+        if len(chunk) > 0:
+            await self._chunks.put(chunk)
+        if self.completed():
+            await self._chunks.put(EndOfStream)
+
+    def abort(self, exc: BaseException):
+        """
+        Fail the consumer, when the blob will not be completely received
+        """
+        while True:
+            try:
+                self._chunks.put_nowait(exc)
+                break
+            except asyncio.QueueFull:
+                self._chunks.get_nowait()  # drop the chunk, it's failed anyway
+
+    async def __aiter__(self):
+        while True:
+            chunk = await self._chunks.get()
+            if chunk is EndOfStream:
+                return
+            if isinstance(chunk, BaseException):
+                raise chunk
+            yield chunk
+
+    async def save(self, file_path: Union[str, os.PathLike]) -> int:
+        """
+        Write the blob into a file, via memory-mapping it
+
+        The file is created (or truncated) to the total size upfront.
+        """
+        with open(file_path, "w+b") as f:
+            f.truncate(self.total)
+            if self.total <= 0:
+                return 0
+            with mmap.mmap(f.fileno(), self.total) as mm:
+                pos = 0
+                async for chunk in self:
+                    mm[pos : pos + len(chunk)] = chunk
+                    pos += len(chunk)
+                mm.flush()
+        return pos
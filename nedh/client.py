@@ -7,20 +7,42 @@ __all__ = ["EdhClient"]
 from typing import *
 import asyncio
 import inspect
-
-import runpy
+import random
 
 from ..edh import *
 from ..log import *
 
+from .execpol import *
+from .heartbeat import HEARTBEAT_MISSES
 from .mproto import *
 from .peer import *
+from .peermodu import *
+from .pktq import *
+from .pktq import BULK_PART_SIZE, INQ_HIGH_WATER
+from .replay import *
+from .replay import REPLAY_MAX_BYTES
 
 logger = get_logger(__name__)
 
 
+# default seconds to wait before the first attempt to reconnect, doubled per
+# failed attempt up to the max
+RECONNECT_DELAY = 0.1
+RECONNECT_MAX_DELAY = 10.0
+
+
 class EdhClient:
     """
+    Nedh client connecting via TCP, or via a unix domain socket when the
+    service address is in the form of `unix:/path/to/socket`
+
+    With `reconnect=True`, a lost connection is reconnected with exponential
+    backoff, keeping the same peer object, its channels and the consumer
+    module running. Outgoing packets not acknowledged by the service are
+    replayed on reconnection, see `hastalk.nedh.replay`. Packets are
+    acknowledged once landed by the landing loop of the service, so packets
+    of a service not landing commands are kept up to `replay_max_bytes`.
+
     """
 
     def __init__(
@@ -30,6 +52,17 @@ class EdhClient:
         service_port: int = 3721,
         init: Optional[Callable[[dict], Awaitable]] = None,
         net_opts: Optional[Dict] = None,
+        outq_high_water: Optional[int] = None,
+        outq_low_water: Optional[int] = None,
+        inq_high_water: Optional[int] = None,
+        exec_policy: Optional[ExecPolicy] = None,
+        heartbeat_interval: Optional[float] = None,
+        heartbeat_misses: int = HEARTBEAT_MISSES,
+        reconnect: bool = False,
+        reconnect_delay: float = RECONNECT_DELAY,
+        reconnect_max_delay: float = RECONNECT_MAX_DELAY,
+        reconnect_attempts: Optional[int] = None,
+        replay_max_bytes: int = REPLAY_MAX_BYTES,
     ):
         loop = asyncio.get_running_loop()
         eol = loop.create_future()
@@ -41,6 +74,24 @@ class EdhClient:
         self.service_addrs = loop.create_future()
         self.eol = eol
         self.net_opts = net_opts or {}
+        # byte budget of each outgoing packet queue
+        self.outq_high_water = outq_high_water
+        self.outq_low_water = outq_low_water
+        # byte budget of each incoming packet queue, 0 for one packet at a time
+        self.inq_high_water = inq_high_water
+        # how commands from the peer are evaluated, inline if None
+        self.exec_policy = exec_policy
+        # ping the peer this often to detect it dead, no heartbeat if None
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_misses = heartbeat_misses
+        # reconnect once the connection lost, until failed so many attempts
+        # in a row, or forever if None
+        self.reconnect = reconnect
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.reconnect_attempts = reconnect_attempts
+        # byte budget of outgoing packets kept for replay
+        self.replay_max_bytes = replay_max_bytes
 
         # mark end-of-life anyway finally
         def client_cleanup(clnt_fut):
@@ -77,29 +128,82 @@ class EdhClient:
         if not self.eol.done():
             self.eol.set_result(None)
 
+    async def _connect(self) -> PacketProtocol:
+        # make the network connection, packets are received into buffers
+        # with zero-copy, the protocol object serves as the outlet too
+        loop = asyncio.get_running_loop()
+        if self.service_addr.startswith("unix:"):
+            _transport, outlet = await loop.create_unix_connection(
+                PacketProtocol, self.service_addr[5:], **self.net_opts,
+            )
+        else:
+            _transport, outlet = await loop.create_connection(
+                PacketProtocol, self.service_addr, self.service_port, **self.net_opts,
+            )
+        return outlet
+
+    async def _reconnect(self) -> Optional[PacketProtocol]:
+        # reconnect with exponential backoff, None if stopped meanwhile
+        delay = self.reconnect_delay
+        attempts = 0
+        while True:
+            # jittered, so clients of a restarted service don't rush at once
+            done, _pending = await asyncio.wait(
+                {self.eol}, timeout=delay * random.uniform(0.5, 1.0)
+            )
+            if done:
+                return None
+            attempts += 1
+            try:
+                return await self._connect()
+            except OSError as exc:
+                if (
+                    self.reconnect_attempts is not None
+                    and attempts >= self.reconnect_attempts
+                ):
+                    raise
+                logger.info(
+                    f"Reconnecting to service failed {attempts!r} times: {exc!s}"
+                )
+            delay = min(delay * 2, self.reconnect_max_delay)
+
     async def _consumer_thread(self):
         outlet = None
         eol = self.eol
         try:
 
-            # make the network connection
-            intake, outlet = await asyncio.open_connection(
-                self.service_addr, self.service_port, **self.net_opts,
-            )
+            outlet = await self._connect()
             addr = outlet.get_extra_info("peername", "<some-peer>")
             self.service_addrs.set_result([addr])
 
             # prepare the peer object
             ident = str(addr)
-            # outletting currently has no rate limit, maybe add in the future?
-            # with an unbounded queue, backpressure from remote peer is ignored
-            # and outgoing packets can pile up locally
-            poq = asyncio.Queue()
+            # outletting is budgeted in bytes, posting awaits once the queued
+            # bytes exceeded the high-water mark, so backpressure from remote
+            # peer propagates to local producers
+            poq = PacketQueue(
+                self.outq_high_water, self.outq_low_water, part_size=BULK_PART_SIZE
+            )
             # intaking should create backpressure when handled slowly, so use a
-            # bounded queue
-            hoq = asyncio.Queue(maxsize=1)
+            # bounded queue, packets received in a burst can be read in batch
+            hoq = PacketQueue(
+                INQ_HIGH_WATER if self.inq_high_water is None else self.inq_high_water
+            )
 
-            peer = Peer(ident=ident, eol=eol, posting=poq.put, hosting=hoq.get,)
+            peer = Peer(
+                ident=ident,
+                eol=eol,
+                posting=poq.put,
+                hosting=hoq.get,
+                outgoing=poq,
+                incoming=hoq,
+                exec_policy=self.exec_policy,
+            )
+            heartbeat_interval = self.heartbeat_interval
+            if self.reconnect:
+                peer.replay = ReplayBuffer(self.replay_max_bytes)
+            elif heartbeat_interval is not None:
+                peer.start_heartbeat(heartbeat_interval, self.heartbeat_misses)
 
             # per-connection peer module preparation
             modu = {"peer": peer}
@@ -109,27 +213,58 @@ class EdhClient:
                 if inspect.isawaitable(maybe_async):
                     await maybe_async
             # launch the peer module, it normally forks a concurrent task to
-            # run a command landing loop
-            runpy.run_module(
-                self.consumer_modu, modu,
-            )
+            # run a command landing loop, its code is loaded only once
+            peerModule(self.consumer_modu).run(modu)
             logger.debug(f"Nedh peer module {self.consumer_modu} initialized")
 
-            # pump commands in,
-            # this task is the only one reading the socket
-            asyncio.create_task(
-                receivePacketStream(
-                    peer_site=ident, intake=intake, pkt_sink=hoq.put, eos=eol,
-                )
-            )
+            if not self.reconnect:
+                await self._pump_connection(peer, outlet, poq, hoq, eol)
+                return
 
-            # pump commands out,
-            # this task is the only one writing the socket
+            # the peer module and the peer object live on across
+            # connections, until stopped
             while True:
-                pkt = await read_stream(eol, poq.get())
-                if pkt is EndOfStream:
-                    break
-                await sendPacket(ident, outlet, pkt)
+                conn_eol = asyncio.get_running_loop().create_future()
+
+                def stopped(_eol):
+                    if not conn_eol.done():
+                        conn_eol.set_result(None)
+
+                eol.add_done_callback(stopped)
+                try:
+                    if heartbeat_interval is not None:
+                        peer.start_heartbeat(
+                            heartbeat_interval, self.heartbeat_misses, conn_eol
+                        )
+                    # packets not acknowledged before go first
+                    replayed = peer.replay.replay()
+                    if replayed:
+                        logger.info(f"Replaying {len(replayed)!r} packets to service")
+                        await sendPackets(ident, outlet, replayed)
+                        peer.request_ack()
+                    await self._pump_connection(peer, outlet, poq, hoq, conn_eol)
+                except Exception:
+                    # connection broken, or missed heartbeats etc.
+                    logger.warning("Connection to service failed", exc_info=True)
+                finally:
+                    eol.remove_done_callback(stopped)
+                    if not conn_eol.done():
+                        conn_eol.set_result(None)
+                    outlet.close()
+                    await outlet.wait_closed()
+                    outlet = None
+
+                if eol.done():
+                    return
+                logger.warning("Connection to service lost, reconnecting")
+                peer.connection_lost()
+                outlet = await self._reconnect()
+                if outlet is None:  # stopped
+                    return
+                logger.info(
+                    "Reconnected to service at"
+                    f" {outlet.get_extra_info('peername', '<some-peer>')!s}"
+                )
 
         except Exception as exc:
             logger.error("Nedh client error.", exc_info=True)
@@ -140,3 +275,37 @@ class EdhClient:
                 # todo post err (if any) to peer
                 outlet.close()
                 await outlet.wait_closed()
+
+    async def _pump_connection(
+        self,
+        peer: Peer,
+        outlet: PacketProtocol,
+        poq: PacketQueue,
+        hoq: PacketQueue,
+        eos: asyncio.Future,
+    ):
+        ident = peer.ident
+        # heartbeats are handled right as received, never held back by the
+        # incoming queue
+        outlet.urgent = peer.handle_urgent
+
+        # pump commands in,
+        # this task is the only one reading the socket
+        asyncio.create_task(
+            receivePacketStream(
+                peer_site=ident,
+                intake=outlet,
+                pkt_sink=peer.intake_sink(hoq.put, hoq.put_bulk),
+                eos=eos,
+            )
+        )
+
+        # pump commands out,
+        # this task is the only one writing the socket
+        await pumpPackets(
+            ident,
+            outlet,
+            poq,
+            eos,
+            sent=None if peer.replay is None else peer.record_sent,
+        )
@@ -0,0 +1,137 @@
+"""
+Credit-based flow control per channel
+
+A receiving peer can arm a channel with a credit window, it grants the
+sending peer credits with packets of directive:
+
+    credit:<number of credits>:<channel directive>
+
+The sender takes one credit per item posted to that channel, and suspends
+when out of credits. Credits are granted back as consumers of the channel
+sink make progress, so a fast producer can not pile up items in memory of a
+slow consumer.
+
+Channels without a credit window are not flow controlled this way.
+
+"""
+__all__ = ["CreditSink", "CreditWindow"]
+
+from typing import *
+import asyncio
+
+from ..edh import *
+from ..log import *
+
+logger = get_logger(__name__)
+
+
+# default number of items a channel can have in flight
+CREDIT_WINDOW = 64
+
+
+class CreditWindow:
+    """
+    Credits granted by the receiving peer, for posting to a channel
+
+    """
+
+    __slots__ = ("available", "_granted")
+
+    def __init__(self):
+        self.available = 0
+        self._granted = asyncio.Event()
+
+    def __repr__(self):
+        return f"CreditWindow<{self.available}>"
+
+    def grant(self, n: int):
+        self.available += n
+        if self.available > 0:
+            self._granted.set()
+
+    def close(self):
+        """
+        Release all posters awaiting credits, e.g. on end-of-life of the peer
+        """
+        self.grant(float("inf"))
+
+    async def take(self):
+        while self.available <= 0:
+            self._granted.clear()
+            await self._granted.wait()
+        self.available -= 1
+
+
+class CreditSink(EventSink):
+    """
+    Event sink granting credits back as its consumers make progress
+
+    Progress of consumers iterating `stream()` is tracked, credits are
+    granted for items the slowest consumer has consumed. Items published
+    while there is no such consumer are discarded anyway, so credited
+    immediately.
+    """
+
+    __slots__ = ("window", "granting", "_positions", "_credited")
+
+    def __init__(self, window: int, granting: Callable[[int], None]):
+        super().__init__()
+        if window <= 0:
+            raise ValueError(f"Invalid credit window: {window!r}")
+        self.window = window
+        # called with number of credits to grant back
+        self.granting = granting
+        # sequence number of the item each consumer has consumed up to
+        self._positions: Dict[object, int] = {}
+        # sequence number of the item credits have been granted back up to
+        self._credited = self.seqn
+
+    def __repr__(self):
+        return f"CreditSink<{self.seqn - self._credited}/{self.window}>"
+
+    def publish(self, ev):
+        super().publish(ev)
+        if not self._positions:
+            self._progress()
+
+    def subscribers(self) -> int:
+        return len(self._positions)
+
+    def subscriber_lag(self) -> int:
+        seqn = self.seqn
+        return sum(seqn - pos for pos in self._positions.values())
+
+    def _progress(self):
+        consumed = min(self._positions.values(), default=self.seqn)
+        n = consumed - self._credited
+        # grant in batches, all the credits granted before get consumed
+        # before the sender runs out, so no batch can be left pending forever
+        if n >= max(1, self.window // 4) or (n > 0 and consumed >= self.seqn):
+            self._credited = consumed
+            self.granting(n)
+
+    async def stream(self):
+        if self.seqn > 0 and self.mrv is EndOfStream:
+            return  # already at eos
+        consumer = object()
+        # holding back credits from now on, even while still busy with the
+        # current value
+        self._positions[consumer] = self.seqn
+        try:
+            yield self.mrv
+            nxt = self.chan.nxt
+            # items published meanwhile are not buffered for this consumer
+            self._positions[consumer] = self.seqn
+            self._progress()
+            while True:
+                (ev, nxt) = await asyncio.shield(nxt)
+                if ev is EndOfStream:
+                    break
+                yield ev
+                ev = None
+                # the consumer comes back for next item, this one consumed
+                self._positions[consumer] += 1
+                self._progress()
+        finally:
+            del self._positions[consumer]
+            self._progress()
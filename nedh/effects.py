@@ -9,30 +9,30 @@ from .symbols import *
 
 async def sendConOut_(d, *ds):
     peer = effect(netPeer)
-    peer.p2c(CONOUT, d)
+    await peer.p2c(CONOUT, d)
     for d in ds:
-        peer.p2c(CONOUT, d)
+        await peer.p2c(CONOUT, d)
 
 
 async def sendConMsg_(d, *ds):
     peer = effect(netPeer)
-    peer.p2c(CONMSG, d)
+    await peer.p2c(CONMSG, d)
     for d in ds:
-        peer.p2c(CONMSG, d)
+        await peer.p2c(CONMSG, d)
 
 
 async def sendCmd_(c, *cs):
     peer = effect(netPeer)
-    peer.postCommand(c)
+    await peer.post_command(c)
     for c in cs:
-        peer.postCommand(c)
+        await peer.post_command(c)
 
 
 async def sendData_(d, *ds):
     peer = effect(netPeer)
-    peer.p2c(DATA_CHAN, d)
+    await peer.p2c(DATA_CHAN, d)
     for d in ds:
-        peer.p2c(DATA_CHAN, d)
+        await peer.p2c(DATA_CHAN, d)
 
 
 __all_symbolic__ = {
@@ -0,0 +1,167 @@
+"""
+Execution policies for commands landed from peers
+
+Commands are evaluated inline on the event loop by default, a CPU heavy one
+stalls all other peers served by the same loop meanwhile. A peer, or some
+channels of it, can be given a policy to offload the evaluation instead:
+
+    *) `ThreadExec` - evaluated in a thread pool, with the same globals and
+       locals as inline, the loop keeps pumping packets meanwhile, and code
+       releasing the GIL (e.g. NumPy) runs in parallel
+    *) `ProcessExec` - evaluated in a pool of worker processes, in the
+       namespace of a module imported there, so it runs in parallel across
+       cores, the value is pickled back
+
+A policy can be shared by many peers, e.g. all peers of an `EdhServer`, to
+share its pool.
+
+"""
+__all__ = ["ExecPolicy", "ThreadExec", "ProcessExec"]
+
+from typing import *
+import asyncio
+import importlib
+import inspect
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from ..log import *
+
+from .peer import exec_py, run_py
+
+logger = get_logger(__name__)
+
+
+class ExecPolicy:
+    """
+    Evaluate commands inline on the event loop, as without a policy
+
+    """
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return f"{type(self).__name__}()"
+
+    async def run(
+        self, code: str, src_name: str, globals_: dict, locals_: dict
+    ) -> object:
+        return await run_py(code, src_name, globals_, locals_)
+
+    def close(self):
+        """
+        Release resources of this policy, e.g. shutdown its pool
+        """
+        pass
+
+
+class ThreadExec(ExecPolicy):
+    """
+    Evaluate commands in a thread pool
+
+    Awaitables resulted are awaited on the event loop, so async commands
+    keep working as inline.
+
+    A command runs in a thread without an event loop, it must not call any
+    asyncio API itself, e.g. `asyncio.create_task()` fails there, while
+    futures and events of the loop are not thread-safe. Return a coroutine
+    instead, e.g. by calling an `async def` function, it's run on the loop.
+    """
+
+    __slots__ = ("executor", "_owned")
+
+    def __init__(
+        self, executor: Optional[Executor] = None, max_workers: Optional[int] = None
+    ):
+        # a pool created here is shutdown on close, one given is not
+        self._owned = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers, "nedh-exec")
+        self.executor = executor
+
+    def __repr__(self):
+        return f"ThreadExec({self.executor!r})"
+
+    async def run(
+        self, code: str, src_name: str, globals_: dict, locals_: dict
+    ) -> object:
+        loop = asyncio.get_running_loop()
+        maybe_aw = await loop.run_in_executor(
+            self.executor, exec_py, code, src_name, globals_, locals_
+        )
+        if inspect.isawaitable(maybe_aw):
+            return await maybe_aw
+        return maybe_aw
+
+    def close(self):
+        if self._owned:
+            self.executor.shutdown(wait=False)
+
+
+class ProcessExec(ExecPolicy):
+    """
+    Evaluate commands in a pool of worker processes
+
+    The globals and locals of the landing loop can not be shared with the
+    workers, a command is evaluated with the module named by `modu` as its
+    globals, which is imported once per worker, and fresh locals. Without
+    `modu`, the globals is a namespace private to each worker. So commands
+    better be self-contained calls into functions of that module.
+
+    The value is pickled back, awaitables resulted are run to completion in
+    the worker. Workers are spawned, not forked from the event loop.
+    """
+
+    __slots__ = ("modu", "executor", "_owned")
+
+    def __init__(
+        self,
+        modu: Optional[str] = None,
+        executor: Optional[Executor] = None,
+        max_workers: Optional[int] = None,
+    ):
+        self.modu = modu
+        # a pool created here is shutdown on close, one given is not
+        self._owned = executor is None
+        if executor is None:
+            executor = ProcessPoolExecutor(
+                max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        self.executor = executor
+
+    def __repr__(self):
+        return f"ProcessExec({self.modu!r}, {self.executor!r})"
+
+    async def run(
+        self, code: str, src_name: str, globals_: dict, locals_: dict
+    ) -> object:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, _exec_in_worker, code, str(src_name), self.modu
+        )
+
+    def close(self):
+        if self._owned:
+            self.executor.shutdown(wait=False)
+
+
+# globals of commands run in this worker process, by module name
+_worker_globals: Dict[Optional[str], dict] = {}
+
+
+async def _await_value(aw: Awaitable) -> object:
+    return await aw
+
+
+def _exec_in_worker(code: str, src_name: str, modu: Optional[str]) -> object:
+    globals_ = _worker_globals.get(modu, None)
+    if globals_ is None:
+        if modu is None:
+            globals_ = {"__name__": "__nedh_exec__"}
+        else:
+            globals_ = importlib.import_module(modu).__dict__
+        _worker_globals[modu] = globals_
+    val = exec_py(code, src_name, globals_, {})
+    if inspect.isawaitable(val):
+        return asyncio.run(_await_value(val))
+    return val
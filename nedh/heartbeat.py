@@ -0,0 +1,150 @@
+"""
+Heartbeats between peers
+
+A peer with heartbeat started posts a packet every interval, of directive:
+
+    ping:<sequence number>
+
+The remote peer answers with `pong:<sequence number>` right as received,
+ahead of packets queued for its command landing loop. Round-trip times are sampled
+from the answers, and smoothed the way TCP does (RFC 6298). The peer is
+brought to end-of-life with an error once too many pings went unanswered,
+so a half-open connection is detected in seconds, instead of waiting for the
+kernel to time it out.
+
+Python peers always answer pings, a peer of other implementation must do
+so too before heartbeats can be started against it.
+
+"""
+__all__ = ["Heartbeat"]
+
+from typing import *
+import asyncio
+import time
+
+from ..edh import *
+from ..log import *
+
+from .mproto import *
+
+logger = get_logger(__name__)
+
+
+# default seconds between pings
+HEARTBEAT_INTERVAL = 1.0
+
+# default number of unanswered pings to consider the peer dead
+HEARTBEAT_MISSES = 3
+
+
+class Heartbeat:
+    """
+    Heartbeat state of a peer, see `Peer.start_heartbeat()`
+
+    """
+
+    __slots__ = (
+        "interval",
+        "max_missed",
+        "rtt",
+        "srtt",
+        "rttvar",
+        "_seq",
+        "_sent",
+    )
+
+    def __init__(
+        self,
+        interval: float = HEARTBEAT_INTERVAL,
+        max_missed: int = HEARTBEAT_MISSES,
+        seq: int = 0,
+    ):
+        if interval <= 0 or max_missed < 1:
+            raise ValueError(
+                f"Invalid heartbeat: interval={interval!r}, max_missed={max_missed!r}"
+            )
+        self.interval = interval
+        self.max_missed = max_missed
+        # last round-trip time sampled, in seconds
+        self.rtt: Optional[float] = None
+        # smoothed round-trip time and its variation, in seconds
+        self.srtt: Optional[float] = None
+        self.rttvar: Optional[float] = None
+        # sequence number of the last ping
+        self._seq = seq
+        # send time of each ping not answered yet, by sequence number
+        self._sent: Dict[int, float] = {}
+
+    def __repr__(self):
+        srtt = "?" if self.srtt is None else f"{self.srtt * 1e3:.1f}ms"
+        return f"Heartbeat<rtt {srtt}, {self.missed} missed>"
+
+    @property
+    def seq(self) -> int:
+        """
+        Sequence number of the last ping
+        """
+        return self._seq
+
+    @property
+    def missed(self) -> int:
+        """
+        Number of pings not answered yet
+        """
+        return len(self._sent)
+
+    def ping(self) -> Packet:
+        self._seq += 1
+        self._sent[self._seq] = time.monotonic()
+        return Packet(f"ping:{self._seq!r}", b"")
+
+    def pong(self, seq: int):
+        sent_time = self._sent.pop(seq, None)
+        if sent_time is None:
+            return  # answered after the peer's end-of-life or so
+        # pings are answered in order, earlier ones not answered are lost
+        for lost in [s for s in self._sent if s < seq]:
+            del self._sent[lost]
+        rtt = time.monotonic() - sent_time
+        self.rtt = rtt
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
+    async def run(
+        self,
+        ident: object,
+        eol: asyncio.Future,
+        posting: Callable,
+        stalled: Optional[Callable[[], bool]] = None,
+    ):
+        """
+        Post pings with `posting` every interval, until `eol`, or set `eol`
+        with an error once too many pings missed
+
+        No ping is posted nor misses judged while `stalled()` is true, i.e.
+        the local side is not reading answers in time by itself.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(asyncio.shield(eol), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            except:
+                return
+            else:
+                return
+            if stalled is not None and stalled():
+                continue  # answers can be held back locally
+            # count by pings, not by time elapsed, so a local stall of the
+            # event loop does not fail the peer
+            if self.missed >= self.max_missed:
+                logger.warning(f"Peer {ident!s} missed {self.missed} heartbeats")
+                if not eol.done():
+                    eol.set_exception(
+                        EdhPeerError(ident, f"missed {self.missed!r} heartbeats")
+                    )
+                return
+            posting(self.ping())
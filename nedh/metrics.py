@@ -0,0 +1,381 @@
+"""
+Runtime metrics of peers
+
+Packets and bytes are counted per directive key, in and out, where the key
+of a packet is:
+
+    *) the prefix only, for transport control packets, e.g. `credit`
+    *) the prefix with the channel directive, for data packets, e.g.
+       `bin:'data'`
+    *) the channel directive, for textual commands, or an empty string for
+       commands not targeting any channel
+
+Evaluation time of commands is recorded as a histogram, then the channel
+sinks are sampled for their publish rates and subscriber lags, on taking a
+snapshot.
+
+A snapshot is a plain dict, it can be rendered in Prometheus text format,
+and written to a file for a node exporter's textfile collector to pick up.
+
+Subscriber lags are the events published but not consumed yet, summed over
+the consumers of a channel sink, tracked by counters at publishing and
+consuming, so sampling them costs nothing per event.
+
+"""
+__all__ = [
+    "PeerMetrics",
+    "aggregateMetrics",
+    "counterMetrics",
+    "prometheusText",
+    "writePrometheusFile",
+]
+
+from typing import *
+import os
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from ..edh import *
+from ..log import *
+
+logger = get_logger(__name__)
+
+
+# upper bounds of the buckets of evaluation time histograms, in seconds
+EXEC_TIME_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+# at most this many directive keys are counted separately per peer, packets
+# of further keys are counted under `other`
+MAX_METRIC_KEYS = 256
+
+# prefixes of transport control packets, counted by the prefix only
+CTRL_PREFIXES = {
+    "ack",
+    "ackreq",
+    "batch",
+    "bulk",
+    "call",
+    "credit",
+    "part",
+    "ping",
+    "pong",
+    "rerr",
+    "ret",
+    "shm",
+    "shmack",
+    "shmopen",
+    "sub",
+    "subeol",
+    "subopen",
+}
+
+# prefixes of data packets, counted by the prefix with the channel directive
+# following the given number of meta fields
+DATA_PREFIXES = {
+    "blob": 0,
+    "bin": 0,
+    "nda": 3,
+    "stream": 1,
+}
+
+
+def directive_key(dir_: str) -> str:
+    prefix, sep, rest = dir_.partition(":")
+    if not sep:
+        return dir_
+    if prefix in CTRL_PREFIXES:
+        return prefix
+    nmeta = DATA_PREFIXES.get(prefix, None)
+    if nmeta is None:
+        return dir_  # a channel directive with colon in it
+    if nmeta > 0:
+        rest = rest.split(":", nmeta)[-1]
+    return f"{prefix}:{rest}"
+
+
+class PeerMetrics:
+    """
+    Runtime metrics of a peer, see `Peer.metrics_snapshot()`
+
+    """
+
+    __slots__ = (
+        "counts_in",
+        "counts_out",
+        "exec_counts",
+        "exec_sum",
+        "_keys",
+        "_published",
+    )
+
+    def __init__(self):
+        # [ packets, bytes ] counted per directive key
+        self.counts_in: Dict[str, List[int]] = {}
+        self.counts_out: Dict[str, List[int]] = {}
+        # evaluation time histogram, non-cumulative counts per bucket, the
+        # last one for +Inf
+        self.exec_counts = [0] * (len(EXEC_TIME_BUCKETS) + 1)
+        self.exec_sum = 0.0
+        # directive to key cache
+        self._keys: Dict[str, str] = {}
+        # ( sequence number, timestamp ) of each channel at last snapshot
+        self._published: Dict[object, Tuple[int, float]] = {}
+
+    def __repr__(self):
+        return (
+            f"PeerMetrics<in {sum(c[0] for c in self.counts_in.values())} packets,"
+            f" out {sum(c[0] for c in self.counts_out.values())} packets>"
+        )
+
+    def _counts(self, counts: Dict[str, List[int]], dir_: str) -> List[int]:
+        key = directive_key(dir_)
+        if (
+            len(self.counts_in) + len(self.counts_out) >= MAX_METRIC_KEYS
+            and key not in self.counts_in
+            and key not in self.counts_out
+        ):
+            key = "other"
+        # directives of control packets mostly vary per packet, not cached
+        if key not in CTRL_PREFIXES and len(self._keys) < MAX_METRIC_KEYS * 4:
+            self._keys[dir_] = key
+        c = counts.get(key, None)
+        if c is None:
+            c = counts[key] = [0, 0]
+        return c
+
+    def count_in(self, dir_: str, nbytes: int):
+        key = self._keys.get(dir_, None)
+        c = None if key is None else self.counts_in.get(key, None)
+        if c is None:
+            c = self._counts(self.counts_in, dir_)
+        c[0] += 1
+        c[1] += nbytes
+
+    def count_out(self, dir_: str, nbytes: int):
+        key = self._keys.get(dir_, None)
+        c = None if key is None else self.counts_out.get(key, None)
+        if c is None:
+            c = self._counts(self.counts_out, dir_)
+        c[0] += 1
+        c[1] += nbytes
+
+    def record_exec(self, seconds: float):
+        self.exec_counts[bisect_left(EXEC_TIME_BUCKETS, seconds)] += 1
+        self.exec_sum += seconds
+
+    def snapshot(
+        self, outgoing: Optional["PacketQueue"], channels: Dict[Any, EventSink]
+    ) -> dict:
+        """
+        Take a snapshot of the metrics, sampling the outgoing queue and
+        the channel sinks given
+
+        Publish rates are averaged since the last snapshot, so they read 0
+        on the first one.
+        """
+        now = time.monotonic()
+        buckets, cumulative = {}, 0
+        for le, n in zip(EXEC_TIME_BUCKETS, self.exec_counts):
+            cumulative += n
+            buckets[repr(le)] = cumulative
+        cumulative += self.exec_counts[-1]
+        buckets["+Inf"] = cumulative
+
+        chans = {}
+        published = {}
+        for ch_lctr, ch_sink in channels.items():
+            seqn = ch_sink.seqn
+            last_seqn, last_time = self._published.get(ch_lctr, (seqn, now))
+            published[ch_lctr] = seqn, now
+            chans[repr(ch_lctr)] = {
+                "published": seqn,
+                "publish_rate": (seqn - last_seqn) / (now - last_time)
+                if now > last_time and seqn >= last_seqn
+                else 0.0,
+                "subscribers": ch_sink.subscribers(),
+                "subscriber_lag": ch_sink.subscriber_lag(),
+            }
+        self._published = published
+
+        return {
+            "packets_in": {key: c[0] for key, c in self.counts_in.items()},
+            "bytes_in": {key: c[1] for key, c in self.counts_in.items()},
+            "packets_out": {key: c[0] for key, c in self.counts_out.items()},
+            "bytes_out": {key: c[1] for key, c in self.counts_out.items()},
+            "outq_packets": 0 if outgoing is None else outgoing.qsize(),
+            "outq_bytes": 0 if outgoing is None else outgoing.queued_bytes,
+            "outq_peak_bytes": 0 if outgoing is None else outgoing.peak_bytes,
+            "exec_seconds": {
+                "buckets": buckets,
+                "sum": self.exec_sum,
+                "count": cumulative,
+            },
+            "channels": chans,
+        }
+
+
+def aggregateMetrics(snapshots: Iterable[dict]) -> dict:
+    """
+    Aggregate snapshots of multiple peers into one
+
+    Counters, histograms, queue depths and channel rates are summed up,
+    peaks and subscriber lags take the maximum.
+    """
+    agg = {
+        "packets_in": defaultdict(int),
+        "bytes_in": defaultdict(int),
+        "packets_out": defaultdict(int),
+        "bytes_out": defaultdict(int),
+        "outq_packets": 0,
+        "outq_bytes": 0,
+        "outq_peak_bytes": 0,
+        "exec_seconds": {"buckets": defaultdict(int), "sum": 0.0, "count": 0},
+        "channels": {},
+    }
+    for snap in snapshots:
+        for field in ("packets_in", "bytes_in", "packets_out", "bytes_out"):
+            counters = agg[field]
+            for key, n in snap[field].items():
+                counters[key] += n
+        agg["outq_packets"] += snap["outq_packets"]
+        agg["outq_bytes"] += snap["outq_bytes"]
+        agg["outq_peak_bytes"] = max(agg["outq_peak_bytes"], snap["outq_peak_bytes"])
+        exec_agg, exec_snap = agg["exec_seconds"], snap["exec_seconds"]
+        for le, n in exec_snap["buckets"].items():
+            exec_agg["buckets"][le] += n
+        exec_agg["sum"] += exec_snap["sum"]
+        exec_agg["count"] += exec_snap["count"]
+        for ch, ch_snap in snap["channels"].items():
+            ch_agg = agg["channels"].get(ch, None)
+            if ch_agg is None:
+                agg["channels"][ch] = dict(ch_snap)
+                continue
+            ch_agg["published"] += ch_snap["published"]
+            ch_agg["publish_rate"] += ch_snap["publish_rate"]
+            ch_agg["subscribers"] += ch_snap["subscribers"]
+            ch_agg["subscriber_lag"] = max(
+                ch_agg["subscriber_lag"], ch_snap["subscriber_lag"]
+            )
+    for field in ("packets_in", "bytes_in", "packets_out", "bytes_out"):
+        agg[field] = dict(agg[field])
+    agg["exec_seconds"]["buckets"] = dict(agg["exec_seconds"]["buckets"])
+    return agg
+
+
+def counterMetrics(snapshot: dict) -> dict:
+    """
+    Keep only the counters and peaks of a snapshot, with gauges reset
+
+    This is for the last snapshot of a peer disconnected, to be aggregated
+    with those of live peers, so counters stay monotonic as peers come and
+    go, while gauges reflect live peers only.
+    """
+    return dict(
+        snapshot,
+        outq_packets=0,
+        outq_bytes=0,
+        channels={
+            ch: dict(ch_snap, publish_rate=0.0, subscribers=0, subscriber_lag=0)
+            for ch, ch_snap in snapshot["channels"].items()
+        },
+    )
+
+
+def _label_value(v: object) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Dict[str, object]) -> str:
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{_label_value(v)}"' for name, v in labels.items())
+        + "}"
+    )
+
+
+def prometheusText(
+    snapshot: dict, labels: Optional[Dict[str, object]] = None, prefix: str = "nedh"
+) -> str:
+    """
+    Render a metrics snapshot in Prometheus text exposition format
+
+    `labels` are attached to every sample, e.g. to identify the process.
+    """
+    labels = labels or {}
+    lines = []
+
+    def metric(name: str, kind: str, help_: str):
+        lines.append(f"# HELP {prefix}_{name} {help_}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+    def sample(name: str, value: object, **extra):
+        lines.append(f"{prefix}_{name}{_labels({**labels, **extra})} {value!r}")
+
+    for field, help_ in (
+        ("packets_in", "Packets received, by directive."),
+        ("bytes_in", "Payload bytes received, by directive."),
+        ("packets_out", "Packets posted, by directive."),
+        ("bytes_out", "Payload bytes posted, by directive."),
+    ):
+        metric(f"{field}_total", "counter", help_)
+        for key, n in snapshot[field].items():
+            sample(f"{field}_total", n, directive=key)
+
+    for field, help_ in (
+        ("outq_packets", "Packets queued for outgoing."),
+        ("outq_bytes", "Bytes queued for outgoing."),
+        ("outq_peak_bytes", "Most bytes ever queued for outgoing."),
+    ):
+        metric(field, "gauge", help_)
+        sample(field, snapshot[field])
+
+    exec_snap = snapshot["exec_seconds"]
+    metric("exec_seconds", "histogram", "Evaluation time of commands.")
+    for le, n in exec_snap["buckets"].items():
+        sample("exec_seconds_bucket", n, le=le)
+    sample("exec_seconds_sum", exec_snap["sum"])
+    sample("exec_seconds_count", exec_snap["count"])
+
+    for field, kind, help_ in (
+        ("published", "counter", "Events published to the channel sink."),
+        ("publish_rate", "gauge", "Events published per second, recently."),
+        ("subscribers", "gauge", "Consumers streaming from the channel sink."),
+        ("subscriber_lag", "gauge", "Events not consumed yet by consumers."),
+    ):
+        name = f"channel_{field}_total" if kind == "counter" else f"channel_{field}"
+        metric(name, kind, help_)
+        for ch, ch_snap in snapshot["channels"].items():
+            sample(name, ch_snap[field], channel=ch)
+
+    lines.append("")
+    return "\n".join(lines)
+
+
+def writePrometheusFile(path: str, text: str):
+    """
+    Write metrics text to a file atomically, so a collector never reads a
+    partially written file
+    """
+    tmp_path = f"{path}.{os.getpid()!r}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
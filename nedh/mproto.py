@@ -2,8 +2,21 @@
 Micro Protocol that Nedh speaks
 
 """
-__all__ = ["Packet", "textPacket", "sendPacket", "receivePacketStream"]
+__all__ = [
+    "Packet",
+    "textPacket",
+    "batchPacket",
+    "unbatchPacket",
+    "sendPacket",
+    "sendPackets",
+    "pumpPackets",
+    "receivePacketStream",
+    "receivePacketBatches",
+    "PacketProtocol",
+]
 import asyncio
+import socket
+from collections import deque
 
 from typing import *
 
@@ -15,12 +28,46 @@ logger = get_logger(__name__)
 
 MAX_HEADER_LENGTH = 60
 
+# size of each receive buffer allocated by the zero-copy intake, a buffer
+# grows beyond this only to host a single payload larger than it
+INTAKE_BUFFER_SIZE = 256 * 1024
+
+# at most this many received packets, or this many bytes of their payloads,
+# can wait to be consumed, before the zero-copy intake stops reading the socket
+MAX_READY_PACKETS = 64
+MAX_READY_BYTES = 1024 * 1024
+
+# payloads up to this size are copied out of receive buffers, so a small
+# payload retained never pins a whole buffer, and it's plain bytes
+INTAKE_COPY_MAX = 16 * 1024
+
+# while reassembling a bulk packet, the socket is read at most this many bytes
+# at a time until the next part header is parsed, so only those bytes of a
+# part are copied, the rest is received right into the reassembly buffer
+ASSEMBLY_PEEK_SIZE = 4 * 1024
+
+# an outlet is drained only when its transport buffers more bytes than this
+OUTLET_HIGH_WATER = 1024 * 1024
+
+# payloads larger than this are written on their own, never joined with
+# other outgoing bytes, to avoid copying them
+COALESCE_MAX_PAYLOAD = 64 * 1024
+
 
 PacketDirective = str
-PacketPayload = bytes
+PacketPayload = Union[bytes, memoryview]
 
 
 class Packet(NamedTuple):
+    """
+    A packet, with its payload as `bytes`, or as a `memoryview` when received
+    without copying, i.e. larger than `INTAKE_COPY_MAX` bytes
+
+    Decode a payload with `str(payload, "utf-8")`, or take `bytes(payload)`
+    to retain it, as `memoryview` has no `.decode()`, and a view retained
+    keeps its whole receive buffer alive.
+    """
+
     dir: PacketDirective
     payload: PacketPayload
 
@@ -39,20 +86,176 @@ async def sendPacket(
     pkt_len = len(pkt.payload)
     pkt_hdr = f"[{pkt_len!r}#{pkt.dir!s}]"
     if len(pkt_hdr) > MAX_HEADER_LENGTH:
-        raise EdhPeerError(self.peer_site, "sending out long packet header")
-    outlet = outlet
+        raise EdhPeerError(peer_site, "sending out long packet header")
     await outlet.drain()
     outlet.write(pkt_hdr.encode("utf-8"))
     outlet.write(pkt.payload)
 
 
+async def sendPackets(
+    peer_site: str,
+    outlet: asyncio.StreamWriter,
+    pkts: Iterable[Packet],
+    high_water: int = OUTLET_HIGH_WATER,
+):
+    """
+    Send out multiple packets with vectored writes
+
+    Headers and small payloads are coalesced into a single `writelines()`,
+    and the outlet is drained only when buffering over the high-water mark,
+    or when it's closing, so writes to a lost connection raise.
+    """
+    bufs = []
+    for pkt in pkts:
+        pkt_len = len(pkt.payload)
+        pkt_hdr = f"[{pkt_len!r}#{pkt.dir!s}]"
+        if len(pkt_hdr) > MAX_HEADER_LENGTH:
+            raise EdhPeerError(peer_site, "sending out long packet header")
+        bufs.append(pkt_hdr.encode("utf-8"))
+        if pkt_len > COALESCE_MAX_PAYLOAD:
+            outlet.writelines(bufs)
+            bufs = []
+            outlet.write(pkt.payload)
+        elif pkt_len > 0:
+            bufs.append(pkt.payload)
+    if bufs:
+        outlet.writelines(bufs)
+    if outlet.is_closing() or outlet.transport.get_write_buffer_size() > high_water:
+        await outlet.drain()
+
+
+async def pumpPackets(
+    peer_site: str,
+    outlet: asyncio.StreamWriter,
+    poq: asyncio.Queue,
+    eos: asyncio.Future,
+    high_water: int = OUTLET_HIGH_WATER,
+    sent: Optional[Callable[[List[Packet]], List[Packet]]] = None,
+):
+    """
+    Send out packets from the outgoing queue until eos
+
+    Packets already in the queue are sent out together with a single
+    `sendPackets()` call, instead of awaiting per packet, up to the
+    high-water mark in bytes per call, so packets queued meanwhile (e.g.
+    control ones overtaking bulk ones) won't wait for a huge batch.
+
+    `sent` is called with each batch of packets before sending them out, it
+    returns the packets to send actually.
+    """
+    while not eos.done():
+        if poq.empty():
+            pkt = await read_stream(eos, poq.get())
+            if pkt is EndOfStream:
+                break
+            pkts = [pkt]
+            batch_bytes = len(pkt.payload)
+        else:
+            pkts = []
+            batch_bytes = 0
+        while batch_bytes < high_water and not poq.empty():
+            pkt = poq.get_nowait()
+            pkts.append(pkt)
+            batch_bytes += len(pkt.payload)
+        if sent is not None:
+            pkts = sent(pkts)
+        await sendPackets(peer_site, outlet, pkts, high_water)
+
+
 PacketSink = Callable[[Packet], Awaitable]
+PacketBatchSink = Callable[[List[Packet]], Awaitable]
+
+# header of the packet whose payload is not fully received yet
+PendingHeader = Optional[Tuple[int, PacketDirective]]
+
+
+def parsePackets(
+    peer_site: str,
+    view: memoryview,
+    rpos: int,
+    wpos: int,
+    pending: PendingHeader,
+    pkts: List[Packet],
+) -> Tuple[int, PendingHeader]:
+    """
+    Parse all complete packets from `view[rpos:wpos]` in one pass
+
+    Packets parsed are appended to `pkts`, with slices of `view` as their
+    payloads, or copies of them up to `INTAKE_COPY_MAX` bytes. The position
+    of first unparsed byte is returned, together with the header of a
+    packet whose payload is not fully available yet.
+    """
+    while True:
+        if pending is None:
+            if rpos >= wpos:
+                break
+            if 0x5B != view[rpos]:  # b"["
+                logger.error(f"readahead: {bytes(view[rpos:wpos])!r}")
+                raise EdhPeerError(peer_site, "missing packet header")
+            # search the view itself, it can be a slice of its underlying
+            # object, and a header is never longer than the max
+            hdr_end_pos = bytes(
+                view[rpos : min(wpos, rpos + MAX_HEADER_LENGTH)]
+            ).find(b"]")
+            if hdr_end_pos < 0:
+                if wpos - rpos >= MAX_HEADER_LENGTH:
+                    raise EdhPeerError(peer_site, "packet header too long")
+                break
+            hdr_end_pos += rpos
+            # got a full packet header
+            hdr = str(view[rpos + 1 : hdr_end_pos], "utf-8")
+            rpos = hdr_end_pos + 1
+            plls, dir_ = hdr.split("#", 1)
+            pending = int(plls), dir_
+        payload_len, dir_ = pending
+        if wpos - rpos < payload_len:
+            break
+        if payload_len > INTAKE_COPY_MAX:
+            payload = view[rpos : rpos + payload_len]
+        elif payload_len > 0:
+            payload = bytes(view[rpos : rpos + payload_len])
+        else:
+            payload = b""
+        rpos += payload_len
+        pending = None
+        pkts.append(Packet(dir_, payload))
+    return rpos, pending
+
+
+def batchPacket(peer_site: str, pkts: Sequence[Packet]) -> Packet:
+    """
+    Pack multiple packets into a single packet, with directive `batch:<n>`
+
+    The payload carries the packets framed exactly as on the wire.
+    """
+    bufs = []
+    for pkt in pkts:
+        pkt_hdr = f"[{len(pkt.payload)!r}#{pkt.dir!s}]"
+        if len(pkt_hdr) > MAX_HEADER_LENGTH:
+            raise EdhPeerError(peer_site, "sending out long packet header")
+        bufs.append(pkt_hdr.encode("utf-8"))
+        bufs.append(pkt.payload)
+    return Packet(f"batch:{len(pkts)!r}", b"".join(bufs))
+
+
+def unbatchPacket(peer_site: str, payload: PacketPayload) -> List[Packet]:
+    """
+    Unpack packets from the payload of a `batch:` packet
+    """
+    pkts = []
+    rpos, pending = parsePackets(
+        peer_site, memoryview(payload), 0, len(payload), None, pkts
+    )
+    if pending is not None or rpos != len(payload):
+        raise EdhPeerError(peer_site, "partial packet in batch")
+    return pkts
+
 
 # as Python lacks tail-call-optimization, looping within (async) generator
 # is used here instead of tail recursion
 async def receivePacketStream(
     peer_site: str,
-    intake: asyncio.StreamReader,
+    intake: Union[asyncio.StreamReader, "PacketProtocol"],
     pkt_sink: PacketSink,
     eos: asyncio.Future,
 ):
@@ -63,57 +266,529 @@ async def receivePacketStream(
     appropriate, but only after eos is signaled.
     """
 
-    readahead = b""
+    async def batch_sink(pkts: List[Packet]):
+        for pkt in pkts:
+            await pkt_sink(pkt)
 
-    async def parse_hdr():
-        nonlocal readahead
-        while True:
-            if len(readahead) < 1:
-                readahead = await read_stream(eos, intake.read(MAX_HEADER_LENGTH))
-                if readahead is EndOfStream:
-                    return EndOfStream  # reached end-of-stream
-                if not readahead:
-                    return EndOfStream  # reached end-of-stream
-            if b"["[0] != readahead[0]:
-                logger.error(f"readahead: {readahead!r}")
-                raise EdhPeerError(peer_site, "missing packet header")
-            hdr_end_pos = readahead.find(b"]")
-            if hdr_end_pos < 0:
-                readmore = await read_stream(eos, intake.read(MAX_HEADER_LENGTH))
-                if readmore is EndOfStream:
-                    raise RuntimeError("premature end of packet stream")
-                readahead += readmore
-                continue
-            # got a full packet header
-            hdr = readahead[1:hdr_end_pos].decode("utf-8")
-            readahead = readahead[hdr_end_pos + 1 :]
-            plls, dir_ = hdr.split("#", 1)
-            payload_len = int(plls)
-            return payload_len, dir_
+    await receivePacketBatches(peer_site, intake, batch_sink, eos)
+
+
+async def receivePacketBatches(
+    peer_site: str,
+    intake: Union[asyncio.StreamReader, "PacketProtocol"],
+    batch_sink: PacketBatchSink,
+    eos: asyncio.Future,
+    chunk_size: int = INTAKE_BUFFER_SIZE,
+):
+    """
+    Receive all packets being streamed to the specified intake stream, in
+    batches
+
+    The intake stream is read in big chunks, every complete packet in a
+    chunk is parsed in one pass, then they go to the sink as a batch.
 
+    The caller is responsible to close the intake/outlet streams anyway
+    appropriate, but only after eos is signaled.
+    """
+    if isinstance(intake, PacketProtocol):
+        return await intake.receive_batches(peer_site, batch_sink, eos)
+
+    readahead = b""
+    pending = None
     try:
         while True:
-            hdr = await parse_hdr()
-            if hdr is EndOfStream:  # normal eos, try mark and done
+            if pending is not None:
+                more2read = pending[0] - len(readahead)
+                if more2read > chunk_size:
+                    # a large payload, read all the rest of it at once
+                    more_payload = await read_stream(
+                        eos, intake.readexactly(more2read)
+                    )
+                    if more_payload is EndOfStream:
+                        raise RuntimeError("premature end of packet stream")
+                    if readahead:
+                        more_payload = b"".join((readahead, more_payload))
+                    readahead = b""
+                    await batch_sink([Packet(pending[1], more_payload)])
+                    pending = None
+                    continue
+
+            chunk = await read_stream(eos, intake.read(chunk_size))
+            if chunk is EndOfStream or not chunk:  # reached end-of-stream
+                if readahead or pending is not None:
+                    raise RuntimeError("premature end of packet stream")
+                # normal eos, try mark and done
                 if not eos.done():
                     eos.set_result(EndOfStream)
                 break
+            if readahead:
+                chunk = b"".join((readahead, chunk))
 
-            payload_len, dir_ = hdr
-            more2read = payload_len - len(readahead)
-            if more2read == 0:
-                payload = readahead
-                readahead = b""
-            elif more2read > 0:
-                more_payload = await read_stream(eos, intake.readexactly(more2read))
-                if more_payload is EndOfStream:
-                    raise RuntimeError("premature end of packet stream")
-                payload = readahead + more_payload
-                readahead = b""
-            else:  # readahead contains more than this packet
-                payload = readahead[:more2read]
-                readahead = readahead[more2read:]
-            await pkt_sink(Packet(dir_, payload))
+            pkts = []
+            view = memoryview(chunk)
+            rpos, pending = parsePackets(
+                peer_site, view, 0, len(chunk), pending, pkts
+            )
+            # only a partial packet can be left here, copy it out so the
+            # chunk is never resized while referenced by payloads
+            readahead = bytes(view[rpos:])
+            if pkts:
+                await batch_sink(pkts)
     except Exception as exc:
         if not eos.done():
             eos.set_exception(exc)
+
+
+class PacketProtocol(asyncio.BufferedProtocol):
+    """
+    Zero-copy packet intake, also serving as the outlet of a connection
+
+    The socket is read directly into growable receive buffers, each packet
+    received gets a `memoryview` slice of the buffer as its payload, so
+    large payloads are never copied in Python. Small payloads are copied
+    out as `bytes`, see `Packet`.
+
+    A buffer is never reused once any slice of it has been handed out, it
+    stays alive until all packets referencing it are released.
+
+    Reading the socket pauses once packets ready exceed `max_ready` in
+    number, or `max_ready_bytes` in payload bytes, and resumes only after
+    the sink took them, so a stalled consumer holds about that much.
+
+    With `urgent` set, it's called with each packet right as parsed, and a
+    packet it returns True for is consumed there, never queued behind
+    packets received before it, e.g. heartbeats, see `Peer.handle_urgent()`.
+
+    Parts of a bulk packet (see `hastalk.nedh.pktq`) are received into a
+    single buffer of the total payload size, then handed out as the bulk
+    header followed by a single part, so the receiving peer gets the
+    reassembled payload without copying.
+
+    The outlet part mimics `asyncio.StreamWriter` as far as `sendPacket()`
+    and the connection lifecycle need.
+    """
+
+    def __init__(
+        self,
+        on_connected: Optional[Callable[["PacketProtocol"], Any]] = None,
+        buffer_size: int = INTAKE_BUFFER_SIZE,
+        max_ready: int = MAX_READY_PACKETS,
+        max_ready_bytes: int = MAX_READY_BYTES,
+    ):
+        self.on_connected = on_connected
+        self.buffer_size = buffer_size
+        self.max_ready = max_ready
+        self.max_ready_bytes = max_ready_bytes
+
+        self.transport = None
+        self.peer_site = "<some-peer>"
+        # called with each packet parsed, those it returns True for consumed
+        self.urgent: Optional[Callable[[Packet], bool]] = None
+
+        # intake state
+        self._buf = bytearray(buffer_size)
+        self._view = memoryview(self._buf)
+        self._rpos = 0  # start of unparsed bytes
+        self._wpos = 0  # end of received bytes
+        self._pending = None  # ( payload_len, dir_ ) after a header parsed
+        self._exported = False  # any slice of current buffer handed out
+        # ( bulk header packet, payload buffer, bytes filled ) of the bulk
+        # packet being reassembled
+        self._assembling: Optional[Tuple[Packet, memoryview, int]] = None
+        # bytes of the current part yet to be received into the buffer above
+        self._part_left = 0
+        self._ready = deque()
+        # bytes of payloads of the packets ready
+        self._ready_bytes = 0
+        self._waiter = None
+        self._reading_paused = False
+        # duplicate of the socket, watched for hangup while intake paused
+        self._hangup_watch: Optional[socket.socket] = None
+        self._eof = False
+        self._exc = None
+
+        # outlet state
+        self._writing_paused = False
+        self._drain_waiters = deque()
+        self._closed = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        peer_name = transport.get_extra_info("peername", "<some-peer>")
+        if not peer_name:  # a unix socket connection accepted by a server
+            peer_name = f"unix:{transport.get_extra_info('sockname', '')!s}"
+        self.peer_site = str(peer_name)
+        self._closed = asyncio.get_running_loop().create_future()
+        if self.on_connected is not None:
+            self.on_connected(self)
+
+    def connection_lost(self, exc):
+        self._unwatch_hangup()
+        self._eof = True
+        if exc is not None and self._exc is None:
+            self._exc = exc
+        self._wakeup()
+
+        for waiter in self._drain_waiters:
+            if not waiter.done():
+                if exc is None:
+                    waiter.set_result(None)
+                else:
+                    waiter.set_exception(exc)
+        self._drain_waiters.clear()
+
+        if self._closed is not None and not self._closed.done():
+            self._closed.set_result(None)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        if self._part_left > 0:
+            # receive the rest of the part right into the reassembly buffer
+            _hdr_pkt, payload, filled = self._assembling
+            return payload[filled : filled + self._part_left]
+        buf_cap = len(self._buf)
+        if self._pending is None:
+            # a full header should fit in the rest of current buffer
+            need_end = self._rpos + MAX_HEADER_LENGTH
+        else:
+            # the full pending payload should fit in current buffer
+            need_end = self._rpos + self._pending[0]
+        if need_end > buf_cap or self._wpos >= buf_cap:
+            self._relocate()
+        if self._assembling is not None and self._pending is None:
+            return self._view[self._wpos : self._wpos + ASSEMBLY_PEEK_SIZE]
+        return self._view[self._wpos :]
+
+    def _relocate(self):
+        """
+        Move unparsed bytes to the front of a buffer large enough
+
+        Only a partial header, or the partial payload of the single pending
+        packet, can ever be moved here.
+        """
+        unparsed = self._wpos - self._rpos
+        if self._pending is None:
+            need_cap = MAX_HEADER_LENGTH
+        else:
+            need_cap = self._pending[0]
+        if self._exported or need_cap > len(self._buf):
+            new_buf = bytearray(max(self.buffer_size, need_cap))
+            new_view = memoryview(new_buf)
+            new_view[:unparsed] = self._view[self._rpos : self._wpos]
+            self._buf, self._view = new_buf, new_view
+            self._exported = False
+        elif unparsed > 0:
+            self._view[:unparsed] = self._view[self._rpos : self._wpos]
+        self._rpos, self._wpos = 0, unparsed
+
+    def buffer_updated(self, nbytes: int):
+        try:
+            if self._part_left > 0:
+                self._part_left -= nbytes
+                hdr_pkt, payload, filled = self._assembling
+                n_ready = len(self._ready)
+                self._assembled(hdr_pkt, payload, filled + nbytes)
+                self._made_ready(n_ready)
+            else:
+                self._wpos += nbytes
+                self._parse_packets()
+        except Exception as exc:
+            self._exc = exc
+            self.transport.pause_reading()
+            self._reading_paused = True
+            self._wakeup()
+            return
+        if self._ready:
+            if self._over_ready() and not self._reading_paused:
+                self.transport.pause_reading()
+                self._reading_paused = True
+            self._wakeup()
+
+    def _over_ready(self) -> bool:
+        return (
+            len(self._ready) >= self.max_ready
+            or self._ready_bytes >= self.max_ready_bytes
+        )
+
+    def _parse_packets(self):
+        n_ready = len(self._ready)
+        rpos, self._pending = parsePackets(
+            self.peer_site,
+            self._view,
+            self._rpos,
+            self._wpos,
+            self._pending,
+            self._ready,
+        )
+        rpos = self._assemble(n_ready, rpos)
+        if self.urgent is not None:
+            self._take_urgent(n_ready)
+        self._made_ready(n_ready)
+        if rpos >= self._wpos and not self._exported:
+            rpos = self._wpos = 0  # reuse the buffer from its start
+        self._rpos = rpos
+
+    def _made_ready(self, n_ready: int):
+        # account packets ready from index `n_ready` on
+        exported = self._exported
+        for i in range(n_ready, len(self._ready)):
+            payload = self._ready[i].payload
+            self._ready_bytes += len(payload)
+            # the buffer can be reused only if no slice of it handed out
+            if not exported and isinstance(payload, memoryview):
+                exported = payload.obj is self._buf
+        self._exported = exported
+
+    def _take_urgent(self, n_ready: int):
+        ready, urgent = self._ready, self.urgent
+        for i in range(n_ready, len(ready)):
+            if urgent(ready[i]):
+                break
+        else:
+            return  # none urgent, the common case
+        rest = [ready.pop() for _ in range(len(ready) - i)]
+        rest.pop()  # the one consumed
+        rest.reverse()
+        ready.extend(pkt for pkt in rest if not urgent(pkt))
+
+    def _assemble(self, n_ready: int, rpos: int) -> int:
+        """
+        Reassemble bulk packets from packets just parsed, and start receiving
+        a pending part right into the reassembly buffer
+
+        The position of first unparsed byte is returned.
+        """
+        ready = self._ready
+        if self._assembling is None:
+            for i in range(n_ready, len(ready)):
+                if ready[i].dir.startswith("bulk:"):
+                    break
+            else:
+                return rpos  # no bulk packet, the common case
+        parsed = [ready.pop() for _ in range(len(ready) - n_ready)]
+        parsed.reverse()
+        for pkt in parsed:
+            if self._assembling is not None:
+                if pkt.dir.startswith("bulk:"):
+                    raise EdhPeerError(self.peer_site, "bulk packet interrupted")
+                if pkt.dir == "part:":
+                    hdr_pkt, payload, filled = self._assembling
+                    self._assembled(
+                        hdr_pkt, payload, self._fill(payload, filled, pkt.payload)
+                    )
+                    continue
+            elif pkt.dir.startswith("bulk:") and int(pkt.dir[5:]) > 0:
+                total = int(pkt.dir[5:])
+                self._assembling = pkt, memoryview(bytearray(total)), 0
+                continue
+            ready.append(pkt)
+
+        if self._pending is not None and self._assembling is not None:
+            payload_len, dir_ = self._pending
+            if dir_ == "part:":
+                # take the bytes of the part received so far, then the rest
+                # is received right into the reassembly buffer
+                hdr_pkt, payload, filled = self._assembling
+                received = self._view[rpos : self._wpos]
+                filled = self._fill(payload, filled, received, payload_len)
+                self._assembling = hdr_pkt, payload, filled
+                self._part_left = payload_len - len(received)
+                self._pending = None
+                rpos = self._wpos
+        return rpos
+
+    def _fill(
+        self,
+        payload: memoryview,
+        filled: int,
+        data: PacketPayload,
+        part_len: Optional[int] = None,
+    ) -> int:
+        if part_len is None:
+            part_len = len(data)
+        if filled + part_len > len(payload):
+            raise EdhPeerError(self.peer_site, "bulk parts overflow")
+        payload[filled : filled + len(data)] = data
+        return filled + len(data)
+
+    def _assembled(self, hdr_pkt: Packet, payload: memoryview, filled: int):
+        if filled < len(payload) or self._part_left > 0:
+            self._assembling = hdr_pkt, payload, filled
+            return
+        self._assembling = None
+        self._ready.append(hdr_pkt)
+        self._ready.append(Packet("part:", payload))
+
+    def eof_received(self):
+        self._eof = True
+        self._wakeup()
+        return False  # close the transport
+
+    def _wakeup(self):
+        waiter = self._waiter
+        if waiter is not None:
+            self._waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def receive(
+        self, peer_site: str, pkt_sink: PacketSink, eos: asyncio.Future,
+    ):
+        """
+        Pump all packets received by this protocol into the sink
+
+        This is the zero-copy counterpart of `receivePacketStream()` for
+        a `asyncio.StreamReader` as intake.
+        """
+
+        async def batch_sink(pkts: List[Packet]):
+            for pkt in pkts:
+                await pkt_sink(pkt)
+
+        await self.receive_batches(peer_site, batch_sink, eos)
+
+    async def receive_batches(
+        self, peer_site: str, batch_sink: PacketBatchSink, eos: asyncio.Future,
+    ):
+        """
+        Pump all packets received by this protocol into the sink, every
+        packet already received goes in a single batch
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                if self._ready:
+                    pkts = list(self._ready)
+                    self._ready.clear()
+                    self._ready_bytes = 0
+                    # read more only after the sink took these, so at most
+                    # the ready budget is held besides the sink's own budget
+                    await batch_sink(pkts)
+                    del pkts
+                    if (
+                        self._reading_paused
+                        and self._exc is None
+                        and not self._over_ready()
+                    ):
+                        self._reading_paused = False
+                        self.transport.resume_reading()
+                    continue
+                if self._exc is not None:
+                    raise self._exc
+                if self._eof:
+                    if (
+                        self._pending is not None
+                        or self._rpos < self._wpos
+                        or self._assembling is not None
+                    ):
+                        raise RuntimeError("premature end of packet stream")
+                    # normal eos, try mark and done
+                    if not eos.done():
+                        eos.set_result(EndOfStream)
+                    break
+                waiter = loop.create_future()
+                self._waiter = waiter
+                await asyncio.wait({eos, waiter}, return_when=asyncio.FIRST_COMPLETED)
+                if eos.done():
+                    break
+        except Exception as exc:
+            if not eos.done():
+                eos.set_exception(exc)
+
+    def pause_intake(self):
+        """
+        Stop reading the socket, before packets are pumped from this
+        protocol, e.g. while a server is not ready to serve the connection
+
+        The socket is still watched without taking any data from it, so the
+        connection gets closed once the remote side hung up meanwhile, until
+        the remote side sent anything.
+        """
+        if not self._reading_paused and self.transport is not None:
+            self.transport.pause_reading()
+            self._reading_paused = True
+            self._watch_hangup()
+
+    def _watch_hangup(self):
+        sock = self.transport.get_extra_info("socket")
+        if sock is None:
+            return
+        # a duplicate, as the socket of a transport can not be watched
+        peeker = socket.fromfd(sock.fileno(), sock.family, sock.type)
+        peeker.setblocking(False)
+
+        def readable():
+            try:
+                data = peeker.recv(1, socket.MSG_PEEK)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                data = b""
+            # no more to tell by peeking, once data arrived
+            self._unwatch_hangup()
+            if not data:
+                self.transport.close()
+
+        try:
+            asyncio.get_running_loop().add_reader(peeker.fileno(), readable)
+        except NotImplementedError:  # e.g. a proactor event loop
+            peeker.close()
+            return
+        self._hangup_watch = peeker
+
+    def _unwatch_hangup(self):
+        peeker = self._hangup_watch
+        if peeker is not None:
+            self._hangup_watch = None
+            asyncio.get_running_loop().remove_reader(peeker.fileno())
+            peeker.close()
+
+    def resume_intake(self):
+        self._unwatch_hangup()
+        if (
+            self._reading_paused
+            and self._exc is None
+            and not self._over_ready()
+        ):
+            self._reading_paused = False
+            self.transport.resume_reading()
+
+    def pause_writing(self):
+        self._writing_paused = True
+
+    def resume_writing(self):
+        self._writing_paused = False
+        for waiter in self._drain_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._drain_waiters.clear()
+
+    def write(self, data):
+        self.transport.write(data)
+
+    def writelines(self, list_of_data):
+        self.transport.writelines(list_of_data)
+
+    async def drain(self):
+        if self.transport.is_closing():
+            # yield to let connection_lost() be called, as StreamWriter does
+            await asyncio.sleep(0)
+            if self._eof and self._exc is not None:
+                raise self._exc
+            raise ConnectionResetError("Connection lost")
+        if not self._writing_paused:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._drain_waiters.append(waiter)
+        await waiter
+
+    def is_closing(self) -> bool:
+        return self.transport.is_closing()
+
+    def close(self):
+        self.transport.close()
+
+    async def wait_closed(self):
+        await self._closed
+
+    def get_extra_info(self, name, default=None):
+        return self.transport.get_extra_info(name, default)
@@ -0,0 +1,526 @@
+"""
+Multi-process Nedh server
+
+An `EdhServer` serves all its connections on one event loop, so it's capped
+at one core by the GIL. An `EdhMultiServer` runs the same service module in
+multiple worker processes instead, each with an `EdhServer` listening on the
+same port with `SO_REUSEPORT`, so the kernel spreads incoming connections
+over the workers, and throughput scales with cores.
+
+The supervisor, i.e. the process creating the `EdhMultiServer`, restarts
+workers died, publishes clients connected to any worker to its `clients`
+sink, and aggregates runtime metrics of all workers.
+
+Workers are spawned, not forked from the supervisor's event loop, so the
+service module, `init` and server options are imported or pickled into
+them, `init` has to be a module level function.
+
+"""
+__all__ = ["EdhMultiServer", "WorkerClient"]
+
+from typing import *
+import asyncio
+import multiprocessing
+import os
+import socket
+import time
+
+from ..edh import *
+from ..log import *
+
+from .metrics import *
+from .server import *
+from .server import serverMetricsText
+
+logger = get_logger(__name__)
+
+
+# default seconds to wait before restarting a died worker, doubled per
+# restart in a row up to the max
+RESTART_DELAY = 0.5
+RESTART_MAX_DELAY = 30.0
+
+# a worker lived this many seconds is not counted as dying in a row
+RESTART_RESET_SECS = 60.0
+
+# seconds to wait for workers to stop, before terminating them
+WORKER_STOP_SECS = 5.0
+
+
+class WorkerClient(NamedTuple):
+    """
+    A client connected to a worker, as published by an `EdhMultiServer`
+    """
+
+    worker: int
+    pid: int
+    ident: str
+
+
+class _Worker:
+    __slots__ = (
+        "index",
+        "process",
+        "conn",
+        "started",
+        "restarts",
+        "clients",
+        "metrics",
+        "ended_metrics",
+        "listening",
+    )
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[multiprocessing.process.BaseProcess] = None
+        # supervisor end of the pipe to the worker process
+        self.conn = None
+        self.started = 0.0
+        # restarts in a row
+        self.restarts = 0
+        # clients currently connected
+        self.clients: Set[WorkerClient] = set()
+        # last metrics snapshot reported
+        self.metrics: Optional[dict] = None
+        # counters last reported by previous processes of this worker, the
+        # process restarted counts from zero
+        self.ended_metrics: Optional[dict] = None
+        # resolved once the worker started listening for the first time
+        self.listening: Optional[asyncio.Future] = None
+
+
+class EdhMultiServer:
+    """
+    Nedh server of multiple worker processes, listening on TCP only, as
+    `SO_REUSEPORT` is not for unix domain sockets
+
+    Other keyword arguments are passed to the `EdhServer` of each worker,
+    they must be picklable, e.g. an `ExecPolicy` can not be shared across
+    workers this way. Limits like `max_connections` apply per worker.
+    """
+
+    def __init__(
+        self,
+        service_modu: str,
+        server_addr: str = "127.0.0.1",
+        server_port: int = 3721,
+        workers: Optional[int] = None,
+        init: Optional[Callable] = None,
+        clients: Optional[EventSink] = None,
+        net_opts: Optional[Dict] = None,
+        metrics_file: Optional[str] = None,
+        metrics_interval: float = 10.0,
+        restart_delay: float = RESTART_DELAY,
+        restart_max_delay: float = RESTART_MAX_DELAY,
+        **server_opts,
+    ):
+        if server_addr.startswith("unix:"):
+            raise ValueError("Multi-process server can not listen on unix socket")
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError(f"Invalid number of workers: {workers!r}")
+        loop = asyncio.get_running_loop()
+        self.service_modu = service_modu
+        self.server_addr = server_addr
+        self.server_port = server_port
+        self.init = init
+        self.clients = clients or EventSink()
+        self.net_opts = net_opts or {}
+        # metrics of all workers are written to this file periodically, in
+        # Prometheus text format, if given, workers report at this interval
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        self.restart_delay = restart_delay
+        self.restart_max_delay = restart_max_delay
+        self.server_opts = server_opts
+
+        # resolved with the ( address, port ) listened on, once all workers
+        # started listening
+        self.server_addrs = loop.create_future()
+        self.eol = loop.create_future()
+        self.workers = [_Worker(i) for i in range(workers)]
+        self._mp = multiprocessing.get_context("spawn")
+        # bound but not listening, to reserve a port for the workers, when
+        # asked to listen on an arbitrary port
+        self._port_sock: Optional[socket.socket] = None
+
+        def server_cleanup(svr_fut):
+            self.clients.publish(EndOfStream)
+
+            if not self.server_addrs.done():
+                self.server_addrs.set_result([])
+
+            if self.eol.done():
+                return
+
+            if svr_fut.cancelled():
+                self.eol.set_exception(asyncio.CancelledError())
+                return
+            exc = svr_fut.exception()
+            if exc is not None:
+                self.eol.set_exception(exc)
+            else:
+                self.eol.set_result(None)
+
+        self._supervisor = asyncio.create_task(self._supervisor_thread())
+        self._supervisor.add_done_callback(server_cleanup)
+
+    def __repr__(self):
+        return (
+            f"EdhMultiServer({self.service_modu!r}, {self.server_addr!r},"
+            f" {self.server_port!r}, workers={len(self.workers)!r})"
+        )
+
+    def __await__(self):
+        yield from self.server_addrs
+        return self
+
+    async def join(self):
+        try:
+            await self.eol
+        finally:
+            # workers are stopped by the supervisor after end-of-life
+            await asyncio.wait({self._supervisor})
+
+    def stop(self):
+        if not self.eol.done():
+            self.eol.set_result(None)
+
+    @property
+    def connected(self) -> Set[WorkerClient]:
+        """
+        Clients currently connected to any worker
+        """
+        return set().union(*(w.clients for w in self.workers))
+
+    def metrics_snapshot(self) -> dict:
+        """
+        Take a snapshot of runtime metrics aggregated over all workers, as
+        last reported by them, see `hastalk.nedh.metrics`
+
+        Counters include those of worker processes died, as last reported,
+        so they stay monotonic across restarts of workers.
+        """
+        snaps = [w.metrics for w in self.workers if w.metrics is not None]
+        snaps.extend(w.ended_metrics for w in self.workers if w.ended_metrics)
+        snap = aggregateMetrics(snaps)
+        snap["peers"] = sum(s["peers"] for s in snaps)
+        admission = {"accepted": 0, "rejected": 0, "queued": 0, "shed": 0}
+        for worker_snap in snaps:
+            for key, n in worker_snap.get("admission", {}).items():
+                admission[key] = admission.get(key, 0) + n
+        snap["admission"] = admission
+        snap["workers"] = sum(
+            1 for w in self.workers if w.process is not None and w.process.is_alive()
+        )
+        return snap
+
+    async def _supervisor_thread(self):
+        loop = asyncio.get_running_loop()
+        port = self.server_port
+        if port == 0:
+            sock = socket.socket(
+                socket.AF_INET6 if ":" in self.server_addr else socket.AF_INET
+            )
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((self.server_addr, 0))
+            self._port_sock = sock
+            port = sock.getsockname()[1]
+
+        try:
+            for worker in self.workers:
+                worker.listening = loop.create_future()
+                self._start_worker(worker, port)
+            all_listening = asyncio.gather(*(w.listening for w in self.workers))
+            await asyncio.wait(
+                [all_listening, self.eol], return_when=asyncio.FIRST_COMPLETED
+            )
+            if not all_listening.done():  # stopped meanwhile
+                all_listening.cancel()
+                return
+            all_listening.result()  # raise if any worker failed listening
+            if not self.server_addrs.done():
+                self.server_addrs.set_result([(self.server_addr, port)])
+            if self.metrics_file is not None:
+                asyncio.create_task(self._metrics_thread())
+            try:
+                await self.eol
+            except:
+                pass
+        finally:
+            for worker in self.workers:
+                self._stop_worker(worker)
+            await self._join_workers()
+            if self._port_sock is not None:
+                self._port_sock.close()
+                self._port_sock = None
+
+    def _start_worker(self, worker: _Worker, port: int):
+        loop = asyncio.get_running_loop()
+        conn, worker_conn = self._mp.Pipe()
+        process = self._mp.Process(
+            target=_worker_main,
+            name=f"nedh-worker-{worker.index}",
+            args=(
+                worker.index,
+                worker_conn,
+                self.service_modu,
+                self.server_addr,
+                port,
+                self.init,
+                self.net_opts,
+                self.metrics_interval,
+                self.server_opts,
+            ),
+            daemon=True,
+        )
+        process.start()
+        worker_conn.close()
+        worker.process = process
+        worker.conn = conn
+        worker.started = time.monotonic()
+        worker.metrics = None
+
+        def worker_reported():
+            try:
+                while conn.poll():
+                    self._worker_event(worker, conn.recv())
+            except (EOFError, OSError):
+                loop.remove_reader(conn.fileno())
+
+        def worker_died():
+            loop.remove_reader(process.sentinel)
+            self._worker_died(worker, port)
+
+        loop.add_reader(conn.fileno(), worker_reported)
+        loop.add_reader(process.sentinel, worker_died)
+
+    def _worker_event(self, worker: _Worker, event: tuple):
+        kind = event[0]
+        listening = worker.listening
+        if kind == "connected":
+            client = WorkerClient(worker.index, worker.process.pid, event[1])
+            worker.clients.add(client)
+            self.clients.publish(client)
+        elif kind == "disconnected":
+            worker.clients.discard(
+                WorkerClient(worker.index, worker.process.pid, event[1])
+            )
+        elif kind == "metrics":
+            worker.metrics = event[1]
+        elif kind == "listening":
+            logger.info(f"Nedh worker {worker.index} listening at {event[1]!s}")
+            if listening is not None and not listening.done():
+                listening.set_result(event[1])
+        elif kind == "failed":
+            logger.error(f"Nedh worker {worker.index} failed: {event[1]!s}")
+            if listening is not None and not listening.done():
+                listening.set_exception(RuntimeError(event[1]))
+
+    def _worker_died(self, worker: _Worker, port: int):
+        loop = asyncio.get_running_loop()
+        process, conn = worker.process, worker.conn
+        try:
+            loop.remove_reader(conn.fileno())
+        except (ValueError, OSError):
+            pass
+        conn.close()
+        process.join()
+        worker.clients.clear()
+        if worker.metrics is not None:
+            worker.ended_metrics = _ended_counters(
+                worker.ended_metrics, worker.metrics
+            )
+        worker.metrics = None
+        if worker.listening is not None and not worker.listening.done():
+            worker.listening.set_exception(
+                RuntimeError(
+                    f"Nedh worker {worker.index} died with exit code"
+                    f" {process.exitcode!r} before listening"
+                )
+            )
+            return  # not to restart a worker never started working
+        if self.eol.done():
+            return
+
+        if time.monotonic() - worker.started >= RESTART_RESET_SECS:
+            worker.restarts = 0
+        delay = min(
+            self.restart_delay * (2 ** worker.restarts), self.restart_max_delay
+        )
+        worker.restarts += 1
+        logger.warning(
+            f"Nedh worker {worker.index} died with exit code {process.exitcode!r},"
+            f" restarting in {delay:.1f}s"
+        )
+
+        def restart():
+            if not self.eol.done():
+                self._start_worker(worker, port)
+
+        loop.call_later(delay, restart)
+
+    def _stop_worker(self, worker: _Worker):
+        process = worker.process
+        if process is None or not process.is_alive():
+            return
+        try:
+            worker.conn.send(("stop",))
+        except (OSError, ValueError):
+            process.terminate()
+
+    async def _join_workers(self):
+        # give workers a while to close their connections, then terminate
+        deadline = time.monotonic() + WORKER_STOP_SECS
+        while time.monotonic() < deadline:
+            if not any(
+                w.process is not None and w.process.is_alive() for w in self.workers
+            ):
+                return
+            await asyncio.sleep(0.05)
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                logger.warning(f"Terminating Nedh worker {worker.index}")
+                worker.process.terminate()
+
+    async def _metrics_thread(self):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    asyncio.shield(self.eol), timeout=self.metrics_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            except:
+                return
+            else:
+                return
+            try:
+                writePrometheusFile(
+                    self.metrics_file, serverMetricsText(self.metrics_snapshot())
+                )
+            except OSError:
+                logger.warning(
+                    f"Failed writing metrics to {self.metrics_file!s}", exc_info=True
+                )
+
+
+def _worker_main(
+    index: int,
+    conn,
+    service_modu: str,
+    server_addr: str,
+    server_port: int,
+    init: Optional[Callable],
+    net_opts: Dict,
+    metrics_interval: float,
+    server_opts: Dict,
+):
+    try:
+        asyncio.run(
+            _worker_serve(
+                conn,
+                service_modu,
+                server_addr,
+                server_port,
+                init,
+                net_opts,
+                metrics_interval,
+                server_opts,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+    except Exception as exc:
+        logger.error(f"Nedh worker {index} failed", exc_info=True)
+        try:
+            conn.send(("failed", f"{type(exc).__name__}: {exc!s}"))
+        except OSError:
+            pass
+        raise SystemExit(1)
+
+
+def _ended_counters(ended: Optional[dict], snap: dict) -> dict:
+    # counters of a worker's last report, added to those of its processes
+    # died before, with gauges reset
+    counters = aggregateMetrics(
+        (counterMetrics(snap),) if ended is None else (ended, counterMetrics(snap))
+    )
+    counters["peers"] = 0
+    admission = dict(snap.get("admission", {}), queued=0)
+    if ended is not None:
+        for key, n in ended["admission"].items():
+            admission[key] = admission.get(key, 0) + n
+    counters["admission"] = admission
+    return counters
+
+
+async def _worker_serve(
+    conn,
+    service_modu: str,
+    server_addr: str,
+    server_port: int,
+    init: Optional[Callable],
+    net_opts: Dict,
+    metrics_interval: float,
+    server_opts: Dict,
+):
+    loop = asyncio.get_running_loop()
+    clients = EventSink()
+
+    def report(*event):
+        try:
+            conn.send(event)
+        except OSError:
+            pass  # the supervisor is gone, it's stopping anyway
+
+    async def report_clients():
+        async for peer in clients.stream():
+            if peer is None:  # no client connected before
+                continue
+            ident = str(peer.ident)
+            report("connected", ident)
+            peer.eol.add_done_callback(
+                lambda _eol, ident=ident: report("disconnected", ident)
+            )
+
+    asyncio.create_task(report_clients())
+    await asyncio.sleep(0)  # let the reporter subscribe
+
+    server = await EdhServer(
+        service_modu,
+        server_addr,
+        server_port,
+        init=init,
+        clients=clients,
+        net_opts={**net_opts, "reuse_port": True},
+        **server_opts,
+    )
+    if not server.server_sockets.result():
+        await server.join()  # reraise the error failed listening
+        return
+    report(
+        "listening", [sock.getsockname() for sock in server.server_sockets.result()]
+    )
+
+    # stop on request from the supervisor, or on its death
+    def supervisor_said():
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            msg = ("stop",)
+        if msg[0] == "stop":
+            loop.remove_reader(conn.fileno())
+            server.stop()
+
+    loop.add_reader(conn.fileno(), supervisor_said)
+
+    while True:
+        try:
+            await asyncio.wait_for(asyncio.shield(server.eol), timeout=metrics_interval)
+        except asyncio.TimeoutError:
+            pass
+        else:
+            return
+        report("metrics", server.metrics_snapshot())
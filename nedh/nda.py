@@ -0,0 +1,88 @@
+"""
+NumPy ndarray transport over blob packets
+
+An array is sent as a single packet with its raw data as payload, and the
+directive in the form of:
+
+    nda:<dtype>:<shape>:<order>:<channel directive>
+
+e.g. `nda:<f8:1000,3:C:'data'`, the receiving side wraps the payload with
+`np.frombuffer()` without copying it, as a read-only array. The unit of a
+datetime64 or timedelta64 dtype follows a slash instead of in brackets, e.g.
+`<M8/ns`, as a `]` would end the packet header.
+
+NumPy is imported lazily, it's only required when arrays are transported.
+
+"""
+__all__ = ["arrayPacket", "unpackArray"]
+
+from typing import *
+
+from ..log import *
+
+from .mproto import *
+from .mproto import MAX_HEADER_LENGTH
+
+logger = get_logger(__name__)
+
+
+def arrayPacket(dir_: str, arr: "np.ndarray") -> Packet:
+    """
+    Make a packet carrying an ndarray, without copying its data if it's
+    contiguous in either C or Fortran order
+
+    Note the directive has to fit in the packet header, which limits the
+    number of dimensions an array can have, `ValueError` is raised for an
+    array not fitting.
+    """
+    import numpy as np
+
+    arr = np.asanyarray(arr)
+    dt = arr.dtype
+    if dt.hasobject or dt.fields is not None or dt.subdtype is not None:
+        raise TypeError(f"Can not transport array of dtype {dt!r}")
+    # e.g. `<M8[ns]` to `<M8/ns`
+    dt_str = dt.str.replace("[", "/").rstrip("]")
+    if "]" in dt_str or ":" in dt_str:
+        raise TypeError(f"Can not transport array of dtype {dt!r}")
+    if arr.flags.c_contiguous:
+        order, flat = "C", arr.reshape(-1)
+    elif arr.flags.f_contiguous:
+        order, flat = "F", arr.reshape(-1, order="F")
+    else:
+        order, flat = "C", np.ascontiguousarray(arr).reshape(-1)
+    shape = ",".join(str(dim) for dim in arr.shape)
+    pkt_dir = f"nda:{dt_str}:{shape}:{order}:{dir_!s}"
+    if len(f"[{arr.nbytes!r}#{pkt_dir}]") > MAX_HEADER_LENGTH:
+        raise ValueError(
+            f"Array of shape {arr.shape!r} to {dir_!s} does not fit in packet header"
+        )
+    return Packet(pkt_dir, memoryview(flat.view(np.uint8)))
+
+
+def unpackArray(
+    meta: str, payload: Union[bytes, memoryview]
+) -> Tuple["np.ndarray", str]:
+    """
+    Wrap the payload as an ndarray, return it with the channel directive
+
+    `meta` is the packet directive with the `nda:` prefix stripped.
+
+    The array is always read-only, whether it wraps the payload or a copy of
+    it, take a `.copy()` to modify it.
+    """
+    import numpy as np
+
+    dt, shape, order, ch_dir = meta.split(":", 3)
+    if "/" in dt:  # datetime64 or timedelta64 with unit
+        dt = dt.replace("/", "[") + "]"
+    shape = tuple(int(dim) for dim in shape.split(",")) if shape else ()
+    arr = np.frombuffer(payload, dtype=np.dtype(dt)).reshape(shape, order=order)
+    if not arr.flags.aligned:
+        # small payloads can land unaligned in a shared receive buffer, copy
+        # them for efficient computation
+        arr = arr.copy(order=order)
+    # read-only whatever the payload is, a bytes payload makes a read-only
+    # array but a memoryview one a writable array
+    arr.flags.writeable = False
+    return arr, ch_dir
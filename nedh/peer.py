@@ -2,22 +2,51 @@
 Nedh Peer Interface
 
 """
-__all__ = ["Peer"]
+__all__ = ["Peer", "SubPeer"]
 
 from typing import *
 import asyncio
 
 import inspect
+import threading
+import time
 import ast
+from collections import OrderedDict
+from types import CodeType
 
 from ..edh import *
 from ..log import *
 
+from .bindata import *
+from .blob import *
+from .blob import BLOB_CHUNK_SIZE, BlobSource, blobChunks, isBlobFile
+from .credit import *
+from .credit import CREDIT_WINDOW
+from .heartbeat import *
+from .heartbeat import HEARTBEAT_INTERVAL, HEARTBEAT_MISSES
+from .metrics import *
 from .mproto import *
+from .mproto import PacketSink
+from .nda import *
+from .pktq import *
+from .pktq import INQ_HIGH_WATER
+from .replay import *
+from .shmring import *
+from .shmring import SHM_MIN_PAYLOAD, SHM_RING_SIZE
 
 logger = get_logger(__name__)
 
 
+# at most this many directives are remembered by a peer's routing table
+MAX_ROUTES = 1024
+
+# marks a directive in the routing table to be evaluated per packet
+_DYNAMIC_DIR = object()
+
+# packets posted in batch are packed into batch packets of about this size
+BATCH_MAX_BYTES = 1024 * 1024
+
+
 class Peer:
     def __init__(
         self,
@@ -26,6 +55,9 @@ class Peer:
         posting: Callable[[Packet], Awaitable],
         hosting: Callable[[], Awaitable[Packet]],
         channels: Dict[Any, EventSink] = None,
+        outgoing: Optional[PacketQueue] = None,
+        incoming: Optional[PacketQueue] = None,
+        exec_policy: Optional["ExecPolicy"] = None,
     ):
         # identity of peer
         self.ident = ident
@@ -37,12 +69,86 @@ class Peer:
         self.hosting = hosting
         # cmd mux
         self.channels = channels or {}
+        # queue of outgoing packets, `posting` normally puts into it
+        self.outgoing = outgoing
+        # queue of incoming packets, `hosting` normally gets from it
+        self.incoming = incoming
+        # routing table of directive to channel locator, resolved literally
+        self.routes = {}
+        # how commands are evaluated, inline on the event loop if None, see
+        # `hastalk.nedh.execpol`
+        self.exec_policy = exec_policy
+        # policies overriding the above, for commands to specific channels
+        self.channel_exec_policies: Dict[Any, "ExecPolicy"] = {}
+        # blobs being streamed in, by channel directive
+        self.blob_streams = {}
+        # one blob is streamed out at a time per channel directive
+        self._stream_locks = {}
+        # shared memory rings for large payloads, with a same-host peer
+        self.shm_out: Optional[ShmRingWriter] = None
+        self.shm_in: Optional[ShmRingReader] = None
+        # whether to attach to a shared memory ring announced by the peer,
+        # a ring is refused unless opted in, as it maps memory named by the
+        # peer into this process
+        self.accept_shm = False
+        # credits granted by the peer for posting, by channel directive
+        self.credit_windows: Dict[str, CreditWindow] = {}
+        # calls awaiting replies, by correlation id
+        self._calls: Dict[int, asyncio.Future] = {}
+        # tasks replying calls offloaded, referenced until done, or they can
+        # be garbage collected midway
+        self._reply_tasks: Set[asyncio.Task] = set()
+        self._last_call_id = 0
+        # packets counted, evaluation time recorded etc.
+        self.metrics = PeerMetrics()
+        # heartbeat state, once started
+        self.heartbeat: Optional[Heartbeat] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        # outgoing packets to replay after a reconnection, for a reconnecting
+        # client only
+        self.replay: Optional[ReplayBuffer] = None
+        # sub-peers multiplexed over this peer's connection, by sub-peer id
+        self.sub_peers: Dict[int, "SubPeer"] = {}
+        self._last_sub_id = 0
+        # called with each sub-peer opened by the remote peer, to serve it,
+        # sub-peers are refused if None
+        self.sub_handler: Optional[Callable[["SubPeer"], object]] = None
 
         async def peer_cleanup():
+            exc = None
             try:
                 await self.eol
-            except:
-                pass
+            except BaseException as eol_exc:
+                exc = eol_exc
+
+            self._end_sub_peers(exc)
+
+            # release producers awaiting the budget of either queue, e.g. the
+            # intake blocked by a landing loop stopped
+            if self.outgoing is not None:
+                self.outgoing.close()
+            if self.incoming is not None:
+                self.incoming.close()
+
+            for window in self.credit_windows.values():
+                window.close()
+
+            calls = list(self._calls.values())
+            self._calls.clear()
+            for fut in calls:
+                if not fut.done():
+                    fut.set_exception(RuntimeError("peer end-of-life"))
+
+            if self.shm_out is not None:
+                self.shm_out.close()
+                self.shm_out = None
+            if self.shm_in is not None:
+                self.shm_in.close()
+                self.shm_in = None
+
+            for blob_stream in self.blob_streams.values():
+                blob_stream.abort(RuntimeError("peer end-of-life"))
+            self.blob_streams.clear()
 
             for ch in self.channels.values():
                 ch.publish(EndOfStream)
@@ -52,6 +158,445 @@ class Peer:
     def __repr__(self):
         return f"Peer<{self.ident}>"
 
+    @property
+    def queued_bytes(self) -> int:
+        """
+        Bytes of outgoing packets queued locally, not sent out yet
+        """
+        if self.outgoing is None:
+            return 0
+        return self.outgoing.queued_bytes
+
+    @property
+    def pending_calls(self) -> int:
+        """
+        Number of calls to the peer awaiting replies
+        """
+        return len(self._calls)
+
+    @property
+    def rtt(self) -> Optional[float]:
+        """
+        Smoothed round-trip time to the peer in seconds, None until sampled
+        by heartbeats
+        """
+        if self.heartbeat is None:
+            return None
+        return self.heartbeat.srtt
+
+    def start_heartbeat(
+        self,
+        interval: float = HEARTBEAT_INTERVAL,
+        max_missed: int = HEARTBEAT_MISSES,
+        eol: Optional[asyncio.Future] = None,
+    ) -> Heartbeat:
+        """
+        Ping the peer every `interval` seconds, bring it to end-of-life with
+        an error after `max_missed` pings not answered
+
+        The remote peer must answer pings, see `hastalk.nedh.heartbeat`.
+
+        A reconnecting client passes `eol` of each connection instead, to
+        start a new heartbeat per connection. The heartbeat started before,
+        if still running, is stopped.
+        """
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+        # sequence numbers continue from the previous heartbeat if any, so
+        # late answers to its pings are never mistaken
+        prev_seq = 0 if self.heartbeat is None else self.heartbeat.seq
+        heartbeat = Heartbeat(interval, max_missed, prev_seq)
+        self.heartbeat = heartbeat
+        self._heartbeat_task = asyncio.create_task(
+            heartbeat.run(
+                self.ident,
+                self.eol if eol is None else eol,
+                self._post_control,
+                self._intake_stalled,
+            )
+        )
+        return heartbeat
+
+    def _intake_stalled(self) -> bool:
+        # received packets are not taken in time by the landing loop, the
+        # socket is not read meanwhile, answers to pings can be held back
+        incoming = self.incoming
+        return incoming is not None and incoming.over_budget()
+
+    def handle_urgent(self, pkt: Packet) -> bool:
+        """
+        Handle a heartbeat packet right as received, ahead of packets queued
+        before it, return whether handled
+
+        The zero-copy intake calls this with each packet received, see
+        `PacketProtocol.urgent`, so a slow landing loop holds back no
+        heartbeat, as long as the socket is being read.
+        """
+        if not pkt.dir.startswith(("ping:", "pong:")):
+            return False
+        ctrl, _sep, arg = pkt.dir.partition(":")
+        self.metrics.count_in(pkt.dir, len(pkt.payload))
+        if ctrl == "ping":
+            self._post_control(Packet(f"pong:{arg}", b""))
+        else:
+            self._ponged(int(arg))
+        return True
+
+    def request_ack(self):
+        """
+        Request the remote peer to acknowledge packets recorded for replay,
+        for a reconnecting client only
+
+        The remote peer answers after it landed the packets, see
+        `hastalk.nedh.replay`. This is done as packets are pumped out, and
+        should be done after packets replayed.
+        """
+        if self.replay is None:
+            return
+        ack_seq = self.replay.mark()
+        if ack_seq is not None:
+            self._post_control(Packet(f"ackreq:{ack_seq!r}", b""))
+
+    def record_sent(self, pkts: List[Packet]) -> List[Packet]:
+        """
+        Record packets being pumped out for replay, return those to be sent,
+        see `ReplayBuffer.record()`, for a reconnecting client only
+        """
+        pkts = self.replay.record(pkts)
+        self.request_ack()
+        return pkts
+
+    def connection_lost(self):
+        """
+        Reset states scoped to the connection, the peer lives on to be
+        reconnected, for a reconnecting client only
+
+        Calls pending are failed, as they are not replayed.
+        """
+        calls = list(self._calls.values())
+        self._calls.clear()
+        for fut in calls:
+            if not fut.done():
+                fut.set_exception(EdhPeerError(self.ident, "connection lost"))
+
+        # the service grants credits afresh on reconnection
+        for window in self.credit_windows.values():
+            window.available = 0
+
+        # payloads in the shared memory ring are lost with the connection
+        if self.shm_out is not None:
+            self.shm_out.close()
+            self.shm_out = None
+        if self.shm_in is not None:
+            self.shm_in.close()
+            self.shm_in = None
+
+        for blob_stream in self.blob_streams.values():
+            blob_stream.abort(EdhPeerError(self.ident, "connection lost"))
+        self.blob_streams.clear()
+
+        # sub-peers end with the connection at the remote side
+        self._end_sub_peers(EdhPeerError(self.ident, "connection lost"))
+
+    def metrics_snapshot(self) -> dict:
+        """
+        Take a snapshot of runtime metrics of this peer, see
+        `hastalk.nedh.metrics`
+        """
+        return self.metrics.snapshot(self.outgoing, self.channels)
+
+    async def open_shm_ring(self, size: int = SHM_RING_SIZE):
+        """
+        Send large payloads via a shared memory ring from now on
+
+        Only for a same-host peer, a Python peer attaches to the ring on
+        receiving the announcement, if it opted in with `accept_shm`, see
+        `hastalk.nedh.shmring`.
+
+        Payloads in the ring can not be replayed, so a reconnecting client
+        keeps sending everything over the socket.
+        """
+        if self.eol.done():
+            await self.eol  # reraise the exception caused eol if any
+            raise RuntimeError("peer end-of-life")
+        if self.shm_out is not None:
+            raise RuntimeError("shared memory ring already opened")
+        shm_out = ShmRingWriter(size)
+        self.shm_out = shm_out
+        pkt = shm_out.open_packet()
+        self.metrics.count_out(pkt.dir, len(pkt.payload))
+        await self.posting(pkt)
+
+    async def post_packet(self, pkt: Packet, bulk: bool = False):
+        """
+        Post a raw packet to the peer
+
+        A bulk packet goes through the bulk lane, split into parts then
+        interleaved with control packets, so it never holds back control
+        commands, while it can be overtaken by them.
+
+        Large payloads go through the shared memory ring, if opened.
+        """
+        self.metrics.count_out(pkt.dir, len(pkt.payload))
+        await self._send_packet(pkt, bulk)
+
+    async def _send_packet(self, pkt: Packet, bulk: bool):
+        # packets here have been counted
+        shm_out = self.shm_out
+        if (
+            shm_out is not None
+            and self.replay is None
+            and len(pkt.payload) >= SHM_MIN_PAYLOAD
+        ):
+            doorbell = await shm_out.place(pkt)
+            if doorbell is not None:
+                self.metrics.count_out(doorbell.dir, 0)
+                pkt = doorbell
+        if bulk and self.outgoing is not None:
+            await self.outgoing.put_bulk(pkt)
+        else:
+            await self.posting(pkt)
+
+    def intake_sink(
+        self, pkt_sink: PacketSink, bulk_sink: Optional[PacketSink] = None
+    ) -> PacketSink:
+        """
+        Wrap the sink of packets received, to handle transport control
+        packets right at intake, other packets are passed through
+
+        Control packets must not wait for the command landing loop, e.g.
+        acks of a shared memory ring are needed to send more through it, and
+        replies to calls should resolve without a landing loop at all.
+
+        Bulk packets are reassembled from their parts here, then passed to
+        `bulk_sink` if given.
+        """
+        if bulk_sink is None:
+            bulk_sink = pkt_sink
+        ctrl_handlers = {
+            "shm": self._shm_doorbell,
+            "shmack": self._shm_ack,
+            "shmopen": self._shm_open,
+            "ret": self._call_returned,
+            "rerr": self._call_failed,
+            "credit": self._credit_granted,
+            "ping": self._ping_received,
+            "pong": self._pong_received,
+            "ack": self._ack_received,
+            "subopen": self._sub_opened,
+            "sub": self._sub_packet,
+            "subeol": self._sub_ended,
+        }
+        # ( directive, payload size, payload buffer, bytes filled ) of the
+        # bulk packet being reassembled, a zero-copy intake reassembles parts
+        # itself, so parts are copied here only from other intakes
+        assembling: Optional[Tuple[str, int, Optional[memoryview], int]] = None
+
+        count_in = self.metrics.count_in
+
+        async def dispatch(pkt: Packet, sink: PacketSink):
+            ctrl, sep, arg = pkt.dir.partition(":")
+            handler = ctrl_handlers.get(ctrl, None) if sep else None
+            # bytes of a batch are counted by the packets batched in it
+            count_in(pkt.dir, 0 if handler is unbatch else len(pkt.payload))
+            if handler is None:
+                await sink(pkt)
+            else:
+                await handler(arg, pkt, sink)
+
+        async def unbatch(arg: str, pkt: Packet, sink: PacketSink):
+            for batched_pkt in unbatchPacket(self.ident, pkt.payload):
+                await dispatch(batched_pkt, sink)
+
+        ctrl_handlers["batch"] = unbatch
+
+        async def ack_requested(arg: str, pkt: Packet, sink: PacketSink):
+            # queued into the bulk lane, to be taken after all packets
+            # received before it, then answered by the landing loop
+            await bulk_sink(pkt)
+
+        ctrl_handlers["ackreq"] = ack_requested
+
+        async def intake(pkt: Packet):
+            nonlocal assembling
+            if pkt.dir == "part:":
+                if assembling is None:
+                    raise EdhPeerError(self.ident, "bulk part without header")
+                bulk_dir, total, payload, filled = assembling
+                n = len(pkt.payload)
+                if filled + n > total:
+                    raise EdhPeerError(self.ident, "bulk parts overflow")
+                if n == total:
+                    payload = pkt.payload  # single part, no copy needed
+                else:
+                    if payload is None:
+                        payload = memoryview(bytearray(total))
+                    payload[filled : filled + n] = pkt.payload
+                filled += n
+                if filled < total:
+                    assembling = bulk_dir, total, payload, filled
+                    return
+                assembling = None
+                await dispatch(Packet(bulk_dir, payload), bulk_sink)
+            elif pkt.dir.startswith("bulk:"):
+                if assembling is not None:
+                    raise EdhPeerError(self.ident, "bulk packet interrupted")
+                total = int(pkt.dir[5:])
+                bulk_dir = str(pkt.payload, "utf-8")
+                if total > 0:
+                    assembling = bulk_dir, total, None, 0
+                else:
+                    await dispatch(Packet(bulk_dir, b""), bulk_sink)
+            else:
+                await dispatch(pkt, pkt_sink)
+
+        return intake
+
+    async def _shm_doorbell(self, arg: str, pkt: Packet, pkt_sink: PacketSink):
+        if self.shm_in is None:
+            raise EdhPeerError(self.ident, "no shared memory ring opened")
+        for ring_pkt in self.shm_in.take(self.ident, int(arg)):
+            self.metrics.count_in(ring_pkt.dir, len(ring_pkt.payload))
+            await pkt_sink(ring_pkt)
+        # the packets are copied out, free the ring space right away
+        self._post_control(Packet(f"shmack:{self.shm_in.consumed!r}", b""))
+
+    def _post_control(self, pkt: Packet):
+        # transport control packets are tiny, so not subject to the outgoing
+        # budget, and can be posted without awaiting
+        self.metrics.count_out(pkt.dir, len(pkt.payload))
+        if self.outgoing is not None:
+            self.outgoing.put_nowait(pkt)
+        else:
+            asyncio.create_task(self.posting(pkt))
+
+    async def _credit_granted(self, arg: str, pkt: Packet, pkt_sink: PacketSink):
+        n, ch_dir = arg.split(":", 1)
+        window = self.credit_windows.get(ch_dir, None)
+        if window is None:
+            window = self.credit_windows[ch_dir] = CreditWindow()
+            if self.eol.done():
+                window.close()
+        window.grant(int(n))
+
+    async def _take_credit(self, ch_dir: str):
+        # await a credit if the channel is flow controlled by the peer
+        window = self.credit_windows.get(ch_dir, None)
+        if window is not None:
+            await window.take()
+            if self.eol.done():  # released by end-of-life
+                await self.eol  # reraise the exception caused eol if any
+                raise RuntimeError("peer end-of-life")
+
+    async def _ping_received(self, arg: str, pkt: Packet, pkt_sink: PacketSink):
+        self._post_control(Packet(f"pong:{arg}", b""))
+
+    async def _pong_received(self, arg: str, pkt: Packet, pkt_sink: PacketSink):
+        self._ponged(int(arg))
+
+    def _ponged(self, seq: int):
+        if self.heartbeat is not None:
+            self.heartbeat.pong(seq)
+
+    async def _ack_received(self, arg: str, pkt: Packet, pkt_sink: PacketSink):
+        if self.replay is not None:
+            self.replay.ack(int(arg))
+            self.request_ack()  # for packets recorded meanwhile
+
+    async def _shm_ack(self, arg: str, pkt: Packet, pkt_sink: PacketSink):
+        if self.shm_out is not None:
+            self.shm_out.ack(int(arg))
+
+    async def _shm_open(self, arg: str, pkt: Packet, pkt_sink: PacketSink):
+        if not self.accept_shm:
+            raise EdhPeerError(self.ident, "shared memory ring not accepted")
+        size, name = arg.split(":", 1)
+        if self.shm_in is not None:
+            self.shm_in.close()
+            self.shm_in = None
+        try:
+            self.shm_in = ShmRingReader(name, int(size))
+        except ValueError as exc:
+            raise EdhPeerError(self.ident, str(exc)) from exc
+
+    def open_sub(self) -> "SubPeer":
+        """
+        Open a sub-peer multiplexed over the connection of this peer
+
+        The remote peer serves it with its `sub_handler`, no network round
+        trip is awaited, see `SubPeer`.
+        """
+        if self.eol.done():
+            raise RuntimeError("peer end-of-life")
+        self._last_sub_id += 1
+        sub = SubPeer(self, self._last_sub_id)
+        self.sub_peers[sub.sid] = sub
+        self._post_control(Packet(f"subopen:{sub.sid!r}", b""))
+        return sub
+
+    def _end_sub_peers(self, exc: Optional[BaseException]):
+        subs = list(self.sub_peers.values())
+        self.sub_peers.clear()
+        for sub in subs:
+            # nothing to tell the remote peer
+            sub._ended_by_peer = True
+            if sub.eol.done():
+                continue
+            if exc is None:
+                sub.eol.set_result(None)
+            else:
+                sub.eol.set_exception(exc)
+
+    async def _sub_opened(self, arg: str, pkt: Packet, pkt_sink: PacketSink):
+        # ids of sub-peers opened by the remote peer are negated locally
+        sub = SubPeer(self, -int(arg))
+        handler = self.sub_handler
+        if handler is None:
+            sub.eol.set_exception(EdhPeerError(sub.ident, "sub-peers not served"))
+            return
+        self.sub_peers[sub.sid] = sub
+        try:
+            maybe_async = handler(sub)
+            if inspect.isawaitable(maybe_async):
+                asyncio.create_task(self._serve_sub(sub, maybe_async))
+        except Exception as exc:
+            logger.error(f"Failed serving sub-peer {sub.ident}", exc_info=True)
+            if not sub.eol.done():
+                sub.eol.set_exception(exc)
+
+    async def _serve_sub(self, sub: "SubPeer", serving: Awaitable):
+        try:
+            await serving
+        except Exception as exc:
+            logger.error(f"Failed serving sub-peer {sub.ident}", exc_info=True)
+            if not sub.eol.done():
+                sub.eol.set_exception(exc)
+
+    async def _sub_packet(self, arg: str, pkt: Packet, pkt_sink: PacketSink):
+        sid, sub_dir = arg.split(":", 1)
+        sub = self.sub_peers.get(-int(sid), None)
+        if sub is None:
+            return  # ended, packets already sent to it are dropped
+        try:
+            await sub.intake(Packet(sub_dir, pkt.payload))
+        except Exception as exc:
+            # a broken sub-peer fails alone, not the connection
+            if not sub.eol.done():
+                sub.eol.set_exception(exc)
+
+    async def _sub_ended(self, arg: str, pkt: Packet, pkt_sink: PacketSink):
+        sub = self.sub_peers.pop(-int(arg), None)
+        if sub is None:
+            return
+        sub._ended_by_peer = True
+        if sub.eol.done():
+            return
+        err = str(pkt.payload, "utf-8")
+        if err:
+            sub.eol.set_exception(EdhPeerError(sub.ident, err))
+        else:
+            sub.eol.set_result(None)
+
     async def join(self):
         await self.eol
 
@@ -70,24 +615,332 @@ class Peer:
         return ch_sink
 
     def arm_channel(
-        self, ch_lctr: object, ch_sink: Optional[EventSink] = None
+        self,
+        ch_lctr: object,
+        ch_sink: Optional[EventSink] = None,
+        exec_policy: Optional["ExecPolicy"] = None,
     ) -> EventSink:
+        """
+        Arm a channel, commands to it are evaluated per `exec_policy` if
+        given, or per the peer's policy
+        """
         if ch_sink is None:
             ch_sink = EventSink()
         self.channels[ch_lctr] = ch_sink
+        if exec_policy is None:
+            self.channel_exec_policies.pop(ch_lctr, None)
+        else:
+            self.channel_exec_policies[ch_lctr] = exec_policy
         return ch_sink
 
+    def arm_credited_channel(
+        self, ch_lctr: object, window: int = CREDIT_WINDOW
+    ) -> CreditSink:
+        """
+        Arm a channel flow controlled with a credit window
+
+        The peer is granted `window` credits right away, then more as the
+        consumers of the returned sink make progress, so it can post at most
+        that many items not consumed yet, see `hastalk.nedh.credit`.
+        """
+        ch_dir = repr(ch_lctr)
+
+        def granting(n: int):
+            if not self.eol.done():
+                self._post_control(Packet(f"credit:{n!r}:{ch_dir}", b""))
+
+        ch_sink = CreditSink(window, granting)
+        self.channels[ch_lctr] = ch_sink
+        granting(window)
+        return ch_sink
+
+    async def resolve_channel(
+        self, dir_: str, cmd_globals: dict, cmd_locals: dict
+    ) -> EventSink:
+        """
+        Resolve the channel sink addressed by a directive
+
+        Directives are literals most of the time, those are resolved with
+        `ast.literal_eval()` only once, then routed by dict lookups, only
+        directives of other forms are evaluated per packet.
+        """
+        ch_lctr = self._route(dir_)
+        if ch_lctr is _DYNAMIC_DIR:
+            ch_lctr = await run_py(dir_, self.ident, cmd_globals, cmd_locals)
+        ch_sink = self.channels.get(ch_lctr, None)
+        if ch_sink is None:
+            raise RuntimeError(f"Missing command channel: {ch_lctr!r}")
+        return ch_sink
+
+    def _route(self, dir_: str) -> object:
+        routes = self.routes
+        try:
+            return routes[dir_]
+        except KeyError:
+            try:
+                ch_lctr = ast.literal_eval(dir_)
+            except Exception:
+                ch_lctr = _DYNAMIC_DIR
+            if len(routes) >= MAX_ROUTES:
+                routes.clear()
+            routes[dir_] = ch_lctr
+            return ch_lctr
+
+    def _exec_policy(self, dir_: str) -> Optional["ExecPolicy"]:
+        # policy for a command to the directive, literal directives only
+        if dir_ and self.channel_exec_policies:
+            try:
+                return self.channel_exec_policies.get(
+                    self._route(dir_), self.exec_policy
+                )
+            except TypeError:  # unhashable locator
+                pass
+        return self.exec_policy
+
+    async def _run_command(
+        self, dir_: str, src: str, cmd_globals: dict, cmd_locals: dict
+    ) -> object:
+        policy = self._exec_policy(dir_)
+        t0 = time.perf_counter()
+        if policy is None:
+            cmd_val = await run_py(src, self.ident, cmd_globals, cmd_locals)
+        else:
+            cmd_val = await policy.run(src, self.ident, cmd_globals, cmd_locals)
+        self.metrics.record_exec(time.perf_counter() - t0)
+        return cmd_val
+
     async def post_command(self, src: str, dir_: object = ""):
         if self.eol.done():
             await self.eol  # reraise the exception caused eol if any
             raise RuntimeError("peer end-of-life")
-        await self.posting(textPacket(repr(dir_), str(src)))
+        ch_dir = repr(dir_)
+        await self._take_credit(ch_dir)
+        await self.post_packet(textPacket(ch_dir, str(src)))
+
+    async def post_batch(self, pkts: Iterable[Packet], bulk: bool = False):
+        """
+        Post multiple packets to the peer, packed into as few batch packets
+        as possible
+
+        The peer unpacks them on receiving, so they are landed just as if
+        posted one by one, only the per packet overheads are saved.
+
+        Batch packets are understood by Python peers only, so batching is
+        opt-in, use it only when the peer is known to be a Python one.
+        """
+        batch, batch_bytes = [], 0
+        for pkt in pkts:
+            batch.append(pkt)
+            batch_bytes += len(pkt.payload)
+            if batch_bytes >= BATCH_MAX_BYTES:
+                await self._post_batch(batch, bulk)
+                batch, batch_bytes = [], 0
+        if batch:
+            await self._post_batch(batch, bulk)
+
+    async def _post_batch(self, batch: List[Packet], bulk: bool):
+        if len(batch) == 1:
+            await self.post_packet(batch[0], bulk)
+            return
+        # bytes of a batch are counted by the packets batched in it
+        for pkt in batch:
+            self.metrics.count_out(pkt.dir, len(pkt.payload))
+        batch_pkt = batchPacket(self.ident, batch)
+        self.metrics.count_out(batch_pkt.dir, 0)
+        await self._send_packet(batch_pkt, bulk)
+
+    async def post_commands(self, srcs: Iterable[str], dir_: object = ""):
+        """
+        Post multiple commands in batch, as with one `post_command()` call
+        per command
+
+        For a Python peer only, see `post_batch()`.
+        """
+        await self.p2c_batch(dir_, srcs)
+
+    async def p2c_batch(self, dir_: object, srcs: Iterable[str]):
+        """
+        Post multiple commands to a channel of the peer, in batch
+
+        The channel sink of a Python peer gets each command value published
+        in order, as with one `p2c()` call per command.
+
+        For a Python peer only, see `post_batch()`.
+        """
+        if self.eol.done():
+            await self.eol  # reraise the exception caused eol if any
+            raise RuntimeError("peer end-of-life")
+        ch_dir = repr(dir_)
+        window = self.credit_windows.get(ch_dir, None)
+        batch, batch_bytes = [], 0
+        for src in srcs:
+            if window is not None:
+                if window.available <= 0 and batch:
+                    # send out what's batched, for the peer to grant more
+                    await self._post_batch(batch, False)
+                    batch, batch_bytes = [], 0
+                await self._take_credit(ch_dir)
+            pkt = textPacket(ch_dir, str(src))
+            batch.append(pkt)
+            batch_bytes += len(pkt.payload)
+            if batch_bytes >= BATCH_MAX_BYTES:
+                await self._post_batch(batch, False)
+                batch, batch_bytes = [], 0
+        if batch:
+            await self._post_batch(batch, False)
 
     async def p2c(self, dir_: object, src: str):
         if self.eol.done():
             await self.eol  # reraise the exception caused eol if any
             raise RuntimeError("peer end-of-life")
-        await self.posting(textPacket(repr(dir_), str(src)))
+        ch_dir = repr(dir_)
+        await self._take_credit(ch_dir)
+        await self.post_packet(textPacket(ch_dir, str(src)))
+
+    async def call(self, src: str, timeout: Optional[float] = None) -> object:
+        """
+        Evaluate Python code at the peer, return its result
+
+        Each call is tagged with a correlation id, and resolved by the reply
+        of that id, so any number of calls can be in flight at the same time.
+        The result is sent back in binary encoding, see
+        `hastalk.nedh.bindata` for data types supported.
+
+        An error from the remote evaluation is raised as `EdhPeerError`.
+        On timeout or cancellation, the reply will be discarded on arrival.
+        """
+        if self.eol.done():
+            await self.eol  # reraise the exception caused eol if any
+            raise RuntimeError("peer end-of-life")
+        self._last_call_id += 1
+        call_id = self._last_call_id
+        fut = asyncio.get_running_loop().create_future()
+        self._calls[call_id] = fut
+        try:
+            await self.post_packet(textPacket(f"call:{call_id!r}", str(src)))
+            if timeout is None:
+                return await fut
+            return await asyncio.wait_for(fut, timeout)
+        finally:
+            self._calls.pop(call_id, None)
+
+    async def _call_returned(self, arg: str, pkt: Packet, pkt_sink: PacketSink):
+        fut = self._calls.pop(int(arg), None)
+        if fut is None or fut.done():
+            return  # timed out or cancelled
+        try:
+            result = unpackData(pkt.payload)
+        except Exception as exc:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(result)
+
+    async def _call_failed(self, arg: str, pkt: Packet, pkt_sink: PacketSink):
+        fut = self._calls.pop(int(arg), None)
+        if fut is None or fut.done():
+            return  # timed out or cancelled
+        fut.set_exception(EdhPeerError(self.ident, str(pkt.payload, "utf-8")))
+
+    async def _reply_call(
+        self, call_id: str, src: str, cmd_globals: dict, cmd_locals: dict
+    ):
+        try:
+            result = await self._run_command("", src, cmd_globals, cmd_locals)
+            reply = Packet(f"ret:{call_id}", packData(result))
+        except Exception as exc:
+            # a failed call is reported to the caller, not failing the peer
+            err = f"{type(exc).__name__}: {exc!s}"
+            reply = Packet(f"rerr:{call_id}", err.encode("utf-8"))
+        await self.post_packet(reply)
+
+    async def p2c_bin(self, dir_: object, data: object, bulk: bool = False):
+        """
+        Post data to a channel of the peer, in binary encoding
+
+        The data is decoded by a Python peer directly, without evaluation,
+        see `hastalk.nedh.bindata` for data types supported.
+
+        Pass `bulk=True` for large data not to hold back control commands.
+        """
+        if self.eol.done():
+            await self.eol  # reraise the exception caused eol if any
+            raise RuntimeError("peer end-of-life")
+        ch_dir = repr(dir_)
+        await self._take_credit(ch_dir)
+        await self.post_packet(binPacket(ch_dir, data), bulk)
+
+    async def p2c_array(self, dir_: object, arr: "np.ndarray", bulk: bool = False):
+        """
+        Post a NumPy ndarray to a channel of the peer
+
+        The array data is sent as is, a Python peer publishes a view over
+        the received payload, see `hastalk.nedh.nda`.
+
+        Pass `bulk=True` for large arrays not to hold back control commands.
+        """
+        if self.eol.done():
+            await self.eol  # reraise the exception caused eol if any
+            raise RuntimeError("peer end-of-life")
+        ch_dir = repr(dir_)
+        await self._take_credit(ch_dir)
+        await self.post_packet(arrayPacket(ch_dir, arr), bulk)
+
+    async def p2c_stream(
+        self, dir_: object, src: BlobSource, chunk_size: int = BLOB_CHUNK_SIZE
+    ) -> int:
+        """
+        Stream a large blob to a channel of the peer, chunk by chunk
+
+        The source can be a file (by path or as a seekable binary file
+        object), or a buffer like an mmap. Only a few chunks are buffered at
+        a time, as bounded by the outgoing budget.
+
+        A Python peer publishes a `BlobStream` to the channel sink, to
+        receive the chunks. Total bytes streamed is returned.
+
+        Chunks go through the bulk lane, so control commands are never held
+        back by a blob being streamed. A file is read in the default executor,
+        not blocking the event loop.
+        """
+        eol = self.eol
+        if eol.done():
+            await eol  # reraise the exception caused eol if any
+            raise RuntimeError("peer end-of-life")
+        ch_dir = repr(dir_)
+        lock = self._stream_locks.get(ch_dir, None)
+        if lock is None:
+            lock = self._stream_locks[ch_dir] = asyncio.Lock()
+        async with lock:
+            # a blob stream is published as a single item
+            await self._take_credit(ch_dir)
+            if isBlobFile(src):
+                loop = asyncio.get_running_loop()
+                total, chunks = await loop.run_in_executor(
+                    None, blobChunks, src, chunk_size
+                )
+                next_chunk = lambda: loop.run_in_executor(None, next, chunks, None)
+            else:
+                total, chunks = blobChunks(src, chunk_size)
+                next_chunk = None
+            try:
+                pkt_dir = f"stream:{total!r}:{ch_dir}"
+                if total <= 0:
+                    await self.post_packet(Packet(pkt_dir, b""), bulk=True)
+                    return 0
+                while True:
+                    if next_chunk is None:
+                        chunk = next(chunks, None)
+                    else:
+                        chunk = await next_chunk()
+                    if chunk is None:
+                        break
+                    if eol.done():
+                        await eol  # reraise the exception caused eol if any
+                        raise RuntimeError("peer end-of-life")
+                    await self.post_packet(Packet(pkt_dir, chunk), bulk=True)
+            finally:
+                chunks.close()  # close the file early, if streaming aborted
+        return total
 
     async def read_command(
         self, cmd_globals: Optional[dict] = None, cmd_locals: Optional[dict] = None,
@@ -97,37 +950,144 @@ class Peer:
 
         Note a command may target a specific channel, thus get posted to that
              channel's sink, and None will be returned from here for it.
+
+        A `BlobStream` returned is fed by subsequent reads, it must be consumed
+        by another task, see `BlobStream`.
         """
-        eol = self.eol
-        pkt = await read_stream(eol, self.hosting())
+        pkt = await self._next_packet()
         if pkt is EndOfStream:
             return EndOfStream
-        assert isinstance(pkt, Packet), f"Unexpected packet of type: {type(pkt)!r}"
         if cmd_globals is None:
             assert cmd_locals is None, "given locals but not globals ?!"
             caller_frame = inspect.currentframe().f_back
             cmd_globals = caller_frame.f_globals
             cmd_locals = caller_frame.f_locals
+        return await self._land_packet(pkt, cmd_globals, cmd_locals)
+
+    async def read_commands(
+        self,
+        max_n: int = 64,
+        cmd_globals: Optional[dict] = None,
+        cmd_locals: Optional[dict] = None,
+    ) -> List[object]:
+        """
+        Read next batch of commands from peer
+
+        This awaits the next command as `read_command()` does, then takes
+        more commands already received, up to `max_n` in total, without
+        awaiting any more, so a burst of commands is landed in one call.
+
+        Values of commands not targeting any channel are returned in a list,
+        ending with `EndOfStream` once the peer reached end-of-life.
+
+        A batch ends with a `BlobStream` returned, as its subsequent chunks
+        can only be fed after it got consumed by another task.
+        """
+        pkt = await self._next_packet()
+        if pkt is EndOfStream:
+            return [EndOfStream]
+        if cmd_globals is None:
+            assert cmd_locals is None, "given locals but not globals ?!"
+            caller_frame = inspect.currentframe().f_back
+            cmd_globals = caller_frame.f_globals
+            cmd_locals = caller_frame.f_locals
+        incoming = self.incoming
+        cmd_vals = []
+        n = 0
+        while True:
+            # packets are taken one at a time, each landed before the next is
+            # taken, so none is lost if landing one raises
+            cmd_val = await self._land_packet(pkt, cmd_globals, cmd_locals)
+            if cmd_val is not None:
+                cmd_vals.append(cmd_val)
+                if isinstance(cmd_val, BlobStream):
+                    return cmd_vals
+            n += 1
+            if n >= max_n or incoming is None or incoming.empty():
+                return cmd_vals
+            pkt = incoming.get_nowait()
+
+    async def _next_packet(self) -> object:
+        eol = self.eol
+        incoming = self.incoming
+        if incoming is not None and not incoming.empty() and not eol.done():
+            # already received, no need to await
+            pkt = incoming.get_nowait()
+        else:
+            pkt = await read_stream(eol, self.hosting())
+            if pkt is EndOfStream:
+                return EndOfStream
+        assert isinstance(pkt, Packet), f"Unexpected packet of type: {type(pkt)!r}"
+        return pkt
+
+    async def _land_packet(
+        self, pkt: Packet, cmd_globals: dict, cmd_locals: dict
+    ) -> Optional[object]:
+        eol = self.eol
+        if pkt.dir.startswith("ackreq:"):
+            # packets received before it have all been landed
+            self._post_control(Packet(f"ack:{pkt.dir[7:]}", b""))
+            return None
+        if pkt.dir.startswith("call:"):
+            src = str(pkt.payload, "utf-8")
+            reply = self._reply_call(pkt.dir[5:], src, cmd_globals, cmd_locals)
+            if self.exec_policy is None:
+                await reply
+            else:
+                # replies are correlated by id, so calls offloaded can run
+                # in parallel, without holding back the landing loop
+                reply_task = asyncio.create_task(reply)
+                self._reply_tasks.add(reply_task)
+                reply_task.add_done_callback(self._reply_tasks.discard)
+            return None
         if pkt.dir.startswith("blob:"):
             blob_dir = pkt.dir[5:]
             if len(blob_dir) < 1:
                 return pkt.payload
-            ch_lctr = await run_py(blob_dir, self.ident, cmd_globals, cmd_locals)
-            ch_sink = self.channels.get(ch_lctr, None)
-            if ch_sink is None:
-                raise RuntimeError(f"Missing command channel: {ch_lctr!r}")
+            ch_sink = await self.resolve_channel(blob_dir, cmd_globals, cmd_locals)
             ch_sink.publish(pkt.payload)
             return None
+        if pkt.dir.startswith("stream:"):
+            total, stream_dir = pkt.dir[7:].split(":", 1)
+            cmd_val = None
+            blob_stream = self.blob_streams.get(stream_dir, None)
+            if blob_stream is None:  # first chunk of a blob
+                blob_stream = BlobStream(int(total))
+                if len(stream_dir) < 1:
+                    cmd_val = blob_stream
+                else:
+                    ch_sink = await self.resolve_channel(
+                        stream_dir, cmd_globals, cmd_locals
+                    )
+                    ch_sink.publish(blob_stream)
+                self.blob_streams[stream_dir] = blob_stream
+            # this awaits when the consumer falls behind
+            await blob_stream.feed(pkt.payload)
+            if blob_stream.completed():
+                del self.blob_streams[stream_dir]
+            return cmd_val
+        if pkt.dir.startswith("bin:"):
+            bin_dir = pkt.dir[4:]
+            data = unpackData(pkt.payload)
+            if len(bin_dir) < 1:
+                return data
+            ch_sink = await self.resolve_channel(bin_dir, cmd_globals, cmd_locals)
+            ch_sink.publish(data)
+            return None
+        if pkt.dir.startswith("nda:"):
+            arr, nda_dir = unpackArray(pkt.dir[4:], pkt.payload)
+            if len(nda_dir) < 1:
+                return arr
+            ch_sink = await self.resolve_channel(nda_dir, cmd_globals, cmd_locals)
+            ch_sink.publish(arr)
+            return None
         # interpret as textual command
-        src = pkt.payload.decode("utf-8")
+        src = str(pkt.payload, "utf-8")
         try:
-            cmd_val = await run_py(src, self.ident, cmd_globals, cmd_locals)
+            cmd_val = await self._run_command(pkt.dir, src, cmd_globals, cmd_locals)
             if len(pkt.dir) < 1:
                 return cmd_val
-            ch_lctr = await run_py(pkt.dir, self.ident, cmd_globals, cmd_locals)
-            ch_sink = self.channels.get(ch_lctr, None)
-            if ch_sink is None:
-                raise RuntimeError(f"Missing command channel: {ch_lctr!r}")
+            ch_sink = await self.resolve_channel(pkt.dir, cmd_globals, cmd_locals)
             ch_sink.publish(cmd_val)
             return None
         except Exception as exc:
@@ -136,6 +1096,107 @@ class Peer:
             raise  # reraise as is
 
 
+class SubPeer(Peer):
+    """
+    Virtual peer multiplexed over the connection of a parent peer
+
+    A sub-peer has its own channels, calls and end-of-life, while sharing
+    the connection, so opening one costs no handshake, nor a run of the
+    peer module. Its packets are carried by the parent peer as:
+
+        subopen:<id>             - a sub-peer opened by the sender
+        sub:<id>:<directive>     - a packet of the sub-peer
+        subeol:<id>              - the sub-peer ended at the sender, with the
+                                   error as payload if any
+
+    Ids are numbered by the side opened the sub-peer, and negated by the
+    other side, so both sides can open sub-peers without collision.
+
+    Sub-peers share the outgoing budget of the parent, and received
+    packets are queued per sub-peer. The parent never awaits a sub-peer to
+    read, a sub-peer with unread packets exceeding its incoming budget is
+    ended with an error instead, so it holds back neither the parent nor
+    other sub-peers.
+    """
+
+    def __init__(self, parent: Peer, sid: int):
+        incoming = PacketQueue(INQ_HIGH_WATER)
+        super().__init__(
+            ident=f"{parent.ident}#{sid!r}",
+            eol=asyncio.get_running_loop().create_future(),
+            posting=self._post_wrapped,
+            hosting=incoming.get,
+            incoming=incoming,
+            exec_policy=parent.exec_policy,
+        )
+        self.parent = parent
+        # positive if opened locally, negative if opened by the remote peer
+        self.sid = sid
+        # the parent receives packets of this sub-peer into here
+        self.intake = self.intake_sink(self._queue_in)
+        # set when ended by the remote peer, or with the parent, so no need
+        # to tell the remote peer
+        self._ended_by_peer = False
+        self._wrap_dir = f"sub:{sid!r}:"
+        self.eol.add_done_callback(self._ended)
+
+    def __repr__(self):
+        return f"SubPeer<{self.ident}>"
+
+    def _ended(self, eol: asyncio.Future):
+        # packets not read yet are never to be
+        self.incoming.close()
+        self.incoming.clear()
+        parent = self.parent
+        if parent.sub_peers.get(self.sid, None) is self:
+            del parent.sub_peers[self.sid]
+        if self._ended_by_peer or parent.eol.done():
+            return
+        exc = None if eol.cancelled() else eol.exception()
+        err = "" if exc is None else f"{type(exc).__name__}: {exc!s}"
+        # raw payload, as an empty one tells a clean end
+        parent._post_control(Packet(f"subeol:{self.sid!r}", err.encode("utf-8")))
+
+    async def _queue_in(self, pkt: Packet):
+        # never awaits the budget, or the intake of the parent is blocked
+        incoming = self.incoming
+        if incoming.queued_bytes > incoming.high_water:
+            raise EdhPeerError(self.ident, "sub-peer not read in time")
+        incoming.put_nowait(pkt)
+
+    def _wrap(self, pkt: Packet) -> Packet:
+        # counted by the parent too, as packets of its connection
+        wrapped = Packet(self._wrap_dir + pkt.dir, pkt.payload)
+        self.parent.metrics.count_out(wrapped.dir, len(wrapped.payload))
+        return wrapped
+
+    async def _post_wrapped(self, pkt: Packet):
+        await self.parent.posting(self._wrap(pkt))
+
+    async def _send_packet(self, pkt: Packet, bulk: bool):
+        # packets here have been counted, they go through the lanes of the
+        # parent, but never its shared memory ring
+        outgoing = self.parent.outgoing
+        if bulk and outgoing is not None:
+            await outgoing.put_bulk(self._wrap(pkt))
+        else:
+            await self._post_wrapped(pkt)
+
+    def _post_control(self, pkt: Packet):
+        self.metrics.count_out(pkt.dir, len(pkt.payload))
+        outgoing = self.parent.outgoing
+        if outgoing is not None:
+            outgoing.put_nowait(self._wrap(pkt))
+        else:
+            asyncio.create_task(self._post_wrapped(pkt))
+
+    async def open_shm_ring(self, size: int = SHM_RING_SIZE):
+        raise RuntimeError("Shared memory ring not supported by sub-peers")
+
+    def open_sub(self) -> "SubPeer":
+        raise RuntimeError("Sub-peers can not be nested")
+
+
 async def run_py(
     code: str,
     src_name: str = "<py-code>",
@@ -148,6 +1209,101 @@ async def run_py(
     return maybe_aw
 
 
+# ready-to-run code compiled from a piece of Python source:
+#   ( code to exec, code to eval for value of last expr, name of last def )
+CompiledPy = Tuple[CodeType, Optional[CodeType], Optional[str]]
+
+
+def compile_py(code: str, src_name: str = "<py-code>") -> CompiledPy:
+    """
+    Compile Python code, with its last expression (if any) separated out to
+    be evaluated for value.
+
+    """
+    ast_ = ast.parse(code, src_name, "exec")
+    last_expr = None
+    last_def_name = None
+    for field_ in ast.iter_fields(ast_):
+        if "body" != field_[0]:
+            continue
+        if len(field_[1]) > 0:
+            le = field_[1][-1]
+            if isinstance(le, ast.Expr):
+                last_expr = ast.Expression()
+                last_expr.body = field_[1].pop().value
+            elif isinstance(le, (ast.FunctionDef, ast.ClassDef)):
+                last_def_name = le.name
+    exec_code = compile(ast_, src_name, "exec")
+    if last_expr is not None:
+        return exec_code, compile(last_expr, src_name, "eval"), None
+    return exec_code, None, last_def_name
+
+
+# filename of code objects compiled by `CodeCache`
+CACHED_SRC_NAME = "<peer>"
+
+
+class CodeCache:
+    """
+    Bounded LRU cache of compiled Python code, keyed by source text
+
+    Peers tend to send the same few commands and directives repeatedly, those
+    are parsed and compiled only once with this cache.
+
+    Code is compiled with the fixed filename `CACHED_SRC_NAME`, so identical
+    sources from any connection or sub-peer share an entry, the peer's ident
+    goes into error logs only.
+
+    The cache is thread-safe, commands evaluated by `ThreadExec` share it.
+    """
+
+    __slots__ = ("maxsize", "hits", "misses", "_entries", "_lock")
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return (
+            f"CodeCache<{len(self._entries)}/{self.maxsize} entries,"
+            f" {self.hits} hits, {self.misses} misses>"
+        )
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def compiled(self, code: str) -> CompiledPy:
+        key = code
+        entries = self._entries
+        with self._lock:
+            compiled = entries.get(key, None)
+            if compiled is not None:
+                self.hits += 1
+                entries.move_to_end(key)
+                return compiled
+            self.misses += 1
+
+        # compiled out of the lock, not to serialize compiling in threads, a
+        # source compiled by multiple threads at once is just cached again
+        compiled = compile_py(code, CACHED_SRC_NAME)
+        with self._lock:
+            entries[key] = compiled
+            if len(entries) > self.maxsize:
+                entries.popitem(last=False)
+        return compiled
+
+
+# the cache used by `exec_py()`
+code_cache = CodeCache()
+
+
 def exec_py(
     code: str,
     src_name: str = "<py-code>",
@@ -157,28 +1313,17 @@ def exec_py(
     """
     Run arbitrary Python code in supplied globals, return evaluated value of last statement.
 
+    The code is compiled through `code_cache`, `src_name` only names it in error logs.
     """
     if globals_ is None:
         globals_ = {}
     if locals_ is None:
         locals_ = globals_
     try:
-        ast_ = ast.parse(code, src_name, "exec")
-        last_expr = None
-        last_def_name = None
-        for field_ in ast.iter_fields(ast_):
-            if "body" != field_[0]:
-                continue
-            if len(field_[1]) > 0:
-                le = field_[1][-1]
-                if isinstance(le, ast.Expr):
-                    last_expr = ast.Expression()
-                    last_expr.body = field_[1].pop().value
-                elif isinstance(le, (ast.FunctionDef, ast.ClassDef)):
-                    last_def_name = le.name
-        exec(compile(ast_, src_name, "exec"), globals_, locals_)
-        if last_expr is not None:
-            return eval(compile(last_expr, src_name, "eval"), globals_, locals_)
+        exec_code, eval_code, last_def_name = code_cache.compiled(code)
+        exec(exec_code, globals_, locals_)
+        if eval_code is not None:
+            return eval(eval_code, globals_, locals_)
         elif last_def_name is not None:
             # godforbid the code to declare global/nonlocal for the last defined artifact
             return locals_[last_def_name]
@@ -0,0 +1,96 @@
+"""
+Peer modules, run per connection
+
+A server runs its service module, and a client its consumer module, afresh
+for each connection, with the peer object implanted in a fresh namespace.
+`runpy.run_module()` finds the module, reads and compiles its source every
+time, a `PeerModule` does those only once, then executes the compiled code
+per connection, so connection setup costs only what the module code does.
+
+Peer modules are loaded once per process, changes to their source take
+effect only after the process restarted.
+
+"""
+__all__ = ["PeerModule", "peerModule"]
+
+from typing import *
+import importlib.util
+from importlib.machinery import ModuleSpec
+from types import CodeType
+
+from ..log import *
+
+logger = get_logger(__name__)
+
+
+class PeerModule:
+    """
+    Code of a peer module, loaded once, to be run per connection
+
+    A package is run by its `__main__` submodule, as with `python -m`.
+    """
+
+    __slots__ = ("name", "spec", "code")
+
+    def __init__(self, modu_name: str):
+        self.name, self.spec, self.code = _module_code(modu_name)
+
+    def __repr__(self):
+        return f"PeerModule({self.name!r})"
+
+    def run(self, init_globals: Optional[dict] = None) -> dict:
+        """
+        Run the module code in a fresh namespace, initialized with
+        `init_globals`, the same way as `runpy.run_module()` does
+
+        The namespace is returned.
+        """
+        spec = self.spec
+        run_globals = {} if init_globals is None else dict(init_globals)
+        run_globals.update(
+            __name__=self.name,
+            __file__=spec.origin,
+            __cached__=spec.cached,
+            __doc__=None,
+            __loader__=spec.loader,
+            __package__=spec.parent,
+            __spec__=spec,
+        )
+        exec(self.code, run_globals)
+        return run_globals
+
+
+def _module_code(modu_name: str) -> Tuple[str, ModuleSpec, CodeType]:
+    try:
+        spec = importlib.util.find_spec(modu_name)
+    except (ImportError, AttributeError, TypeError, ValueError) as exc:
+        raise ImportError(
+            f"Error finding peer module {modu_name!r}: {type(exc).__name__}: {exc!s}"
+        ) from exc
+    if spec is None:
+        raise ImportError(f"No peer module named {modu_name!r}")
+    if spec.submodule_search_locations is not None:
+        if modu_name == "__main__" or modu_name.endswith(".__main__"):
+            raise ImportError(f"Can not run package {modu_name!r} as peer module")
+        return _module_code(modu_name + ".__main__")
+    if spec.loader is None:
+        raise ImportError(f"{modu_name!r} is a namespace package, not runnable")
+    code = spec.loader.get_code(modu_name)
+    if code is None:
+        raise ImportError(f"No code available for peer module {modu_name!r}")
+    return modu_name, spec, code
+
+
+# peer modules loaded in this process, by name
+_peer_modules: Dict[str, PeerModule] = {}
+
+
+def peerModule(modu_name: str) -> PeerModule:
+    """
+    Get the peer module of the name, loaded once per process
+    """
+    peer_modu = _peer_modules.get(modu_name, None)
+    if peer_modu is None:
+        peer_modu = _peer_modules[modu_name] = PeerModule(modu_name)
+        logger.debug(f"Nedh peer module {modu_name} loaded")
+    return peer_modu
@@ -0,0 +1,275 @@
+"""
+Packet queues with budgets in bytes
+
+A queue has two lanes, control and bulk. Packets of the control lane are
+always got before those of the bulk lane, and each lane has its own budget,
+so bulk data never holds back control commands.
+
+For an outgoing queue, a bulk packet is split into parts on the way out, so
+control packets get interleaved between the parts of a large payload:
+
+    bulk:<payload size>  - with the original packet directive as payload
+    part:                - with a chunk of the payload, repeated until done
+
+The receiving side reassembles the parts into the original packet, the
+zero-copy intake receives them right into a buffer of the whole payload, see
+`PacketProtocol`.
+
+"""
+__all__ = ["PacketQueue"]
+
+from typing import *
+import asyncio
+from collections import deque
+
+from ..log import *
+
+from .mproto import *
+
+logger = get_logger(__name__)
+
+
+# default budget of bytes queued for an outgoing packet queue
+OUTQ_HIGH_WATER = 16 * 1024 * 1024
+
+# default budget of bytes queued for an incoming packet queue
+INQ_HIGH_WATER = 256 * 1024
+
+# default size of parts a bulk packet is split into, for an outgoing queue
+BULK_PART_SIZE = 256 * 1024
+
+
+def packet_size(pkt: Packet) -> int:
+    # header length is not counted precisely, as it's far less significant,
+    # but a packet counts at least a byte, so even a zero budget is enforced
+    # for empty packets
+    return max(1, len(pkt.payload) + len(pkt.dir))
+
+
+class PacketQueue:
+    """
+    Packet queue with a budget in bytes per lane
+
+    Putting a packet awaits once the queued bytes of its lane exceeded the
+    high-water mark, until they are drained down to the low-water mark, so
+    producers get backpressure from a slow connection.
+
+    A single packet larger than the budget is still accepted, when put
+    while its lane is under the high-water mark. Producers awaiting are
+    admitted one at a time in the order they came, each after the budget
+    rechecked, so a producer putting small packets is not starved by others
+    putting large ones.
+
+    Packets of either lane keep their order, but control packets overtake
+    bulk packets queued before them.
+
+    A queue must be closed once no longer pumped, e.g. on end-of-life of its
+    peer, or producers awaiting the budget hang forever.
+    """
+
+    __slots__ = (
+        "high_water",
+        "low_water",
+        "part_size",
+        "queued_bytes",
+        "bulk_bytes",
+        "peak_bytes",
+        "_pkts",
+        "_bulk",
+        "_splitting",
+        "_nonempty",
+        "_drained",
+        "_bulk_drained",
+        "_waiters",
+        "_bulk_waiters",
+    )
+
+    def __init__(
+        self,
+        high_water: Optional[int] = None,
+        low_water: Optional[int] = None,
+        part_size: Optional[int] = None,
+    ):
+        if high_water is None:
+            high_water = OUTQ_HIGH_WATER
+        if low_water is None:
+            low_water = high_water // 2
+        if not 0 <= low_water <= high_water:
+            raise ValueError(
+                f"Invalid water marks: high={high_water!r}, low={low_water!r}"
+            )
+        if part_size is not None and part_size <= 0:
+            raise ValueError(f"Invalid part size: {part_size!r}")
+        self.high_water = high_water
+        self.low_water = low_water
+        # split bulk packets into parts of this size, None to not split
+        self.part_size = part_size
+        # bytes of packets currently queued, of both lanes
+        self.queued_bytes = 0
+        # bytes of packets currently queued in the bulk lane
+        self.bulk_bytes = 0
+        # most bytes ever queued, of both lanes
+        self.peak_bytes = 0
+
+        self._pkts = deque()
+        self._bulk = deque()
+        # ( payload view, offset of next part ) of the bulk packet being split
+        self._splitting: Optional[Tuple[memoryview, int]] = None
+        self._nonempty = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._bulk_drained = asyncio.Event()
+        self._bulk_drained.set()
+        # producers awaiting to put into either lane, in the order they came
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._bulk_waiters: Deque[asyncio.Future] = deque()
+
+    def __repr__(self):
+        return (
+            f"PacketQueue<{len(self._pkts)}+{len(self._bulk)} packets,"
+            f" {self.queued_bytes} bytes>"
+        )
+
+    def qsize(self) -> int:
+        return len(self._pkts) + len(self._bulk)
+
+    def empty(self) -> bool:
+        return not self._pkts and not self._bulk
+
+    def over_budget(self) -> bool:
+        """
+        Whether either lane exceeded its budget, not drained down yet
+        """
+        return not self._drained.is_set() or not self._bulk_drained.is_set()
+
+    def close(self):
+        """
+        Stop budgeting, release all producers awaiting to put
+
+        This is for the queue no longer being pumped, e.g. on end-of-life of
+        its connection.
+        """
+        self.high_water = self.low_water = float("inf")
+        self._drained.set()
+        self._bulk_drained.set()
+
+    def clear(self):
+        """
+        Drop all packets queued, e.g. those no longer to be taken after
+        end-of-life of the peer
+        """
+        self._pkts.clear()
+        self._bulk.clear()
+        self._splitting = None
+        self.queued_bytes = self.bulk_bytes = 0
+        self._nonempty.clear()
+        self._drained.set()
+        self._bulk_drained.set()
+
+    async def put(self, pkt: Packet):
+        if self._waiters or not self._drained.is_set():
+            await self._admit(self._waiters, self._drained)
+        self.put_nowait(pkt)
+
+    def put_nowait(self, pkt: Packet):
+        """
+        Put a packet into the control lane regardless of the budget
+        """
+        self._pkts.append(pkt)
+        self.queued_bytes += packet_size(pkt)
+        if self.queued_bytes > self.peak_bytes:
+            self.peak_bytes = self.queued_bytes
+        self._nonempty.set()
+        if self.queued_bytes - self.bulk_bytes > self.high_water:
+            self._drained.clear()
+
+    async def put_bulk(self, pkt: Packet):
+        if self._bulk_waiters or not self._bulk_drained.is_set():
+            await self._admit(self._bulk_waiters, self._bulk_drained)
+        self.put_bulk_nowait(pkt)
+
+    def put_bulk_nowait(self, pkt: Packet):
+        """
+        Put a packet into the bulk lane regardless of the budget
+        """
+        self._bulk.append(pkt)
+        pkt_size = packet_size(pkt)
+        self.queued_bytes += pkt_size
+        self.bulk_bytes += pkt_size
+        if self.queued_bytes > self.peak_bytes:
+            self.peak_bytes = self.queued_bytes
+        self._nonempty.set()
+        if self.bulk_bytes > self.high_water:
+            self._bulk_drained.clear()
+
+    async def _admit(self, waiters: Deque[asyncio.Future], drained: asyncio.Event):
+        # producers take turns, the one at the head awaits the lane drained,
+        # and returns to put before the next one rechecks the budget
+        turn = asyncio.get_running_loop().create_future()
+        waiters.append(turn)
+        try:
+            if waiters[0] is not turn:
+                await turn
+            while not drained.is_set():
+                await drained.wait()
+        finally:
+            head = waiters[0] is turn
+            waiters.remove(turn)
+            if head and waiters and not waiters[0].done():
+                waiters[0].set_result(None)
+
+    async def get(self) -> Packet:
+        while not self._pkts and not self._bulk:
+            await self._nonempty.wait()
+        return self.get_nowait()
+
+    def get_nowait(self) -> Packet:
+        if self._pkts:
+            pkt = self._pkts.popleft()
+            self.queued_bytes -= packet_size(pkt)
+            if self.queued_bytes - self.bulk_bytes <= self.low_water:
+                self._drained.set()
+        elif self._bulk:
+            pkt = self._get_bulk()
+        else:
+            raise asyncio.QueueEmpty()
+        if not self._pkts and not self._bulk:
+            self._nonempty.clear()
+        return pkt
+
+    def _get_bulk(self) -> Packet:
+        part_size = self.part_size
+        if part_size is None:
+            pkt = self._bulk.popleft()
+            self._release_bulk(packet_size(pkt))
+            return pkt
+
+        if self._splitting is None:
+            pkt = self._bulk[0]
+            view = memoryview(pkt.payload)
+            if view.ndim != 1 or view.itemsize != 1:
+                view = view.cast("B")
+            if len(view) > 0:
+                self._splitting = view, 0
+            else:
+                self._bulk.popleft()
+            # the parts release the payload bytes
+            self._release_bulk(packet_size(pkt) - len(view))
+            return Packet(f"bulk:{len(view)!r}", pkt.dir.encode("utf-8"))
+
+        view, offset = self._splitting
+        part = view[offset : offset + part_size]
+        offset += len(part)
+        if offset < len(view):
+            self._splitting = view, offset
+        else:  # last part
+            self._splitting = None
+            self._bulk.popleft()
+        self._release_bulk(len(part))
+        return Packet("part:", part)
+
+    def _release_bulk(self, nbytes: int):
+        self.queued_bytes -= nbytes
+        self.bulk_bytes -= nbytes
+        if self.bulk_bytes <= self.low_water:
+            self._bulk_drained.set()
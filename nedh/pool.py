@@ -0,0 +1,265 @@
+"""
+Pool of client connections to Nedh services
+
+A single connection carries everything in one stream, so a large payload or
+a slow command holds back all that follow it. A pool keeps multiple
+connections, to one or more service addresses, and dispatches each command
+to the connection with the least outstanding work, so concurrent callers
+scale throughput across connections.
+
+Commands dispatched by the pool are not ordered across connections, pass a
+`key` to pin related commands to one connection when order matters.
+
+"""
+__all__ = ["EdhClientPool"]
+
+from typing import *
+import asyncio
+import inspect
+import random
+
+from ..edh import *
+from ..log import *
+
+from .client import *
+from .client import RECONNECT_DELAY, RECONNECT_MAX_DELAY
+from .peer import *
+
+logger = get_logger(__name__)
+
+
+# default number of connections of a pool
+POOL_SIZE = 4
+
+
+class _PoolSlot:
+    __slots__ = ("service", "client", "peer", "inflight")
+
+    def __init__(self, service: Tuple[str, int]):
+        self.service = service
+        self.client: Optional[EdhClient] = None
+        self.peer: Optional[Peer] = None
+        # operations dispatched to this slot, not finished yet
+        self.inflight = 0
+
+    def __repr__(self):
+        return f"<PoolSlot {self.service!r} {self.inflight!r} in flight>"
+
+    def alive(self) -> bool:
+        return self.peer is not None and not self.peer.eol.done()
+
+    def load(self) -> Tuple[int, int]:
+        peer = self.peer
+        return self.inflight + peer.pending_calls, peer.queued_bytes
+
+
+class EdhClientPool:
+    """
+    Pool of `EdhClient` connections, with load-balanced command dispatch
+
+    `services` are ( address, port ) pairs, connections are spread over them
+    in round-robin. A connection lost is recycled with exponential backoff,
+    commands are dispatched to live connections meanwhile. Other keyword
+    arguments are passed to each `EdhClient`.
+
+    """
+
+    def __init__(
+        self,
+        consumer_modu: str,
+        services: Iterable[Tuple[str, int]] = (("127.0.0.1", 3721),),
+        size: int = POOL_SIZE,
+        init: Optional[Callable[[dict], Awaitable]] = None,
+        **client_opts,
+    ):
+        services = list(services)
+        if size < 1 or not services:
+            raise ValueError(f"Invalid pool: size={size!r}, services={services!r}")
+        loop = asyncio.get_running_loop()
+        self.consumer_modu = consumer_modu
+        self.services = services
+        self.size = size
+        self.init = init
+        self.client_opts = client_opts
+
+        self.eol = loop.create_future()
+        self.slots = [_PoolSlot(services[i % len(services)]) for i in range(size)]
+        # set when any connection is alive
+        self._alive = asyncio.Event()
+        # resolved once every connection has been tried for the first time
+        self._tried = loop.create_future()
+        self._first_tries = size
+        for slot in self.slots:
+            asyncio.create_task(self._keep_slot(slot))
+
+    def __repr__(self):
+        return (
+            f"EdhClientPool({self.consumer_modu!r}, {self.services!r},"
+            f" {self.alive_count()!r}/{self.size!r} alive)"
+        )
+
+    def __await__(self):
+        yield from self._tried
+        if not self._alive.is_set():
+            self.stop()
+            raise RuntimeError("No service connected by the pool")
+        return self
+
+    async def join(self):
+        await self.eol
+
+    def stop(self):
+        if not self.eol.done():
+            self.eol.set_result(None)
+        for slot in self.slots:
+            if slot.client is not None:
+                slot.client.stop()
+
+    @property
+    def peers(self) -> List[Peer]:
+        """
+        Peers of connections alive
+        """
+        return [slot.peer for slot in self.slots if slot.alive()]
+
+    def alive_count(self) -> int:
+        return sum(1 for slot in self.slots if slot.alive())
+
+    async def _keep_slot(self, slot: _PoolSlot):
+        delay = RECONNECT_DELAY
+        first_try = True
+        while not self.eol.done():
+            connected = await self._connect_slot(slot)
+            if first_try:
+                first_try = False
+                self._first_tries -= 1
+                if self._first_tries <= 0 and not self._tried.done():
+                    self._tried.set_result(None)
+            if connected:
+                delay = RECONNECT_DELAY
+                self._alive.set()
+                try:
+                    await slot.client.join()
+                except Exception as exc:
+                    logger.warning(f"Pool connection to {slot.service!r} lost: {exc!s}")
+                if not any(s.alive() for s in self.slots):
+                    self._alive.clear()
+            # recycle it after a while, jittered, unless stopped meanwhile
+            done, _pending = await asyncio.wait(
+                {self.eol}, timeout=delay * random.uniform(0.5, 1.0)
+            )
+            if done:
+                break
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _connect_slot(self, slot: _PoolSlot) -> bool:
+        slot.peer = None
+        # resolved with the peer once initialized for this pool
+        ready = asyncio.get_running_loop().create_future()
+
+        async def slot_init(modu: dict):
+            if self.init is not None:
+                maybe_async = self.init(modu)
+                if inspect.isawaitable(maybe_async):
+                    await maybe_async
+            ready.set_result(modu["peer"])
+
+        addr, port = slot.service
+        client = EdhClient(
+            self.consumer_modu, addr, port, slot_init, **self.client_opts
+        )
+        slot.client = client
+        if self.eol.done():  # stopped meanwhile
+            client.stop()
+            return False
+        await asyncio.wait({ready, client.eol}, return_when=asyncio.FIRST_COMPLETED)
+        if not ready.done():
+            # failed connecting, or initializing
+            try:
+                await client.eol
+            except Exception as exc:
+                logger.debug(f"Pool failed connecting to {slot.service!r}: {exc!s}")
+            return False
+        slot.peer = ready.result()
+        return not self.eol.done()
+
+    def pick(self, key: object = None) -> Peer:
+        """
+        Pick the peer of the live connection with least outstanding work
+
+        With a `key`, the same connection is picked for the same key as long
+        as the connection keeps alive, to keep order of related commands.
+        """
+        return self._pick(key).peer
+
+    def _pick(self, key: object = None) -> _PoolSlot:
+        if key is not None:
+            slot = self.slots[hash(key) % self.size]
+            if slot.alive():
+                return slot
+        best, best_load = None, None
+        for slot in self.slots:
+            if not slot.alive():
+                continue
+            load = slot.load()
+            if best is None or load < best_load:
+                best, best_load = slot, load
+        if best is None:
+            raise RuntimeError("No service connection alive in the pool")
+        return best
+
+    async def _acquire(self, key: object) -> _PoolSlot:
+        while True:
+            if self.eol.done():
+                await self.eol  # reraise the exception caused eol if any
+                raise RuntimeError("pool end-of-life")
+            if self._alive.is_set():
+                try:
+                    return self._pick(key)
+                except RuntimeError:
+                    self._alive.clear()
+            # wait for a connection recycled
+            alive = asyncio.create_task(self._alive.wait())
+            try:
+                await asyncio.wait(
+                    {self.eol, alive}, return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                alive.cancel()
+
+    async def _dispatch(self, key: object, op: Callable[[Peer], Awaitable]):
+        slot = await self._acquire(key)
+        slot.inflight += 1
+        try:
+            return await op(slot.peer)
+        finally:
+            slot.inflight -= 1
+
+    async def post_command(self, src: str, dir_: object = "", key: object = None):
+        await self._dispatch(key, lambda peer: peer.post_command(src, dir_))
+
+    async def post_commands(
+        self, srcs: Iterable[str], dir_: object = "", key: object = None
+    ):
+        await self._dispatch(key, lambda peer: peer.post_commands(srcs, dir_))
+
+    async def p2c(self, dir_: object, src: str, key: object = None):
+        await self._dispatch(key, lambda peer: peer.p2c(dir_, src))
+
+    async def p2c_batch(self, dir_: object, srcs: Iterable[str], key: object = None):
+        await self._dispatch(key, lambda peer: peer.p2c_batch(dir_, srcs))
+
+    async def p2c_bin(
+        self, dir_: object, data: object, bulk: bool = False, key: object = None
+    ):
+        await self._dispatch(key, lambda peer: peer.p2c_bin(dir_, data, bulk))
+
+    async def p2c_array(
+        self, dir_: object, arr: "np.ndarray", bulk: bool = False, key: object = None
+    ):
+        await self._dispatch(key, lambda peer: peer.p2c_array(dir_, arr, bulk))
+
+    async def call(
+        self, src: str, timeout: Optional[float] = None, key: object = None
+    ) -> object:
+        return await self._dispatch(key, lambda peer: peer.call(src, timeout))
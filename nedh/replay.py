@@ -0,0 +1,272 @@
+"""
+Replay buffer of outgoing packets, for a client to reconnect without loss
+
+Packets are recorded as they are pumped out to the connection, until
+acknowledged by the remote peer. An acknowledgement is requested with an
+`ackreq:<n>` packet, the remote peer queues it behind packets received
+before it, and answers with `ack:<n>` once its landing loop got there, so
+packets acknowledged have been landed, not merely received. One request is
+outstanding at a time, so acknowledgements are paced by the landing loop.
+
+After a reconnection, packets not acknowledged are sent again before any
+other, so delivery is at-least-once, a packet can be landed twice if its
+acknowledgement was lost with the connection.
+
+A bulk packet with its parts, and a blob stream with its chunks, are a group
+replayed whole or not at all: no acknowledgement drops a group partially,
+and a group dropped for over the budget is not replayed, neither is the rest
+of it sent after a reconnection, as the remote peer can not receive it
+without its start.
+
+Transport control packets are scoped to a connection, they are never
+recorded, nor are calls, whose callers are failed on connection loss
+instead, nor packets of sub-peers, which end with the connection.
+
+"""
+__all__ = ["ReplayBuffer"]
+
+from typing import *
+from collections import deque
+
+from ..log import *
+
+from .mproto import *
+
+logger = get_logger(__name__)
+
+
+# default budget of bytes kept for replay
+REPLAY_MAX_BYTES = 16 * 1024 * 1024
+
+# prefixes of packets not to record for replay
+UNREPLAYED_PREFIXES = {
+    "ack",
+    "ackreq",
+    "call",
+    "credit",
+    "ping",
+    "pong",
+    "rerr",
+    "ret",
+    "shm",
+    "shmack",
+    "shmopen",
+    "sub",
+    "subeol",
+    "subopen",
+}
+
+
+class ReplayBuffer:
+    """
+    Bounded buffer of packets sent but not acknowledged yet
+
+    When over the budget, oldest packets are dropped, with the rest of their
+    groups, they can not be replayed then, see `dropped`.
+    """
+
+    __slots__ = (
+        "max_bytes",
+        "buffered_bytes",
+        "dropped",
+        "_pkts",
+        "_seq",
+        "_bulk_group",
+        "_bulk_remaining",
+        "_bulk_stream",
+        "_streams",
+        "_abandoned",
+        "_withheld",
+        "_ack_seq",
+        "_awaiting",
+        "_marked",
+    )
+
+    def __init__(self, max_bytes: int = REPLAY_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.buffered_bytes = 0
+        # number of packets dropped unacknowledged, for over the budget
+        self.dropped = 0
+        # ( sequence number, packet, sequence number the group of the packet
+        # started with, if in a group ), in the order sent
+        self._pkts: Deque[Tuple[int, Packet, Optional[int]]] = deque()
+        # sequence number of the last packet pumped out
+        self._seq = 0
+        # group of the bulk packet being sent, bytes of its parts yet to be
+        # sent, and the blob stream it is a chunk of if any
+        self._bulk_group: Optional[int] = None
+        self._bulk_remaining = 0
+        self._bulk_stream: Optional[str] = None
+        # [ group, bytes yet to be sent ] of blob streams being sent, by
+        # packet directive
+        self._streams: Dict[str, List[int]] = {}
+        # groups being sent, dropped for over the budget, so not recorded
+        self._abandoned: Set[int] = set()
+        # groups abandoned before a reconnection, so not sent any more
+        self._withheld: Set[int] = set()
+        # sequence number of the last acknowledgement requested
+        self._ack_seq = 0
+        # ( acknowledgement sequence number, packet sequence number ) of the
+        # acknowledgement being awaited
+        self._awaiting: Optional[Tuple[int, int]] = None
+        # packet sequence number marked up to by the last request
+        self._marked = 0
+
+    def __repr__(self):
+        return (
+            f"ReplayBuffer<{len(self._pkts)} packets, {self.buffered_bytes} bytes,"
+            f" {self.dropped} dropped>"
+        )
+
+    def __len__(self):
+        return len(self._pkts)
+
+    def record(self, pkts: List[Packet]) -> List[Packet]:
+        """
+        Record packets being pumped out to the connection, return those to
+        be sent, without the rest of groups withheld after a reconnection
+        """
+        sending = []
+        for pkt in pkts:
+            prefix, sep, _arg = pkt.dir.partition(":")
+            if sep and prefix in UNREPLAYED_PREFIXES:
+                sending.append(pkt)
+                continue
+            self._seq += 1
+            group = self._group(pkt)
+            if group is None or group not in self._withheld:
+                sending.append(pkt)
+                if group is None or group not in self._abandoned:
+                    self._pkts.append((self._seq, pkt, group))
+                    self.buffered_bytes += len(pkt.payload)
+            if group is not None and not self._sending(group):
+                self._abandoned.discard(group)
+                self._withheld.discard(group)
+        while self.buffered_bytes > self.max_bytes and len(self._pkts) > 1:
+            _seq, pkt, group = self._pkts.popleft()
+            self.buffered_bytes -= len(pkt.payload)
+            self.dropped += 1
+            if group is not None:
+                self._drop_group(group)
+            if self.dropped == 1:
+                logger.warning("Replay buffer overflown, packets dropped from it")
+        return sending
+
+    def _group(self, pkt: Packet) -> Optional[int]:
+        # track the group the packet is in, return its start
+        if pkt.dir == "part:":
+            group = self._bulk_group
+            nbytes = len(pkt.payload)
+            self._bulk_remaining -= nbytes
+            if self._bulk_remaining <= 0:
+                self._bulk_group = None
+            if self._bulk_stream is not None:
+                self._streamed(self._bulk_stream, nbytes)
+            return group
+        if pkt.dir.startswith("bulk:"):
+            size = int(pkt.dir[5:])
+            bulk_dir = str(pkt.payload, "utf-8")
+            group = self._stream_group(bulk_dir)
+            self._bulk_stream = None if group is None else bulk_dir
+            if size > 0:
+                if group is None:
+                    group = self._seq
+                self._bulk_group = group
+                self._bulk_remaining = size
+            return group
+        group = self._stream_group(pkt.dir)
+        if group is not None:
+            self._streamed(pkt.dir, len(pkt.payload))
+        return group
+
+    def _stream_group(self, pkt_dir: str) -> Optional[int]:
+        if not pkt_dir.startswith("stream:"):
+            return None
+        stream = self._streams.get(pkt_dir, None)
+        if stream is None:
+            total = int(pkt_dir[7:].split(":", 1)[0])
+            if total <= 0:  # an empty blob is streamed as a single packet
+                return None
+            stream = self._streams[pkt_dir] = [self._seq, total]
+        return stream[0]
+
+    def _streamed(self, pkt_dir: str, nbytes: int):
+        stream = self._streams[pkt_dir]
+        stream[1] -= nbytes
+        if stream[1] <= 0:
+            del self._streams[pkt_dir]
+
+    def _sending(self, group: int) -> bool:
+        # whether more packets of the group are to be sent
+        return group == self._bulk_group or any(
+            stream[0] == group for stream in self._streams.values()
+        )
+
+    def _drop_group(self, group: int):
+        kept = deque()
+        for entry in self._pkts:
+            if entry[2] == group:
+                self.buffered_bytes -= len(entry[1].payload)
+                self.dropped += 1
+            else:
+                kept.append(entry)
+        self._pkts = kept
+        if self._sending(group):
+            self._abandoned.add(group)
+
+    def mark(self) -> Optional[int]:
+        """
+        Mark packets recorded so far to be acknowledged, return the sequence
+        number of the acknowledgement to request
+
+        None is returned if no packet recorded since last marked, or an
+        acknowledgement is being awaited.
+        """
+        if self._awaiting is not None or not self._pkts or self._seq <= self._marked:
+            return None
+        self._ack_seq += 1
+        self._marked = self._seq
+        self._awaiting = self._ack_seq, self._seq
+        return self._ack_seq
+
+    def ack(self, ack_seq: int):
+        """
+        Drop packets acknowledged, except groups acknowledged partially
+        """
+        if self._awaiting is None or self._awaiting[0] != ack_seq:
+            return
+        _ack_seq, acked = self._awaiting
+        self._awaiting = None
+        pkts = self._pkts
+        # groups still being sent, or with packets not acknowledged, are
+        # kept whole
+        for group in (self._bulk_group, *(s[0] for s in self._streams.values())):
+            if group is not None and group not in self._abandoned:
+                acked = min(acked, group - 1)
+        for seq, _pkt, group in reversed(pkts):
+            if seq <= acked:
+                break
+            if group is not None:
+                acked = min(acked, group - 1)
+        while pkts and pkts[0][0] <= acked:
+            _seq, pkt, _group = pkts.popleft()
+            self.buffered_bytes -= len(pkt.payload)
+
+    def replay(self) -> List[Packet]:
+        """
+        Packets to send again after a reconnection, they are kept recorded
+        until acknowledged
+
+        The rest of groups abandoned is withheld from sending afterwards.
+        """
+        # the acknowledgement requested is lost with the connection
+        self._awaiting = None
+        self._marked = 0
+        if self._abandoned:
+            logger.warning(
+                f"{len(self._abandoned)!r} bulk packets or blob streams being sent"
+                " are lost with the connection"
+            )
+            self._withheld.update(self._abandoned)
+            self._abandoned.clear()
+        return [pkt for _seq, pkt, _group in self._pkts]
@@ -8,20 +8,80 @@ __all__ = ["EdhServer"]
 from typing import *
 import asyncio
 import inspect
-
-import runpy
+import os
+from collections import deque
 
 from ..edh import *
 from ..log import *
 
+from .execpol import *
+from .heartbeat import HEARTBEAT_MISSES
+from .metrics import *
 from .mproto import *
 from .peer import *
+from .peermodu import *
+from .pktq import *
+from .pktq import BULK_PART_SIZE, INQ_HIGH_WATER
 
 logger = get_logger(__name__)
 
 
+# default seconds between checks of peers against their budgets
+BUDGET_INTERVAL = 0.5
+
+
+def serverMetricsText(snap: dict) -> str:
+    # metrics of a server in Prometheus text format, with gauges of the
+    # server itself following those aggregated from peers
+    text = prometheusText(snap)
+    text += (
+        "# HELP nedh_peers Peers connected.\n"
+        "# TYPE nedh_peers gauge\n"
+        f"nedh_peers {snap['peers']!r}\n"
+    )
+    admission = snap.get("admission", None)
+    if admission is not None:
+        text += (
+            "# HELP nedh_connections_accepted_total Connections admitted.\n"
+            "# TYPE nedh_connections_accepted_total counter\n"
+            f"nedh_connections_accepted_total {admission['accepted']!r}\n"
+            "# HELP nedh_connections_rejected_total Connections rejected.\n"
+            "# TYPE nedh_connections_rejected_total counter\n"
+            f"nedh_connections_rejected_total {admission['rejected']!r}\n"
+            "# HELP nedh_connections_queued Connections awaiting admission.\n"
+            "# TYPE nedh_connections_queued gauge\n"
+            f"nedh_connections_queued {admission['queued']!r}\n"
+            "# HELP nedh_peers_shed_total Peers shed for over budget.\n"
+            "# TYPE nedh_peers_shed_total counter\n"
+            f"nedh_peers_shed_total {admission['shed']!r}\n"
+        )
+    if "workers" in snap:
+        text += (
+            "# HELP nedh_workers Worker processes alive.\n"
+            "# TYPE nedh_workers gauge\n"
+            f"nedh_workers {snap['workers']!r}\n"
+        )
+    return text
+
+
 class EdhServer:
     """
+    Nedh server listening on TCP, or on a unix domain socket when the server
+    address is in the form of `unix:/path/to/socket`
+
+    With `max_connections`, connections more than that are queued until
+    some served connection closed, per `admission="queue"`, or closed
+    right away, per `admission="reject"`. A queued connection is not read
+    from, and costs no peer object nor any queue, it's rejected after
+    waiting `admission_timeout` seconds, or when `max_queued` connections
+    are already queued, and dropped once its client hung up.
+
+    Peers exceeding their budgets, `max_outq_bytes` of outgoing packets
+    queued, or `max_sink_lag` events published to any of their channels
+    not consumed yet (summed over consumers of the channel), are shed, i.e.
+    brought to end-of-life with an error, as checked every `budget_interval`
+    seconds.
+
     """
 
     def __init__(
@@ -33,7 +93,26 @@ class EdhServer:
         init: Optional[Callable] = None,
         clients: Optional[EventSink] = None,
         net_opts: Optional[Dict] = None,
+        outq_high_water: Optional[int] = None,
+        outq_low_water: Optional[int] = None,
+        inq_high_water: Optional[int] = None,
+        exec_policy: Optional[ExecPolicy] = None,
+        heartbeat_interval: Optional[float] = None,
+        heartbeat_misses: int = HEARTBEAT_MISSES,
+        metrics_file: Optional[str] = None,
+        metrics_interval: float = 10.0,
+        max_connections: Optional[int] = None,
+        admission: str = "queue",
+        max_queued: Optional[int] = None,
+        admission_timeout: Optional[float] = None,
+        max_outq_bytes: Optional[int] = None,
+        max_sink_lag: Optional[int] = None,
+        budget_interval: float = BUDGET_INTERVAL,
     ):
+        if admission not in ("queue", "reject"):
+            raise ValueError(f"Invalid admission policy: {admission!r}")
+        if max_connections is not None and max_connections < 1:
+            raise ValueError(f"Invalid max connections: {max_connections!r}")
         loop = asyncio.get_running_loop()
         eol = loop.create_future()
         self.service_modu = service_modu
@@ -46,6 +125,39 @@ class EdhServer:
         self.server_sockets = loop.create_future()
         self.eol = eol
         self.net_opts = net_opts or {}
+        # byte budget of each outgoing packet queue
+        self.outq_high_water = outq_high_water
+        self.outq_low_water = outq_low_water
+        # byte budget of each incoming packet queue, 0 for one packet at a time
+        self.inq_high_water = inq_high_water
+        # how commands from the peer are evaluated, inline if None
+        self.exec_policy = exec_policy
+        # ping the peer this often to detect it dead, no heartbeat if None
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_misses = heartbeat_misses
+        # peers currently connected
+        self.peers: Set[Peer] = set()
+        # counters of peers disconnected, aggregated
+        self._ended_metrics = aggregateMetrics(())
+        # metrics of all peers are written to this file periodically, in
+        # Prometheus text format, if given
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        # admission control of connections, no limit if max is None
+        self.max_connections = max_connections
+        self.admission = admission
+        self.max_queued = max_queued
+        self.admission_timeout = admission_timeout
+        # budgets of each peer, shed it once exceeded, no budget if None
+        self.max_outq_bytes = max_outq_bytes
+        self.max_sink_lag = max_sink_lag
+        self.budget_interval = budget_interval
+        # connections admitted, rejected, and peers shed, counted so far
+        self.admission_counts = {"accepted": 0, "rejected": 0, "shed": 0}
+        # number of connections being served
+        self._serving = 0
+        # connections awaiting admission, resolved to admit in this order
+        self._admission_queue: Deque[asyncio.Future] = deque()
 
         # mark end-of-stream for clients, end-of-life for server, finally
         def server_cleanup(svr_fut):
@@ -68,6 +180,10 @@ class EdhServer:
                 eol.set_result(None)
 
         asyncio.create_task(self._server_thread()).add_done_callback(server_cleanup)
+        if metrics_file is not None:
+            asyncio.create_task(self._metrics_thread())
+        if max_outq_bytes is not None or max_sink_lag is not None:
+            asyncio.create_task(self._budget_thread())
 
     def __repr__(self):
         return f"EdhServer({self.service_modu!r}, {self.server_addr!r}, {self.server_port!r})"
@@ -84,12 +200,154 @@ class EdhServer:
         if not self.eol.done():
             self.eol.set_result(None)
 
+    def metrics_snapshot(self) -> dict:
+        """
+        Take a snapshot of runtime metrics aggregated over all connected
+        peers, with counters of peers ever disconnected, see
+        `hastalk.nedh.metrics`
+        """
+        snap = aggregateMetrics(
+            (self._ended_metrics, *(peer.metrics_snapshot() for peer in self.peers))
+        )
+        snap["peers"] = len(self.peers)
+        snap["admission"] = dict(
+            self.admission_counts, queued=len(self._admission_queue)
+        )
+        return snap
+
+    async def _admit(self, outlet: PacketProtocol) -> bool:
+        # take a slot to serve the connection, or reject it
+        max_connections = self.max_connections
+        if max_connections is None or self._serving < max_connections:
+            self._serving += 1
+            self.admission_counts["accepted"] += 1
+            return True
+        queue = self._admission_queue
+        if self.admission == "reject" or (
+            self.max_queued is not None and len(queue) >= self.max_queued
+        ):
+            self._reject(outlet, f"{self._serving!r} connections being served")
+            return False
+        # not to buffer anything from the connection before admitted
+        outlet.pause_intake()
+        admitted = asyncio.get_running_loop().create_future()
+        queue.append(admitted)
+        # the client may hang up while queued
+        closed = asyncio.ensure_future(outlet.wait_closed())
+        try:
+            await asyncio.wait(
+                {admitted, self.eol, closed},
+                timeout=self.admission_timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        except BaseException:
+            if admitted.done():  # pass the slot handed over to the next
+                self._release()
+            raise
+        finally:
+            closed.cancel()
+            if not admitted.done():
+                admitted.cancel()
+                queue.remove(admitted)
+        if admitted.cancelled():
+            if self.eol.done():
+                reason = "server stopped"
+            elif outlet.is_closing():
+                reason = "client hung up while queued"
+            else:
+                reason = f"not admitted in {self.admission_timeout!r}s"
+            self._reject(outlet, reason)
+            return False
+        # the slot has been handed over by a connection closed
+        self.admission_counts["accepted"] += 1
+        outlet.resume_intake()
+        return True
+
+    def _reject(self, outlet: PacketProtocol, reason: str):
+        self.admission_counts["rejected"] += 1
+        logger.warning(f"Nedh connection from {outlet.peer_site} rejected: {reason}")
+
+    def _release(self):
+        # hand the slot over to the connection queued first, if any
+        queue = self._admission_queue
+        while queue:
+            admitted = queue.popleft()
+            if not admitted.done():
+                admitted.set_result(None)
+                return
+        self._serving -= 1
+
+    def _over_budget(self, peer: Peer) -> Optional[str]:
+        max_outq_bytes = self.max_outq_bytes
+        if max_outq_bytes is not None and peer.queued_bytes > max_outq_bytes:
+            return f"{peer.queued_bytes!r} bytes queued outgoing"
+        max_sink_lag = self.max_sink_lag
+        if max_sink_lag is not None:
+            for ch_lctr, ch_sink in peer.channels.items():
+                lag = ch_sink.subscriber_lag()
+                if lag > max_sink_lag:
+                    return f"{lag!r} events not consumed from channel {ch_lctr!r}"
+        return None
+
+    async def _budget_thread(self):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    asyncio.shield(self.eol), timeout=self.budget_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            except:
+                return
+            else:
+                return
+            for peer in list(self.peers):
+                reason = self._over_budget(peer)
+                if reason is None or peer.eol.done():
+                    continue
+                self.admission_counts["shed"] += 1
+                logger.warning(f"Nedh peer {peer.ident!s} shed, over budget: {reason}")
+                peer.eol.set_exception(
+                    EdhPeerError(peer.ident, f"shed for over budget: {reason}")
+                )
+
+    async def _metrics_thread(self):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    asyncio.shield(self.eol), timeout=self.metrics_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            except:
+                return
+            else:
+                return
+            try:
+                writePrometheusFile(
+                    self.metrics_file, serverMetricsText(self.metrics_snapshot())
+                )
+            except OSError:
+                logger.warning(
+                    f"Failed writing metrics to {self.metrics_file!s}", exc_info=True
+                )
+
+    def _conn_protocol(self) -> PacketProtocol:
+        # packets are received into buffers with zero-copy, the protocol
+        # object serves as the outlet too
+        return PacketProtocol(
+            lambda proto: asyncio.create_task(self._serv_client(proto, proto))
+        )
+
     async def _server_thread(self):
+        loop = asyncio.get_running_loop()
+        if self.server_addr.startswith("unix:"):
+            return await self._unix_server_thread(self.server_addr[5:])
         port = self.server_port
         while True:
 
-            async with await asyncio.start_server(
-                self._serv_client,
+            async with await loop.create_server(
+                self._conn_protocol,
                 self.server_addr,
                 port,
                 reuse_address=False,
@@ -115,25 +373,63 @@ class EdhServer:
                     pass
                 return
 
+    async def _unix_server_thread(self, sock_path: str):
+        loop = asyncio.get_running_loop()
+        async with await loop.create_unix_server(
+            self._conn_protocol, sock_path, start_serving=False, **self.net_opts,
+        ) as server:
+            await server.start_serving()
+
+            self.server_sockets.set_result(server.sockets)
+
+            try:
+                await self.eol
+            except:
+                pass
+
+        # the socket file is left on the file system by asyncio
+        try:
+            os.unlink(sock_path)
+        except OSError:
+            pass
+
     async def _serv_client(
-        self, intake: asyncio.StreamReader, outlet: asyncio.StreamWriter,
+        self, intake: PacketProtocol, outlet: PacketProtocol,
     ):
         loop = asyncio.get_running_loop()
         eol = loop.create_future()
+        peer = None
+        admitted = False
         try:
-            addr = outlet.get_extra_info("peername", "<some-peer>")
+            admitted = await self._admit(outlet)
+            if not admitted:
+                return
 
             # prepare the peer object
-            ident = str(addr)
-            # outletting currently has no rate limit, maybe add in the future?
-            # with an unbounded queue, backpressure from remote peer is ignored
-            # and outgoing packets can pile up locally
-            poq = asyncio.Queue()
+            ident = outlet.peer_site
+            # outletting is budgeted in bytes, posting awaits once the queued
+            # bytes exceeded the high-water mark, so backpressure from remote
+            # peer propagates to local producers
+            poq = PacketQueue(
+                self.outq_high_water, self.outq_low_water, part_size=BULK_PART_SIZE
+            )
             # intaking should create backpressure when handled slowly, so use a
-            # bounded queue
-            hoq = asyncio.Queue(maxsize=1)
+            # bounded queue, packets received in a burst can be read in batch
+            hoq = PacketQueue(
+                INQ_HIGH_WATER if self.inq_high_water is None else self.inq_high_water
+            )
 
-            peer = Peer(ident=ident, eol=eol, posting=poq.put, hosting=hoq.get,)
+            peer = Peer(
+                ident=ident,
+                eol=eol,
+                posting=poq.put,
+                hosting=hoq.get,
+                outgoing=poq,
+                incoming=hoq,
+                exec_policy=self.exec_policy,
+            )
+            if self.heartbeat_interval is not None:
+                peer.start_heartbeat(self.heartbeat_interval, self.heartbeat_misses)
 
             # per-connection peer module preparation
             modu = {"peer": peer}
@@ -143,29 +439,31 @@ class EdhServer:
                 if inspect.isawaitable(maybe_async):
                     await maybe_async
             # launch the peer module, it normally forks a concurrent task to
-            # run a command landing loop
-            runpy.run_module(
-                self.service_modu, modu,
-            )
+            # run a command landing loop, its code is loaded only once
+            peerModule(self.service_modu).run(modu)
             logger.debug(f"Nedh client peer module {self.service_modu} initialized")
 
+            self.peers.add(peer)
             self.clients.publish(peer)
 
+            # heartbeats are handled right as received, never held back by
+            # the incoming queue
+            intake.urgent = peer.handle_urgent
+
             # pump commands in,
             # this task is the only one reading the socket
             asyncio.create_task(
                 receivePacketStream(
-                    peer_site=ident, intake=intake, pkt_sink=hoq.put, eos=eol,
+                    peer_site=ident,
+                    intake=intake,
+                    pkt_sink=peer.intake_sink(hoq.put, hoq.put_bulk),
+                    eos=eol,
                 )
             )
 
             # pump commands out,
             # this task is the only one writing the socket
-            while True:
-                pkt = await read_stream(eol, poq.get())
-                if pkt is EndOfStream:
-                    break
-                await sendPacket(ident, outlet, pkt)
+            await pumpPackets(ident, outlet, poq, eol)
 
         except asyncio.CancelledError:
             pass
@@ -178,6 +476,14 @@ class EdhServer:
         finally:
             if not eol.done():
                 eol.set_result(None)
+            if peer is not None:
+                self.peers.discard(peer)
+                # keep its counters, so the aggregated ones never go back
+                self._ended_metrics = aggregateMetrics(
+                    (self._ended_metrics, counterMetrics(peer.metrics_snapshot()))
+                )
+            if admitted:
+                self._release()
             # todo post err (if any) to peer
             outlet.close()
             await outlet.wait_closed()
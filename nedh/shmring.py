@@ -0,0 +1,187 @@
+"""
+Shared-memory ring buffer transport for same-host peers
+
+Packets are framed exactly as in `nedh.mproto`, but placed in a ring buffer
+in shared memory, only a small doorbell packet goes through the socket:
+
+    shmopen:<ring size>:<shared memory name>  - the ring is ready for reading
+    shm:<end position>                        - frames available up to there
+    shmack:<position>                         - frames consumed up to there
+
+Positions are virtual, i.e. counted in bytes ever placed into a ring, the
+physical offset being modulo the ring size. They always go through the
+socket in order, so no synchronization on the shared memory is needed.
+
+The writing side creates and owns the shared memory, the reading side just
+attaches to it, only if it opted in with `Peer.accept_shm`.
+
+"""
+__all__ = ["ShmRingWriter", "ShmRingReader"]
+
+from typing import *
+import asyncio
+import os
+from multiprocessing import resource_tracker, shared_memory
+
+from ..edh import *
+from ..log import *
+
+from .mproto import *
+from .mproto import MAX_HEADER_LENGTH, PacketPayload, parsePackets
+
+logger = get_logger(__name__)
+
+
+# default size of a shared memory ring
+SHM_RING_SIZE = 64 * 1024 * 1024
+
+# only packets with payloads at least this large go through the ring
+SHM_MIN_PAYLOAD = 64 * 1024
+
+
+class ShmRingWriter:
+    """
+    Writing side of a shared memory ring
+
+    """
+
+    __slots__ = ("shm", "size", "written", "acked", "closed", "_space")
+
+    def __init__(self, size: int = SHM_RING_SIZE):
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        # the OS may round the size up, stick to the size requested
+        self.size = size
+        # position of bytes ever written
+        self.written = 0
+        # position of bytes ever consumed by the reading side
+        self.acked = 0
+        self.closed = False
+        self._space = asyncio.Event()
+
+    def __repr__(self):
+        return (
+            f"ShmRingWriter<{self.shm.name}: {self.written - self.acked}/{self.size}>"
+        )
+
+    def open_packet(self) -> Packet:
+        return Packet(f"shmopen:{self.size!r}:{self.shm.name!s}", b"")
+
+    async def place(self, pkt: Packet) -> Optional[Packet]:
+        """
+        Place a packet into the ring, return the doorbell packet to be sent
+        via the socket
+
+        None is returned for a packet too large for the ring, it should be
+        sent via the socket as is.
+        """
+        if self.closed:
+            raise RuntimeError("shared memory ring closed")
+        pkt_hdr = f"[{len(pkt.payload)!r}#{pkt.dir!s}]".encode("utf-8")
+        if len(pkt_hdr) > MAX_HEADER_LENGTH:
+            raise EdhPeerError(self.shm.name, "sending out long packet header")
+        frame_len = len(pkt_hdr) + len(pkt.payload)
+        if frame_len > self.size:
+            return None
+        while self.size - (self.written - self.acked) < frame_len:
+            self._space.clear()
+            await self._space.wait()
+            if self.closed:  # released by closing
+                raise RuntimeError("shared memory ring closed")
+        self._write(pkt_hdr)
+        self._write(pkt.payload)
+        return Packet(f"shm:{self.written!r}", b"")
+
+    def _write(self, data: PacketPayload):
+        if self.closed:
+            raise RuntimeError("shared memory ring closed")
+        buf, size = self.shm.buf, self.size
+        n = len(data)
+        offset = self.written % size
+        first = min(n, size - offset)
+        buf[offset : offset + first] = data[:first]
+        if first < n:  # wrap around
+            buf[: n - first] = data[first:]
+        self.written += n
+
+    def ack(self, pos: int):
+        if pos > self.acked:
+            self.acked = pos
+            self._space.set()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        # release producers awaiting space, they'll find the ring closed
+        self._space.set()
+        self.shm.close()
+        if os.name == "posix":
+            # a reading side on Python before 3.13 unregistered it from the
+            # resource tracker, which can be shared with this process, track it
+            # again to be untracked by unlinking
+            resource_tracker.register(self.shm._name, "shared_memory")
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass  # unlinked by resource tracking of an exited reading process
+
+
+class ShmRingReader:
+    """
+    Reading side of a shared memory ring
+
+    """
+
+    __slots__ = ("shm", "size", "consumed")
+
+    def __init__(self, name: str, size: int):
+        try:
+            # the writing side owns the shared memory, don't track it here
+            shm = shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            # Python before 3.13 tracks it anyway, the resource tracker would
+            # unlink it at exit of this process, while the writing side still
+            # uses it
+            shm = shared_memory.SharedMemory(name)
+            if os.name == "posix":
+                resource_tracker.unregister(shm._name, "shared_memory")
+        if not 0 < size <= shm.size:
+            shm.close()
+            raise ValueError(
+                f"invalid ring size {size!r} for shared memory {name!r}"
+                f" of {shm.size!r} bytes"
+            )
+        self.shm = shm
+        self.size = size
+        # position of bytes ever consumed
+        self.consumed = 0
+
+    def __repr__(self):
+        return f"ShmRingReader<{self.shm.name}: {self.consumed}>"
+
+    def take(self, peer_site: str, end_pos: int) -> List[Packet]:
+        """
+        Take all packets placed in the ring up to the position
+
+        Packets are copied out of the ring, so it's free to be acked then.
+        """
+        n = end_pos - self.consumed
+        if n <= 0:
+            return []  # already consumed with a later doorbell
+        buf, size = self.shm.buf, self.size
+        offset = self.consumed % size
+        first = min(n, size - offset)
+        if first < n:  # wrap around
+            frames = b"".join((buf[offset:size], buf[: n - first]))
+        else:
+            frames = bytes(buf[offset : offset + n])
+        self.consumed = end_pos
+
+        pkts = []
+        rpos, pending = parsePackets(peer_site, memoryview(frames), 0, n, None, pkts)
+        if rpos != n or pending is not None:
+            raise EdhPeerError(peer_site, "partial packet in shared memory ring")
+        return pkts
+
+    def close(self):
+        self.shm.close()
@@ -64,6 +64,11 @@ class Worker:
     def __repr__(self):
         return f"<Worker pid={self.pid} via {self.peer.ident}>"
 
+    @property
+    def rtt(self) -> Optional[float]:
+        # smoothed round-trip time, known with heartbeats only
+        return self.peer.rtt
+
 
 class HeadHunter:
     """
@@ -147,6 +152,21 @@ class HeadHunter:
         except:
             pass
 
+        # detect dead swarm nodes in seconds with heartbeats, only if they
+        # answer pings
+        heartbeat_interval = None
+        try:
+            heartbeat_interval = effect("heartbeatInterval")
+        except:
+            pass
+
+        # admit at most this many swarm nodes at a time, others are queued
+        max_connections = None
+        try:
+            max_connections = effect("maxConnections")
+        except:
+            pass
+
         def swarm_conn_init(modu: Dict):
             modu["OfferHeads"] = self.OfferHeads
             modu["StartWorking"] = self.StartWorking
@@ -156,6 +176,8 @@ class HeadHunter:
             swarm_iface,  # local addr to bind
             0,  # local port to bind
             init=swarm_conn_init,
+            heartbeat_interval=heartbeat_interval,
+            max_connections=max_connections,
         )
         ws_sockets = server.server_sockets.result()
         if ws_sockets:
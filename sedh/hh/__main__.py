@@ -56,11 +56,13 @@ async def _run_():
     eol = peer.eol
     try:
 
-        while True:
-            cmd_val = await peer.read_command()
-            if cmd_val is EndOfStream:
-                break
-            if cmd_val is not None:
+        landing = True
+        while landing:
+            # land commands received in a burst all at once
+            for cmd_val in await peer.read_commands():
+                if cmd_val is EndOfStream:
+                    landing = False
+                    break
                 logger.warn(
                     f"Unexpected peer command from forager/worker via: {peer!r}\n  {cmd_val!r}"
                 )
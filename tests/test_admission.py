@@ -0,0 +1,88 @@
+"""
+Admission control of EdhServer
+
+"""
+import asyncio
+
+from hastalk import *
+
+
+SERVICE_MODU = "hastalk.bench.lander"
+
+
+async def connect(port: int):
+    ready = asyncio.get_running_loop().create_future()
+
+    def init(modu: dict):
+        if not ready.done():
+            ready.set_result(modu["peer"])
+
+    client = await EdhClient(SERVICE_MODU, "127.0.0.1", port, init=init)
+    return client, await ready
+
+
+async def until(cond, timeout: float = 5.0):
+    async def poll():
+        while not cond():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+def admission(server: EdhServer) -> dict:
+    return server.metrics_snapshot()["admission"]
+
+
+def test_queued_admitted_on_release():
+    async def main():
+        server = await EdhServer(SERVICE_MODU, "127.0.0.1", 0, max_connections=1)
+        port = server.server_sockets.result()[0].getsockname()[1]
+        try:
+            client1, peer1 = await connect(port)
+            assert await peer1.call("1") == 1
+
+            client2, peer2 = await connect(port)
+            call2 = asyncio.create_task(peer2.call("2"))
+            await until(lambda: admission(server)["queued"] == 1)
+            assert not call2.done()
+
+            # no admission timeout, the queued one is admitted right as the
+            # served one closed
+            client1.stop()
+            assert await asyncio.wait_for(call2, 2) == 2
+            counts = admission(server)
+            assert counts["accepted"] == 2
+            assert counts["queued"] == 0
+            client2.stop()
+        finally:
+            server.stop()
+            await server.join()
+
+    asyncio.run(main())
+
+
+def test_queued_dropped_on_hangup():
+    async def main():
+        server = await EdhServer(SERVICE_MODU, "127.0.0.1", 0, max_connections=1)
+        port = server.server_sockets.result()[0].getsockname()[1]
+        try:
+            client1, peer1 = await connect(port)
+            assert await peer1.call("1") == 1
+
+            _reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            await until(lambda: admission(server)["queued"] == 1)
+            writer.close()
+            await until(lambda: admission(server)["queued"] == 0)
+            assert admission(server)["rejected"] == 1
+
+            # the slot released goes to a live connection
+            client1.stop()
+            client3, peer3 = await connect(port)
+            assert await asyncio.wait_for(peer3.call("3"), 2) == 3
+            assert admission(server)["accepted"] == 2
+            client3.stop()
+        finally:
+            server.stop()
+            await server.join()
+
+    asyncio.run(main())
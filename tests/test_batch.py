@@ -0,0 +1,59 @@
+"""
+Batch packets carrying multiple packets
+
+"""
+import asyncio
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+async def shutdown(server: EdhServer, client: EdhClient):
+    client.stop()
+    server.stop()
+    await server.join()
+
+
+def test_batch_round_trip():
+    pkts = [textPacket("'data'", repr(i)) for i in range(10)]
+    pkts.append(Packet("blob:'x'", b""))
+    batch_pkt = batchPacket("test", pkts)
+    assert batch_pkt.dir == f"batch:{len(pkts)!r}"
+    assert unbatchPacket("test", batch_pkt.payload) == pkts
+    try:
+        unbatchPacket("test", batch_pkt.payload[:-3])
+    except EdhPeerError:
+        pass
+    else:
+        assert False, "partial batch accepted"
+
+
+def test_p2c_batch_landed_in_order():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            data_sink = remote.ensure_channel(DATA_CHAN)
+            n = 5000
+
+            async def consume():
+                received = []
+                async for v in data_sink.stream():
+                    if v is not None:
+                        received.append(v)
+                        if len(received) >= n:
+                            return received
+
+            consuming = asyncio.create_task(consume())
+            await asyncio.sleep(0)
+            # large enough to span multiple batch packets
+            srcs = [repr(f"{i:08d}" * 30) for i in range(n)]
+            await local.p2c_batch(DATA_CHAN, srcs)
+            received = await asyncio.wait_for(consuming, 5)
+            assert received == [f"{i:08d}" * 30 for i in range(n)]
+            # counted by the packets batched
+            assert remote.metrics.counts_in[repr(DATA_CHAN)][0] == n
+            assert 1 < remote.metrics.counts_in["batch"][0] < n
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
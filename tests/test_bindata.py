@@ -0,0 +1,92 @@
+"""
+Binary encoding of structured data
+
+"""
+import asyncio
+from array import array
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+def test_round_trip():
+    data = {
+        "none": None,
+        "flags": (True, False),
+        "ints": [1, -2, 3, 1 << 70],
+        "int64s": [1, -2, 3, 4, 5],
+        "floats": (1.5, -2.5, 3.0, 4.25),
+        "complex": 1 + 2j,
+        "text": "hello, 世界",
+        "bytes": b"\x00\x01\xff",
+        "maybe": [Nothing, Just(3)],
+        "apk": ArgsPack(1, "two", three=3.0),
+        "eos": EndOfStream,
+    }
+    decoded = unpackData(packData(data))
+    assert decoded.keys() == data.keys()
+    for k, v in data.items():
+        if k == "maybe":
+            assert decoded[k][0] is Nothing and decoded[k][1].data == 3
+        elif k == "apk":
+            assert decoded[k].args == v.args and decoded[k].kwargs == v.kwargs
+        else:
+            assert decoded[k] == v, k
+
+
+def test_memoryview_of_wide_items():
+    arr = array("d", [0.5, 1.5, 2.5, 3.5])
+    view = memoryview(arr)
+    assert len(view) != view.nbytes
+    assert unpackData(packData(view)) == arr.tobytes()
+    # multi-dimensional views go whole too
+    grid = memoryview(bytes(range(12))).cast("B", (3, 4))
+    assert unpackData(packData([grid, 1])) == [bytes(range(12)), 1]
+
+
+def test_symbols_interned():
+    sym = Symbol("@someEffect")
+    assert registerSymbol(sym) is sym
+    assert unpackData(packData(Symbol("@someEffect"))) is sym
+    assert unpackData(packData(netPeer)) is netPeer
+    # unregistered symbols decode to the same instance every time
+    first, second = unpackData(packData([Symbol("@other"), Symbol("@other")]))
+    assert first is second
+    assert repr(first) == "@other"
+
+
+def test_peer_round_trip():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            data_sink = remote.ensure_channel(DATA_CHAN)
+            items = [
+                {"seq": 1, "vals": [0.5] * 8},
+                ("large", b"x" * 1000000),
+                Symbol("@last"),
+            ]
+
+            async def consume():
+                received = []
+                async for v in data_sink.stream():
+                    if v is not None:
+                        received.append(v)
+                        if len(received) >= len(items):
+                            return received
+
+            consuming = asyncio.create_task(consume())
+            await asyncio.sleep(0)
+            await local.p2c_bin(DATA_CHAN, items[0])
+            await local.p2c_bin(DATA_CHAN, items[1], bulk=True)
+            await local.p2c_bin(DATA_CHAN, items[2])
+            received = await asyncio.wait_for(consuming, 2)
+            # the bulk one can be overtaken by the others
+            assert received.pop(received.index(items[1])) == items[1]
+            assert received[0] == items[0]
+            assert received[1] is unpackData(packData(Symbol("@last")))
+        finally:
+            client.stop()
+            server.stop()
+            await server.join()
+
+    asyncio.run(main())
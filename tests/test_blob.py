@@ -0,0 +1,103 @@
+"""
+Chunked streaming of large blobs
+
+"""
+import asyncio
+import io
+import os
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+async def shutdown(server: EdhServer, client: EdhClient):
+    client.stop()
+    server.stop()
+    await server.join()
+
+
+async def next_stream(sink: EventSink) -> BlobStream:
+    async for v in sink.stream():
+        if v is not None:
+            return v
+
+
+def test_stream_file_saved(tmp_path):
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            blob = os.urandom(5 * 1024 * 1024 + 123)
+            src_path = tmp_path / "src.bin"
+            src_path.write_bytes(blob)
+            receiving = asyncio.create_task(
+                next_stream(remote.ensure_channel(DATA_CHAN))
+            )
+            await asyncio.sleep(0)
+            streaming = asyncio.create_task(
+                local.p2c_stream(DATA_CHAN, src_path, chunk_size=256 * 1024)
+            )
+            blob_stream = await asyncio.wait_for(receiving, 2)
+            assert blob_stream.total == len(blob)
+            saved_path = tmp_path / "saved.bin"
+            assert await blob_stream.save(saved_path) == len(blob)
+            assert await asyncio.wait_for(streaming, 2) == len(blob)
+            assert saved_path.read_bytes() == blob
+            assert not remote.blob_streams
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
+
+
+def test_stream_buffers_and_empty():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            blob = os.urandom(300000)
+            srcs = [
+                (blob, blob),
+                (memoryview(bytearray(blob)), blob),
+                (io.BytesIO(blob), blob),
+                (b"", b""),
+            ]
+            for ch, (src, expected) in enumerate(srcs):
+                # a channel each, as a sink repeats its last value to a new
+                # consumer
+                receiving = asyncio.create_task(next_stream(remote.ensure_channel(ch)))
+                await asyncio.sleep(0)
+                streaming = asyncio.create_task(
+                    local.p2c_stream(ch, src, chunk_size=65536)
+                )
+                blob_stream = await asyncio.wait_for(receiving, 2)
+
+                async def read_all():
+                    return b"".join([bytes(chunk) async for chunk in blob_stream])
+
+                assert await asyncio.wait_for(read_all(), 2) == expected
+                assert await asyncio.wait_for(streaming, 2) == len(expected)
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
+
+
+def test_overflow_and_abort():
+    async def main():
+        stream = BlobStream(4)
+        await stream.feed(b"ab")
+        try:
+            await stream.feed(b"xyz")
+        except RuntimeError as exc:
+            assert "overflow" in str(exc)
+        else:
+            assert False, "blob overflow accepted"
+        stream.abort(ConnectionResetError("peer gone"))
+        try:
+            async for _chunk in stream:
+                pass
+        except ConnectionResetError:
+            pass
+        else:
+            assert False, "aborted blob stream completed"
+
+    asyncio.run(main())
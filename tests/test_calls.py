@@ -0,0 +1,92 @@
+"""
+Request/response calls on Peer
+
+"""
+import asyncio
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+async def shutdown(server: EdhServer, client: EdhClient):
+    client.stop()
+    server.stop()
+    await server.join()
+
+
+def test_call_failed():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            try:
+                await local.call("1/0")
+            except EdhPeerError as exc:
+                details = exc.details
+            else:
+                assert False, "call failure not raised"
+            assert details == "ZeroDivisionError: division by zero"
+            # the peer lives on
+            assert await local.call("6*7") == 42
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
+
+
+def test_pipelined_calls():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            # all in flight at once, replies are matched by correlation id
+            calls = [asyncio.create_task(local.call(f"{i!r}*2")) for i in range(500)]
+            await asyncio.sleep(0)
+            assert local.pending_calls == len(calls)
+            results = await asyncio.wait_for(asyncio.gather(*calls), 2)
+            assert results == [i * 2 for i in range(500)]
+            assert local.pending_calls == 0
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
+
+
+def test_call_timeout():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            src = "import asyncio\nasyncio.sleep(0.2, 'late')"
+            try:
+                await local.call(src, timeout=0.05)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                assert False, "call not timed out"
+            assert local.pending_calls == 0
+            # the late reply is discarded, later calls unaffected
+            await asyncio.sleep(0.3)
+            assert await local.call("'next'") == "next"
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
+
+
+def test_pending_calls_failed_at_eol():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            calling = asyncio.create_task(
+                local.call("import asyncio\nasyncio.sleep(10)")
+            )
+            await asyncio.sleep(0.05)
+            local.stop()
+            try:
+                await asyncio.wait_for(calling, 1)
+            except RuntimeError as exc:
+                assert "end-of-life" in str(exc)
+            else:
+                assert False, "pending call not failed"
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
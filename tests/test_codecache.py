@@ -0,0 +1,57 @@
+"""
+Compiled code cache shared by peers
+
+"""
+import asyncio
+import logging
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+from hastalk.nedh.peer import CACHED_SRC_NAME, code_cache, exec_py
+
+
+async def shutdown(server: EdhServer, client: EdhClient):
+    client.stop()
+    server.stop()
+    await server.join()
+
+
+def test_shared_across_sub_peers():
+    async def main():
+        server, client, local, remote = await connected_peers()
+
+        async def handler(sub: SubPeer):
+            while True:
+                cmd_vals = await sub.read_commands()
+                if cmd_vals and cmd_vals[-1] is EndOfStream:
+                    break
+
+        remote.sub_handler = handler
+        try:
+            code = "sum(range(17))"
+            assert await local.call(code) == 136
+            hits = code_cache.hits
+            for _ in range(3):
+                sub = local.open_sub()
+                assert await sub.call(code) == 136
+                sub.stop()
+            assert code_cache.hits >= hits + 3
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
+
+
+def test_fixed_src_name(caplog):
+    code_cache.clear()
+    exec_code, _eval_code, _last_def_name = code_cache.compiled("x = 1\nx")
+    assert exec_code.co_filename == CACHED_SRC_NAME
+    with caplog.at_level(logging.ERROR):
+        try:
+            exec_py("1/0", "peer-ident")
+        except ZeroDivisionError:
+            pass
+        else:
+            assert False, "error not raised"
+    # the ident still names the failed code in logs
+    assert "-=-peer-ident-=-" in caplog.text
@@ -0,0 +1,125 @@
+"""
+Credit-based flow control per channel
+
+"""
+import asyncio
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+DATA_DIR = repr(DATA_CHAN)
+
+
+async def granted(peer: Peer):
+    # flow controlled once the first credits arrived
+    while DATA_DIR not in peer.credit_windows:
+        await asyncio.sleep(0.01)
+
+
+async def shutdown(server: EdhServer, client: EdhClient):
+    client.stop()
+    server.stop()
+    await server.join()
+
+
+def test_window_take_grant_close():
+    async def main():
+        window = CreditWindow()
+        window.grant(1)
+        await window.take()
+        taking = asyncio.create_task(window.take())
+        await asyncio.sleep(0.01)
+        assert not taking.done()  # out of credits
+        window.grant(2)
+        await asyncio.wait_for(taking, 1)
+        assert window.available == 1
+        await window.take()
+        taking = asyncio.create_task(window.take())
+        await asyncio.sleep(0.01)
+        window.close()
+        await asyncio.wait_for(taking, 1)
+
+    asyncio.run(main())
+
+
+def test_slow_consumer_bounds_producer():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            window = 8
+            sink = remote.arm_credited_channel(DATA_CHAN, window)
+            n = 200
+            max_lag = 0
+
+            async def consume():
+                nonlocal max_lag
+                received = []
+                async for v in sink.stream():
+                    if v is None:
+                        continue
+                    received.append(v)
+                    max_lag = max(max_lag, sink.seqn - len(received))
+                    if len(received) >= n:
+                        return received
+                    await asyncio.sleep(0.001)
+
+            consuming = asyncio.create_task(consume())
+            await asyncio.wait_for(granted(local), 1)
+            producing = asyncio.create_task(produce(local, n))
+            assert await asyncio.wait_for(consuming, 5) == list(range(n))
+            await asyncio.wait_for(producing, 1)
+            # the producer never ran ahead of the consumer beyond the window
+            assert max_lag <= window
+        finally:
+            await shutdown(server, client)
+
+    async def produce(local: Peer, n: int):
+        for i in range(n):
+            await local.p2c(DATA_CHAN, repr(i))
+
+    asyncio.run(main())
+
+
+def test_unconsumed_credited():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            remote.arm_credited_channel(DATA_CHAN, 4)
+            # nobody consumes, items are credited back as discarded
+            for i in range(20):
+                await asyncio.wait_for(local.p2c(DATA_CHAN, repr(i)), 1)
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
+
+
+def test_blocked_producer_released_at_eol():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            sink = remote.arm_credited_channel(DATA_CHAN, 4)
+            stalled = sink.stream()
+            await stalled.__anext__()  # a consumer never coming back
+            await asyncio.wait_for(granted(local), 1)
+
+            async def produce():
+                for i in range(20):
+                    await local.p2c(DATA_CHAN, repr(i))
+
+            producing = asyncio.create_task(produce())
+            await asyncio.sleep(0.1)
+            assert not producing.done()
+            local.stop()
+            try:
+                await asyncio.wait_for(producing, 1)
+            except RuntimeError as exc:
+                assert "end-of-life" in str(exc)
+            else:
+                assert False, "blocked producer not failed"
+            await stalled.aclose()
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""
+Execution policies offloading command evaluation
+
+"""
+import asyncio
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+async def shutdown(server: EdhServer, client: EdhClient):
+    client.stop()
+    server.stop()
+    await server.join()
+
+
+async def ticks_during(aw) -> tuple:
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticking = asyncio.create_task(tick())
+    try:
+        return await aw, ticks
+    finally:
+        ticking.cancel()
+
+
+def test_thread_exec_keeps_loop_running():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        policy = ThreadExec(max_workers=2)
+        remote.exec_policy = policy
+        try:
+            result, ticks = await ticks_during(
+                local.call("import time\ntime.sleep(0.2)\n'slept'")
+            )
+            assert result == "slept"
+            assert ticks >= 5  # not blocked by the sleep
+            # a coroutine resulted is run on the loop
+            src = "import asyncio\nasyncio.sleep(0, 'async')"
+            assert await local.call(src) == "async"
+        finally:
+            policy.close()
+            await shutdown(server, client)
+
+    asyncio.run(main())
+
+
+def test_channel_policy():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        policy = ProcessExec("math", max_workers=1)
+        sink = remote.arm_channel("math", exec_policy=policy)
+        try:
+
+            async def receive():
+                async for v in sink.stream():
+                    if v is not None:
+                        return v
+
+            receiving = asyncio.create_task(receive())
+            await asyncio.sleep(0)
+            # evaluated in the namespace of the module in a worker process
+            await local.p2c("math", "factorial(10)")
+            assert await asyncio.wait_for(receiving, 30) == 3628800
+            # other commands are evaluated inline
+            assert await local.call("'factorial' in globals()") is False
+        finally:
+            policy.close()
+            await shutdown(server, client)
+
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""
+Heartbeats, round-trip times and dead-peer detection
+
+"""
+import asyncio
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+SERVICE_MODU = "hastalk.bench.lander"
+
+
+def test_rtt_sampled():
+    hb = Heartbeat(interval=1.0, max_missed=3)
+    pings = [hb.ping() for _ in range(3)]
+    assert [pkt.dir for pkt in pings] == ["ping:1", "ping:2", "ping:3"]
+    assert hb.missed == 3
+    hb.pong(2)  # earlier pings not answered are lost
+    assert hb.missed == 1
+    assert hb.rtt is not None and hb.srtt == hb.rtt
+    hb.pong(2)  # answered twice, ignored
+    hb.pong(3)
+    assert hb.missed == 0
+    # sequence numbers continue from a previous heartbeat
+    assert Heartbeat(seq=hb.seq).ping().dir == "ping:4"
+
+
+def test_peers_answer_pings():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            local.start_heartbeat(0.02, 3)
+            for _ in range(100):
+                if local.rtt is not None:
+                    break
+                await asyncio.sleep(0.01)
+            assert 0 < local.rtt < 1
+            await asyncio.sleep(0.2)
+            assert not local.eol.done()
+            assert local.heartbeat.missed <= 1
+        finally:
+            client.stop()
+            server.stop()
+            await server.join()
+
+    asyncio.run(main())
+
+
+def test_dead_peer_detected():
+    async def main():
+        # accepts the connection, but never answers anything
+        async def silent(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            await asyncio.sleep(3600)
+
+        silent_server = await asyncio.start_server(silent, "127.0.0.1", 0)
+        port = silent_server.sockets[0].getsockname()[1]
+        ready = asyncio.get_running_loop().create_future()
+        client = await EdhClient(
+            SERVICE_MODU,
+            "127.0.0.1",
+            port,
+            init=lambda modu: ready.set_result(modu["peer"]),
+            heartbeat_interval=0.05,
+            heartbeat_misses=3,
+        )
+        try:
+            peer = await ready
+            try:
+                await asyncio.wait_for(peer.join(), 2)
+            except EdhPeerError as exc:
+                assert "missed 3 heartbeats" in exc.details
+            else:
+                assert False, "dead peer not detected"
+        finally:
+            client.stop()
+            silent_server.close()
+
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""
+Landing commands from a peer in batches
+
+"""
+import asyncio
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+SERVICE_MODU = "hastalk.bench.lander"
+
+
+async def shutdown(server: EdhServer, client: EdhClient):
+    client.stop()
+    server.stop()
+    await server.join()
+
+
+def test_read_commands_batch():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        served = asyncio.get_running_loop().create_future()
+        remote.sub_handler = served.set_result
+        try:
+            sub = local.open_sub()
+            for i in range(100):
+                await sub.post_packet(textPacket("", repr(i)))
+            await sub.post_command("'marked'", "marks")
+            remote_sub = await asyncio.wait_for(served, 2)
+            marks = remote_sub.ensure_channel("marks")
+            while remote_sub.incoming.qsize() < 101:
+                await asyncio.sleep(0.01)
+            # a burst received is landed in batches of at most max_n
+            batches = [await remote_sub.read_commands(max_n=30) for _ in range(4)]
+            assert [len(cmd_vals) for cmd_vals in batches] == [30, 30, 30, 10]
+            assert [v for cmd_vals in batches for v in cmd_vals] == list(range(100))
+            # commands to channels are published, not returned
+            assert marks.mrv == "marked"
+            sub.stop()
+            assert await asyncio.wait_for(remote_sub.read_commands(), 2) == [
+                EndOfStream
+            ]
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
+
+
+def test_small_intake_depth():
+    async def main():
+        server_peer = asyncio.get_running_loop().create_future()
+        server = await EdhServer(
+            SERVICE_MODU,
+            "127.0.0.1",
+            0,
+            init=lambda modu: server_peer.set_result(modu["peer"]),
+            inq_high_water=1024,
+        )
+        port = server.server_sockets.result()[0].getsockname()[1]
+        ready = asyncio.get_running_loop().create_future()
+        client = await EdhClient(
+            SERVICE_MODU,
+            "127.0.0.1",
+            port,
+            init=lambda modu: ready.set_result(modu["peer"]),
+        )
+        try:
+            local, remote = await ready, await server_peer
+            data_sink = remote.ensure_channel(DATA_CHAN)
+            n = 2000
+
+            async def consume():
+                received = []
+                async for v in data_sink.stream():
+                    if v is not None:
+                        received.append(v)
+                        if len(received) >= n:
+                            return received
+
+            consuming = asyncio.create_task(consume())
+            await asyncio.sleep(0)
+            for i in range(n):
+                await local.p2c(DATA_CHAN, repr(i))
+            # intake held back by the budget, nothing lost
+            assert await asyncio.wait_for(consuming, 5) == list(range(n))
+            assert remote.incoming.high_water == 1024
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""
+Control and bulk priority lanes of peer traffic
+
+"""
+import asyncio
+import os
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+async def shutdown(server: EdhServer, client: EdhClient):
+    client.stop()
+    server.stop()
+    await server.join()
+
+
+def test_control_not_held_back_by_bulk():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            blob_sink = remote.ensure_channel("blob")
+            blob = bytes(64 * 1024 * 1024)
+
+            async def receive():
+                async for v in blob_sink.stream():
+                    if v is not None:
+                        return v
+
+            receiving = asyncio.create_task(receive())
+            await asyncio.sleep(0)
+            posting = asyncio.create_task(
+                local.post_packet(Packet("blob:'blob'", blob), bulk=True)
+            )
+            await asyncio.sleep(0)
+            # answered between parts of the blob
+            assert await asyncio.wait_for(local.call("6*7"), 2) == 42
+            assert not receiving.done()
+            received = await asyncio.wait_for(receiving, 5)
+            assert len(received) == len(blob) and received == blob
+            await posting
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
+
+
+def test_bulk_parts_reassembled():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            blob_sink = remote.ensure_channel("blob")
+            blobs = [os.urandom(size) for size in (0, 1, 1000000, 3 * 1024 * 1024)]
+
+            async def receive():
+                received = []
+                async for v in blob_sink.stream():
+                    if v is not None:
+                        received.append(bytes(v))
+                        if len(received) >= len(blobs):
+                            return received
+
+            receiving = asyncio.create_task(receive())
+            await asyncio.sleep(0)
+            for blob in blobs:
+                await local.post_packet(Packet("blob:'blob'", blob), bulk=True)
+            # bulk packets keep their order among themselves
+            assert await asyncio.wait_for(receiving, 5) == blobs
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""
+Runtime metrics of peers
+
+"""
+import asyncio
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+from hastalk.nedh.metrics import MAX_METRIC_KEYS, directive_key
+
+
+async def shutdown(server: EdhServer, client: EdhClient):
+    client.stop()
+    server.stop()
+    await server.join()
+
+
+def test_directive_keys():
+    assert directive_key("") == ""
+    assert directive_key("'data'") == "'data'"
+    assert directive_key("credit:8:'data'") == "credit"
+    assert directive_key("sub:3:'data'") == "sub"
+    assert directive_key("bin:'data'") == "bin:'data'"
+    assert directive_key("nda:<f8:3,4:C:'data'") == "nda:'data'"
+    assert directive_key("stream:1000:'data'") == "stream:'data'"
+
+
+def test_keys_bounded():
+    metrics = PeerMetrics()
+    for i in range(MAX_METRIC_KEYS * 2):
+        metrics.count_in(repr(i), 1)
+    assert len(metrics.counts_in) <= MAX_METRIC_KEYS + 1
+    assert sum(c[0] for c in metrics.counts_in.values()) == MAX_METRIC_KEYS * 2
+
+
+def test_peer_counts_and_lag():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            data_sink = remote.ensure_channel(DATA_CHAN)
+            stalled = data_sink.stream()
+            await stalled.__anext__()  # a consumer never coming back
+            for i in range(10):
+                await local.p2c(DATA_CHAN, repr(i))
+            assert await local.call("1") == 1
+            snap = remote.metrics_snapshot()
+            assert snap["packets_in"][repr(DATA_CHAN)] == 10
+            assert snap["packets_in"]["call"] == 1
+            assert local.metrics_snapshot()["packets_out"][repr(DATA_CHAN)] == 10
+            chan = snap["channels"][repr(DATA_CHAN)]
+            assert chan["published"] == 10
+            assert chan["subscribers"] == 1
+            assert chan["subscriber_lag"] == 10
+            await stalled.aclose()
+
+            text = prometheusText(server.metrics_snapshot(), {"proc": "test"})
+            assert (
+                f'nedh_packets_in_total{{proc="test",directive="call"}} 1' in text
+            )
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
+
+
+def test_counters_monotonic_as_peers_go():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            for i in range(5):
+                await local.p2c(DATA_CHAN, repr(i))
+            assert await local.call("1") == 1
+            before = server.metrics_snapshot()["packets_in"][repr(DATA_CHAN)]
+            assert before == 5
+            client.stop()
+            await asyncio.wait_for(remote.join(), 2)
+            for _ in range(100):
+                if server.metrics_snapshot()["peers"] == 0:
+                    break
+                await asyncio.sleep(0.01)
+            snap = server.metrics_snapshot()
+            assert snap["peers"] == 0
+            assert snap["packets_in"][repr(DATA_CHAN)] == before
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
@@ -0,0 +1,164 @@
+"""
+Packet framing of the micro protocol
+
+"""
+import asyncio
+
+from hastalk import *
+from hastalk.nedh.mproto import COALESCE_MAX_PAYLOAD, MAX_HEADER_LENGTH
+from hastalk.nedh.mproto import parsePackets
+
+
+def framed(pkts: list) -> bytes:
+    return b"".join(
+        f"[{len(pkt.payload)!r}#{pkt.dir!s}]".encode("utf-8") + bytes(pkt.payload)
+        for pkt in pkts
+    )
+
+
+def small_packets(n: int) -> list:
+    return [textPacket("", repr(i)) for i in range(n)] + [Packet("eol:", b"")]
+
+
+def test_parse_many_in_one_pass():
+    pkts = small_packets(500)
+    wire = framed(pkts)
+    parsed = []
+    rpos, pending = parsePackets("test", memoryview(wire), 0, len(wire), None, parsed)
+    assert (rpos, pending) == (len(wire), None)
+    assert parsed == pkts
+
+
+def test_parse_split_anywhere():
+    pkts = small_packets(20)
+    wire = framed(pkts)
+    for split in range(1, len(wire)):
+        parsed = []
+        view = memoryview(wire[:split])
+        rpos, pending = parsePackets("test", view, 0, split, None, parsed)
+        # the rest continues from the first unparsed byte
+        rest = wire[rpos:]
+        rpos2, pending = parsePackets(
+            "test", memoryview(rest), 0, len(rest), pending, parsed
+        )
+        assert (rpos2, pending) == (len(rest), None)
+        assert parsed == pkts, split
+
+
+def test_parse_bad_headers():
+    for wire in (b"junk", b"[" + b"9" * MAX_HEADER_LENGTH):
+        try:
+            parsePackets("test", memoryview(wire), 0, len(wire), None, [])
+        except EdhPeerError:
+            pass
+        else:
+            assert False, f"bad header accepted: {wire!r}"
+
+
+def test_stream_reader_batches():
+    async def main():
+        pkts = small_packets(2000) + [Packet("blob:", b"x" * 100000)]
+        wire = framed(pkts)
+        reader = asyncio.StreamReader()
+        for i in range(0, len(wire), 777):
+            reader.feed_data(wire[i : i + 777])
+        reader.feed_eof()
+        batches = []
+
+        async def batch_sink(batch: list):
+            batches.append([Packet(pkt.dir, bytes(pkt.payload)) for pkt in batch])
+
+        eos = asyncio.get_running_loop().create_future()
+        await receivePacketBatches("test", reader, batch_sink, eos, chunk_size=4096)
+        assert eos.result() is EndOfStream
+        assert [pkt for batch in batches for pkt in batch] == pkts
+        # many small packets per chunk read
+        assert len(batches) < len(pkts) // 10
+
+    asyncio.run(main())
+
+
+class RecordingOutlet:
+    # just enough of a stream writer, recording the writes
+    def __init__(self):
+        self.writes = []
+        self.drains = 0
+        self.buffered = 0
+        self.closing = False
+        self.transport = self
+
+    def write(self, data):
+        self.writes.append([data])
+        self.buffered += len(data)
+
+    def writelines(self, list_of_data):
+        self.writes.append(list(list_of_data))
+        self.buffered += sum(len(data) for data in list_of_data)
+
+    def get_write_buffer_size(self) -> int:
+        return self.buffered
+
+    def is_closing(self) -> bool:
+        return self.closing
+
+    async def drain(self):
+        self.drains += 1
+        self.buffered = 0
+
+    def wire(self) -> bytes:
+        return b"".join(bytes(data) for bufs in self.writes for data in bufs)
+
+
+def test_send_coalesced():
+    async def main():
+        outlet = RecordingOutlet()
+        pkts = small_packets(100)
+        await sendPackets("test", outlet, pkts)
+        assert len(outlet.writes) == 1
+        assert outlet.wire() == framed(pkts)
+        # under the high-water mark, not drained
+        assert outlet.drains == 0
+        # unless closing, for writes to a lost connection to raise
+        outlet.closing = True
+        await sendPackets("test", outlet, pkts)
+        assert outlet.drains == 1
+
+    asyncio.run(main())
+
+
+def test_send_large_payload_alone():
+    async def main():
+        outlet = RecordingOutlet()
+        blob = memoryview(bytearray(COALESCE_MAX_PAYLOAD + 1))
+        pkts = [textPacket("", "1"), Packet("blob:", blob), textPacket("", "2")]
+        await sendPackets("test", outlet, pkts, high_water=len(blob))
+        assert outlet.wire() == framed(pkts)
+        # written as is, not copied into a joined buffer
+        assert any(bufs == [blob] for bufs in outlet.writes)
+        assert outlet.drains == 1
+
+    asyncio.run(main())
+
+
+def test_pump_queued_together():
+    async def main():
+        outlet = RecordingOutlet()
+        poq = asyncio.Queue()
+        pkts = small_packets(50)
+        for pkt in pkts:
+            poq.put_nowait(pkt)
+        batches = []
+
+        def sent(batch: list) -> list:
+            batches.append(batch)
+            return [pkt for pkt in batch if pkt.dir != "eol:"]
+
+        eos = asyncio.get_running_loop().create_future()
+        pumping = asyncio.create_task(pumpPackets("test", outlet, poq, eos, sent=sent))
+        await asyncio.sleep(0.01)
+        eos.set_result(EndOfStream)
+        await asyncio.wait_for(pumping, 1)
+        assert batches == [pkts]
+        assert outlet.wire() == framed(pkts[:-1])
+
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""
+Multi-process server over SO_REUSEPORT
+
+"""
+import asyncio
+import os
+
+from hastalk import *
+
+
+SERVICE_MODU = "hastalk.bench.lander"
+
+
+async def connect(port: int):
+    ready = asyncio.get_running_loop().create_future()
+    client = await EdhClient(
+        SERVICE_MODU,
+        "127.0.0.1",
+        port,
+        init=lambda modu: ready.set_result(modu["peer"]),
+    )
+    await asyncio.wait({ready, client.eol}, return_when=asyncio.FIRST_COMPLETED)
+    if not ready.done():
+        await client.eol  # raise the failure of connecting
+        raise RuntimeError("disconnected before initialized")
+    return client, ready.result()
+
+
+async def until(cond, timeout: float = 10.0):
+    async def poll():
+        while not cond():
+            await asyncio.sleep(0.02)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_served_by_workers():
+    async def main():
+        server = await EdhMultiServer(SERVICE_MODU, "127.0.0.1", 0, workers=2)
+        clients = []
+        try:
+            (_addr, port), = server.server_addrs.result()
+            pids = set()
+            for _ in range(8):
+                client, peer = await connect(port)
+                clients.append(client)
+                pids.add(await peer.call("import os\nos.getpid()"))
+            assert os.getpid() not in pids
+            await until(lambda: len(server.connected) == len(clients))
+            assert {c.pid for c in server.connected} == pids
+        finally:
+            for client in clients:
+                client.stop()
+            server.stop()
+            await server.join()
+
+    asyncio.run(main())
+
+
+def test_died_worker_restarted():
+    async def main():
+        server = await EdhMultiServer(
+            SERVICE_MODU, "127.0.0.1", 0, workers=1, restart_delay=0.05
+        )
+        try:
+            (_addr, port), = server.server_addrs.result()
+            worker = server.workers[0]
+            died_pid = worker.process.pid
+            worker.process.kill()
+            await until(
+                lambda: worker.process.pid != died_pid and worker.process.is_alive()
+            )
+            client, peer = None, None
+            for _ in range(100):  # until the restarted worker is listening
+                try:
+                    client, peer = await connect(port)
+                    break
+                except OSError:  # not listening yet
+                    await asyncio.sleep(0.05)
+            assert await peer.call("6*7") == 42
+            client.stop()
+        finally:
+            server.stop()
+            await server.join()
+
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+"""
+NumPy ndarray transport
+
+"""
+import asyncio
+
+import pytest
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+np = pytest.importorskip("numpy")
+
+
+def unpacked(arr: "np.ndarray", payload_type: type) -> "np.ndarray":
+    pkt = arrayPacket("'data'", arr)
+    assert pkt.dir.startswith("nda:")
+    decoded, ch_dir = unpackArray(pkt.dir[4:], payload_type(pkt.payload))
+    assert ch_dir == "'data'"
+    return decoded
+
+
+def test_round_trip():
+    arrays = [
+        np.arange(12, dtype="<f8").reshape(3, 4),
+        np.asfortranarray(np.arange(12, dtype=">i4").reshape(3, 4)),
+        np.arange(20, dtype="u2")[::2],
+        np.array(["2026-01-01", "2026-10-18"], dtype="datetime64[ns]"),
+        np.float32(3.5).reshape(()),
+    ]
+    for arr in arrays:
+        for payload_type in (bytes, bytearray, memoryview):
+            decoded = unpacked(arr, payload_type)
+            assert decoded.dtype == arr.dtype
+            assert np.array_equal(decoded, arr)
+
+
+def test_always_read_only():
+    arr = np.arange(1000, dtype="<f8")
+    for payload_type in (bytes, bytearray, memoryview):
+        decoded = unpacked(arr, payload_type)
+        assert not decoded.flags.writeable, payload_type
+        assert decoded.copy().flags.writeable
+    # unaligned, thus copied payloads, are read-only too
+    payload = bytearray(1 + arr.nbytes)
+    payload[1:] = arr.tobytes()
+    decoded, _ch_dir = unpackArray(
+        arrayPacket("'data'", arr).dir[4:], memoryview(payload)[1:]
+    )
+    assert np.array_equal(decoded, arr)
+    assert not decoded.flags.writeable
+
+
+def test_peer_round_trip():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            data_sink = remote.ensure_channel(DATA_CHAN)
+            arrays = [
+                np.arange(10, dtype="i8"),
+                np.random.default_rng(0).random((512, 512)),
+                np.zeros((0, 3), dtype="f4"),
+            ]
+
+            async def consume():
+                received = []
+                async for v in data_sink.stream():
+                    if v is not None:
+                        received.append(v)
+                        if len(received) >= len(arrays):
+                            return received
+
+            consuming = asyncio.create_task(consume())
+            await asyncio.sleep(0)
+            for arr in arrays:
+                await local.p2c_array(DATA_CHAN, arr, bulk=arr.nbytes > 1024)
+            received = await asyncio.wait_for(consuming, 2)
+            # the bulk one can be overtaken by the others
+            received.sort(key=lambda got: got.nbytes)
+            for arr, got in zip(sorted(arrays, key=lambda arr: arr.nbytes), received):
+                assert got.dtype == arr.dtype and got.shape == arr.shape
+                assert np.array_equal(got, arr)
+                assert not got.flags.writeable
+        finally:
+            client.stop()
+            server.stop()
+            await server.join()
+
+    asyncio.run(main())
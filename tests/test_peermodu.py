@@ -0,0 +1,48 @@
+"""
+Peer module code loaded once per process
+
+"""
+import sys
+
+from hastalk import *
+
+
+def write_module(tmp_path, name: str, src: str):
+    (tmp_path / f"{name}.py").write_text(src, encoding="utf-8")
+
+
+def test_loaded_once_run_fresh(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    write_module(tmp_path, "nedh_test_modu", "runs = [peer]\nrunning = __name__\n")
+    modu = peerModule("nedh_test_modu")
+    assert peerModule("nedh_test_modu") is modu
+    first = modu.run({"peer": 1})
+    second = modu.run({"peer": 2})
+    # a fresh namespace per run
+    assert first["runs"] == [1] and second["runs"] == [2]
+    assert second["running"] == "nedh_test_modu"
+    assert second["__file__"] == str(tmp_path / "nedh_test_modu.py")
+    # source changes take effect after the process restarted only
+    write_module(tmp_path, "nedh_test_modu", "runs = None\n")
+    assert peerModule("nedh_test_modu").run({"peer": 3})["runs"] == [3]
+    assert "nedh_test_modu" not in sys.modules
+
+
+def test_package_run_by_main(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    pkg_dir = tmp_path / "nedh_test_pkg"
+    pkg_dir.mkdir()
+    (pkg_dir / "__init__.py").write_text("", encoding="utf-8")
+    (pkg_dir / "__main__.py").write_text("ran = __name__\n", encoding="utf-8")
+    modu = PeerModule("nedh_test_pkg")
+    assert modu.name == "nedh_test_pkg.__main__"
+    assert modu.run()["ran"] == "nedh_test_pkg.__main__"
+
+
+def test_missing_module():
+    try:
+        PeerModule("nedh_no_such_modu")
+    except ImportError as exc:
+        assert "nedh_no_such_modu" in str(exc)
+    else:
+        assert False, "missing module loaded"
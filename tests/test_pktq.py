@@ -0,0 +1,79 @@
+"""
+Budgeted packet queue with control and bulk lanes
+
+"""
+import asyncio
+
+from hastalk import *
+
+
+def test_control_overtakes_bulk():
+    q = PacketQueue()
+    q.put_bulk_nowait(Packet("blob:'a'", b"a" * 10))
+    q.put_nowait(textPacket("", "1"))
+    q.put_bulk_nowait(Packet("blob:'b'", b"b" * 10))
+    q.put_nowait(textPacket("", "2"))
+    got = [q.get_nowait().dir for _ in range(q.qsize())]
+    assert got == ["", "", "blob:'a'", "blob:'b'"]
+    assert q.empty() and q.queued_bytes == 0
+
+
+def test_bulk_split_into_parts():
+    q = PacketQueue(part_size=4)
+    q.put_bulk_nowait(Packet("blob:'x'", b"0123456789"))
+    q.put_bulk_nowait(Packet("blob:'y'", b""))
+    got = []
+    while not q.empty():
+        got.append(q.get_nowait())
+    assert [(pkt.dir, bytes(pkt.payload)) for pkt in got] == [
+        ("bulk:10", b"blob:'x'"),
+        ("part:", b"0123"),
+        ("part:", b"4567"),
+        ("part:", b"89"),
+        ("bulk:0", b"blob:'y'"),
+    ]
+    assert q.queued_bytes == q.bulk_bytes == 0
+
+
+def test_backpressure_and_fifo():
+    async def main():
+        q = PacketQueue(high_water=100, low_water=50)
+        await q.put(Packet("", b"x" * 150))  # larger than budget, accepted
+        assert q.over_budget()
+        order = []
+
+        async def produce(name: str, size: int):
+            await q.put(Packet(name, b"x" * size))
+            order.append(name)
+
+        producers = [
+            asyncio.create_task(produce(name, size))
+            for name, size in (("large", 90), ("small1", 1), ("small2", 1))
+        ]
+        await asyncio.sleep(0.01)
+        assert not order  # all await the budget
+        while len(order) < len(producers):
+            q.get_nowait()
+            await asyncio.sleep(0.01)
+        # admitted in the order they came
+        assert order == ["large", "small1", "small2"]
+        await asyncio.gather(*producers)
+
+    asyncio.run(main())
+
+
+def test_close_releases_producers():
+    async def main():
+        q = PacketQueue(high_water=10)
+        q.put_nowait(Packet("", b"x" * 100))
+        q.put_bulk_nowait(Packet("blob:", b"x" * 100))
+        putting = [
+            asyncio.create_task(q.put(Packet("", b"x"))),
+            asyncio.create_task(q.put_bulk(Packet("blob:", b"x"))),
+        ]
+        await asyncio.sleep(0.01)
+        assert not any(task.done() for task in putting)
+        q.close()
+        await asyncio.wait_for(asyncio.gather(*putting), 1)
+
+    asyncio.run(main())
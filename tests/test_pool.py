@@ -0,0 +1,91 @@
+"""
+Client connection pool with load-balanced dispatch
+
+"""
+import asyncio
+
+from hastalk import *
+
+
+SERVICE_MODU = "hastalk.bench.lander"
+
+
+async def serve():
+    server = await EdhServer(SERVICE_MODU, "127.0.0.1", 0)
+    return server, server.server_sockets.result()[0].getsockname()[1]
+
+
+def test_calls_spread_over_connections():
+    async def main():
+        server, port = await serve()
+        pool = await EdhClientPool(SERVICE_MODU, [("127.0.0.1", port)], size=4)
+        try:
+            assert pool.alive_count() == 4
+            results = await asyncio.wait_for(
+                asyncio.gather(*(pool.call(f"{i!r}+1") for i in range(400))), 5
+            )
+            assert results == [i + 1 for i in range(400)]
+            # every connection got some of them
+            assert all(
+                peer.metrics.counts_out.get("call", [0])[0] > 0 for peer in pool.peers
+            )
+        finally:
+            pool.stop()
+            server.stop()
+            await server.join()
+
+    asyncio.run(main())
+
+
+def test_key_pins_connection():
+    async def main():
+        server, port = await serve()
+        pool = await EdhClientPool(SERVICE_MODU, [("127.0.0.1", port)], size=4)
+        try:
+            picked = {pool.pick(key="order-1") for _ in range(10)}
+            assert len(picked) == 1
+        finally:
+            pool.stop()
+            server.stop()
+            await server.join()
+
+    asyncio.run(main())
+
+
+def test_connection_recycled():
+    async def main():
+        server, port = await serve()
+        pool = await EdhClientPool(SERVICE_MODU, [("127.0.0.1", port)], size=2)
+        try:
+            lost = pool.peers[0]
+            lost.stop()
+            await asyncio.sleep(0)
+            # dispatched to the live one meanwhile
+            assert await pool.call("1") == 1
+            for _ in range(300):
+                if pool.alive_count() == 2:
+                    break
+                await asyncio.sleep(0.01)
+            assert pool.alive_count() == 2
+            assert lost not in pool.peers
+        finally:
+            pool.stop()
+            server.stop()
+            await server.join()
+
+    asyncio.run(main())
+
+
+def test_no_service():
+    async def main():
+        server, port = await serve()
+        server.stop()
+        await server.join()
+        try:
+            await EdhClientPool(SERVICE_MODU, [("127.0.0.1", port)], size=2)
+        except RuntimeError as exc:
+            assert "No service connected" in str(exc)
+        else:
+            assert False, "pool without service connected"
+
+    asyncio.run(main())
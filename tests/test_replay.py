@@ -0,0 +1,130 @@
+"""
+Replay buffer of a reconnecting client
+
+"""
+import asyncio
+
+from hastalk import *
+from hastalk.nedh.metrics import PeerMetrics
+
+
+SERVICE_MODU = "hastalk.bench.lander"
+DATA_DIR = repr(DATA_CHAN)
+
+
+def bulk_packets(pkt_dir: str, payload: bytes, part_size: int):
+    # a bulk packet as split by an outgoing queue
+    pkts = [Packet(f"bulk:{len(payload)!r}", pkt_dir.encode("utf-8"))]
+    for i in range(0, len(payload), part_size):
+        pkts.append(Packet("part:", payload[i : i + part_size]))
+    return pkts
+
+
+def test_ack_drops_acknowledged():
+    replay = ReplayBuffer()
+    pkts = [Packet(DATA_DIR, repr(i).encode()) for i in range(3)]
+    assert replay.record(pkts) == pkts
+    ack_seq = replay.mark()
+    assert ack_seq is not None
+    # one request outstanding at a time
+    assert replay.mark() is None
+    replay.record([Packet(DATA_DIR, b"3")])
+    replay.ack(ack_seq)
+    assert [pkt.payload for pkt in replay.replay()] == [b"3"]
+
+
+def test_control_packets_not_recorded():
+    replay = ReplayBuffer()
+    pkts = [Packet("ackreq:1", b""), Packet("ping:3", b""), Packet("ret:1", b"")]
+    assert replay.record(pkts) == pkts
+    assert len(replay) == 0
+
+
+def test_group_not_acked_partially():
+    replay = ReplayBuffer()
+    blob = bytes(range(256)) * 16
+    pkts = bulk_packets("blob:'x'", blob, 1024)
+    # header and the first part sent, then acknowledged
+    replay.record(pkts[:2])
+    replay.ack(replay.mark())
+    assert len(replay) == 2
+    replay.record(pkts[2:])
+    replay.ack(replay.mark())
+    assert len(replay) == 0
+
+
+def test_overflown_group_withheld():
+    replay = ReplayBuffer(max_bytes=2048)
+    blob = bytes(range(256)) * 16
+    pkts = bulk_packets("blob:'x'", blob, 1024)
+    replay.record(pkts[:4])  # over the budget, dropped whole
+    assert len(replay) == 0
+    assert replay.dropped > 0
+    assert replay.replay() == []
+    # rest of the group is not sent after reconnected, other packets are
+    other = Packet(DATA_DIR, b"1")
+    assert replay.record(pkts[4:] + [other]) == [other]
+
+
+def test_ack_traffic_metric_keys():
+    metrics = PeerMetrics()
+    metrics.count_out(DATA_DIR, 1)
+    for n in range(1, 1000):
+        metrics.count_out(f"ackreq:{n!r}", 0)
+        metrics.count_in(f"ack:{n!r}", 0)
+    assert set(metrics.counts_out) == {DATA_DIR, "ackreq"}
+    assert set(metrics.counts_in) == {"ack"}
+
+
+def test_reconnect_replay(tmp_path):
+    sock = f"unix:{tmp_path / 'replay.sock'!s}"
+    received = []
+
+    def server_init(modu: dict):
+        peer = modu["peer"]
+
+        async def consume():
+            async for v in peer.ensure_channel(DATA_CHAN).stream():
+                if v is not None:
+                    received.append(v)
+
+        asyncio.create_task(consume())
+
+    async def main():
+        server = await EdhServer(SERVICE_MODU, sock, init=server_init)
+        ready = asyncio.get_running_loop().create_future()
+        client = await EdhClient(
+            SERVICE_MODU,
+            sock,
+            init=lambda modu: ready.set_result(modu["peer"]),
+            reconnect=True,
+            reconnect_delay=0.05,
+        )
+        peer = await ready
+        n = 1000
+
+        async def produce():
+            for i in range(n):
+                await peer.p2c(DATA_CHAN, repr(i))
+                if i % 50 == 0:
+                    await asyncio.sleep(0.005)
+
+        producing = asyncio.create_task(produce())
+        try:
+            await asyncio.sleep(0.05)
+            for server_peer in list(server.peers):
+                server_peer.stop()
+            server.stop()
+            await server.join()
+            server = await EdhServer(SERVICE_MODU, sock, init=server_init)
+            await asyncio.wait_for(producing, 5)
+            assert await asyncio.wait_for(peer.call("6*7"), 5) == 42
+            assert set(received) >= set(range(n))
+            assert len(peer.replay) == 0
+        finally:
+            client.stop()
+            await client.join()
+            server.stop()
+            await server.join()
+
+    asyncio.run(main())
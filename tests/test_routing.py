@@ -0,0 +1,65 @@
+"""
+Routing of commands to channels by their directives
+
+"""
+import asyncio
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+from hastalk.nedh.peer import MAX_ROUTES
+
+
+async def shutdown(server: EdhServer, client: EdhClient):
+    client.stop()
+    server.stop()
+    await server.join()
+
+
+async def received(sink: EventSink, n: int) -> list:
+    vals = []
+    async for v in sink.stream():
+        if v is not None:
+            vals.append(v)
+            if len(vals) >= n:
+                return vals
+
+
+def test_literal_and_dynamic_directives():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            lctrs = [3, "chan", ("pair", 2)]
+            sinks = [remote.ensure_channel(lctr) for lctr in lctrs]
+            receiving = [asyncio.create_task(received(sink, 2)) for sink in sinks]
+            await asyncio.sleep(0)
+            for i, lctr in enumerate(lctrs):
+                await local.p2c(lctr, repr(i))
+            # evaluated in the peer module, not literals
+            for i, dir_ in enumerate(["1+2", "'ch'+'an'", "('pair', 1+1)"]):
+                await local.post_packet(textPacket(dir_, repr(-i)))
+            results = await asyncio.wait_for(asyncio.gather(*receiving), 2)
+            assert results == [[0, 0], [1, -1], [2, -2]]
+            assert remote.routes["'chan'"] == "chan"
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
+
+
+def test_routes_bounded():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            sink = remote.ensure_channel(DATA_CHAN)
+            receiving = asyncio.create_task(received(sink, 1))
+            await asyncio.sleep(0)
+            for i in range(MAX_ROUTES + 10):
+                remote._route(repr(i))
+            assert len(remote.routes) <= MAX_ROUTES
+            # still routed after the table reset
+            await local.p2c(DATA_CHAN, "'x'")
+            assert await asyncio.wait_for(receiving, 2) == ["x"]
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
@@ -0,0 +1,165 @@
+"""
+Shared memory ring transport for same-host peers
+
+"""
+import asyncio
+import os
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+SERVICE_MODU = "hastalk.bench.lander"
+BLOB_SIZE = 1024 * 1024
+
+
+async def shutdown(server: EdhServer, client: EdhClient):
+    client.stop()
+    server.stop()
+    await server.join()
+
+
+async def post_blobs(local: Peer, remote: Peer, blobs: list) -> list:
+    blob_sink = remote.ensure_channel("blob")
+
+    async def consume():
+        received = []
+        async for data in blob_sink.stream():
+            if data is not None:
+                received.append(bytes(data))
+                if len(received) >= len(blobs):
+                    return received
+
+    consumer = asyncio.create_task(consume())
+    await asyncio.sleep(0)
+    for blob in blobs:
+        await local.post_packet(Packet("blob:'blob'", blob))
+    return await asyncio.wait_for(consumer, 5)
+
+
+def test_ring_round_trip():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            remote.accept_shm = True
+            await local.open_shm_ring(4 * BLOB_SIZE)
+            blobs = [os.urandom(BLOB_SIZE) for _ in range(16)]
+            assert await post_blobs(local, remote, blobs) == blobs
+            assert local.metrics.counts_out["shm"][0] > 0
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
+
+
+def test_ring_refused():
+    async def main():
+        server, client, local, remote = await connected_peers()
+        try:
+            await local.open_shm_ring()
+            await asyncio.wait_for(remote.join(), 2)
+        except EdhPeerError as exc:
+            assert "not accepted" in exc.details
+        else:
+            assert False, "shared memory ring not refused"
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
+
+
+def test_writer_closed():
+    async def main():
+        writer = ShmRingWriter(BLOB_SIZE)
+        writer.close()
+        writer.close()  # idempotent
+        try:
+            await writer.place(Packet("blob:", b"x" * 1024))
+        except RuntimeError as exc:
+            assert "closed" in str(exc)
+        else:
+            assert False, "placed into a closed ring"
+
+    asyncio.run(main())
+
+
+def test_no_ring_with_replay():
+    async def main():
+        server_peer = asyncio.get_running_loop().create_future()
+
+        def server_init(modu: dict):
+            modu["peer"].accept_shm = True
+            server_peer.set_result(modu["peer"])
+
+        server = await EdhServer(SERVICE_MODU, "127.0.0.1", 0, init=server_init)
+        port = server.server_sockets.result()[0].getsockname()[1]
+        ready = asyncio.get_running_loop().create_future()
+        client = await EdhClient(
+            SERVICE_MODU,
+            "127.0.0.1",
+            port,
+            init=lambda modu: ready.set_result(modu["peer"]),
+            reconnect=True,
+        )
+        try:
+            local, remote = await ready, await server_peer
+            await local.open_shm_ring()
+            blobs = [os.urandom(BLOB_SIZE) for _ in range(4)]
+            assert await post_blobs(local, remote, blobs) == blobs
+            # replayable, as sent over the socket
+            assert "shm" not in local.metrics.counts_out
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
+
+
+def test_writer_reader_wrap_around():
+    async def main():
+        writer = ShmRingWriter(1000)
+        reader = ShmRingReader(writer.shm.name, writer.size)
+        try:
+            for i in range(20):
+                pkt = Packet(f"blob:'x{i!r}'", os.urandom(300 + i))
+                doorbell = await writer.place(pkt)
+                end_pos = int(doorbell.dir.split(":", 1)[1])
+                assert reader.take("test", end_pos) == [pkt]
+                writer.ack(end_pos)
+            assert writer.written > 3 * writer.size
+            # a packet larger than the ring goes via the socket
+            assert await writer.place(Packet("blob:", b"x" * 1000)) is None
+        finally:
+            reader.close()
+            writer.close()
+
+    asyncio.run(main())
+
+
+def test_place_awaits_ack():
+    async def main():
+        writer = ShmRingWriter(1000)
+        try:
+            await writer.place(Packet("blob:", b"x" * 600))
+            placing = asyncio.create_task(writer.place(Packet("blob:", b"y" * 600)))
+            await asyncio.sleep(0.01)
+            assert not placing.done()  # no space before acked
+            writer.ack(writer.written)
+            assert await asyncio.wait_for(placing, 1) is not None
+        finally:
+            writer.close()
+
+    asyncio.run(main())
+
+
+def test_reader_size_validated():
+    writer = ShmRingWriter(BLOB_SIZE)
+    try:
+        for size in (0, -1, 1 << 40):
+            try:
+                ShmRingReader(writer.shm.name, size)
+            except ValueError as exc:
+                assert "invalid ring size" in str(exc)
+            else:
+                assert False, f"invalid ring size {size!r} accepted"
+    finally:
+        writer.close()
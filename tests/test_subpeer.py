@@ -0,0 +1,101 @@
+"""
+Sub-peers multiplexed over one connection
+
+"""
+import asyncio
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+async def serving_peers(handler):
+    server, client, local, remote = await connected_peers()
+    remote.sub_handler = handler
+    return server, client, local, remote
+
+
+async def shutdown(server: EdhServer, client: EdhClient):
+    client.stop()
+    server.stop()
+    await server.join()
+
+
+async def land_all(sub: SubPeer):
+    while True:
+        cmd_vals = await sub.read_commands()
+        if cmd_vals and cmd_vals[-1] is EndOfStream:
+            break
+
+
+def test_clean_close():
+    async def main():
+        served = asyncio.get_running_loop().create_future()
+
+        async def handler(sub: SubPeer):
+            served.set_result(sub)
+            await land_all(sub)
+
+        server, client, local, remote = await serving_peers(handler)
+        try:
+            sub = local.open_sub()
+            assert await sub.call("1+1") == 2
+            remote_sub = await served
+            sub.stop()
+            await asyncio.wait_for(remote_sub.join(), 2)
+            assert remote_sub.eol.exception() is None
+            assert not remote.sub_peers
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
+
+
+def test_failed_close():
+    async def main():
+        served = asyncio.get_running_loop().create_future()
+
+        async def handler(sub: SubPeer):
+            served.set_result(sub)
+            await land_all(sub)
+
+        server, client, local, remote = await serving_peers(handler)
+        try:
+            sub = local.open_sub()
+            await sub.call("None")
+            remote_sub = await served
+            sub.eol.set_exception(RuntimeError("gone wrong"))
+            try:
+                await asyncio.wait_for(remote_sub.join(), 2)
+            except EdhPeerError as exc:
+                assert exc.details == "RuntimeError: gone wrong"
+            else:
+                assert False, "sub-peer failure not propagated"
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
+
+
+def test_unread_sub_peer_shed():
+    async def main():
+        async def handler(sub: SubPeer):
+            await asyncio.sleep(3600)  # never reads
+
+        server, client, local, remote = await serving_peers(handler)
+        try:
+            sub = local.open_sub()
+            payload = repr("x" * 1000)
+            try:
+                for _ in range(10000):
+                    await sub.p2c(DATA_CHAN, payload)
+                await asyncio.wait_for(sub.join(), 2)
+            except EdhPeerError as exc:
+                assert "not read in time" in str(exc)
+            else:
+                assert False, "unread sub-peer not shed"
+            # the parent is not held back
+            assert await asyncio.wait_for(local.call("6*7"), 2) == 42
+        finally:
+            await shutdown(server, client)
+
+    asyncio.run(main())
@@ -0,0 +1,42 @@
+"""
+Unix domain socket transport
+
+"""
+import asyncio
+import os
+
+from hastalk import *
+from hastalk.bench.peers import connected_peers
+
+
+def test_call_and_blob_round_trip(tmp_path):
+    sock_path = tmp_path / "peer.sock"
+
+    async def main():
+        server, client, local, remote = await connected_peers(f"unix:{sock_path!s}")
+        try:
+            assert await local.call("6*7") == 42
+            blob_sink = remote.ensure_channel("blob")
+
+            async def receive():
+                async for v in blob_sink.stream():
+                    if v is not None:
+                        return bytes(v)
+
+            receiving = asyncio.create_task(receive())
+            await asyncio.sleep(0)
+            blob = os.urandom(3 * 1024 * 1024)
+            await local.post_packet(Packet("blob:'blob'", blob), bulk=True)
+            assert await asyncio.wait_for(receiving, 2) == blob
+        finally:
+            client.stop()
+            server.stop()
+            await server.join()
+        # the socket file is cleaned up, once the listener closed after eol
+        for _ in range(100):
+            if not sock_path.exists():
+                break
+            await asyncio.sleep(0.02)
+        assert not sock_path.exists()
+
+    asyncio.run(main())